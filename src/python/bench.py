@@ -0,0 +1,348 @@
+"""
+麻将引擎性能基准。
+
+每一项都使用固定的随机种子，结果以 JSON 保存，并与 bench_baseline.json 比较，
+比基准慢超过容差的项目和基准中没有的项目会被列出，并以非零状态退出。
+新增的项目要用 --save-baseline --only 名称 补上基准。
+
+计时用的是进程的 CPU 时间 (time.process_time)，不计其他进程占用 CPU 的时间。
+每次计时前先运行一段固定的校准负载，比较时用 "每次操作的用时 / 校准负载的用时" 的中位数，
+机器整体变快或变慢 (换机器、共享虚拟机被限速) 不影响结果。
+每一项开始前清空所有进程级缓存 (包括拆解表)，结果与运行的顺序和 --only 选择的项目无关。
+
+容差按项目设置 (TOLERANCES)，单次操作很短或包含整局对局的项目波动更大，容差也更宽；
+--tolerance 统一覆盖。这个检查用来拦住明显的退化 (例如在热路径上逐次记录指标)，不管 10% 左右的小变化。
+修改了被测的代码路径后要用 --save-baseline 重新生成基准 (运行三遍取每项的中位数)，和代码一起提交。
+
+    python bench.py                    # 运行并与基准比较
+    python bench.py --save-baseline    # 在当前机器上重新生成基准 (运行三遍取中位数)
+    python bench.py --only can_hu_cold,full_game --output result.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from libs import Mahjong, MahjongReplay, MahjongSim
+from libs import MahjongCache
+from libs.MahjongCache import hu_cache
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+SUITED = [f'{n}{s}' for s in 'otw' for n in range(1, 10)]
+HONORS = ['e', 's', 'w', 'n', 'b', 'f', 'z']
+
+
+def _joker_hands(rng, count, size=16):
+    """含 2~3 张金、多数为同一花色的手牌，是胡牌判定最费时的情况"""
+    hands = []
+    for _ in range(count):
+        suit = rng.choice('otw')
+        pool = [f'{n}{suit}' for n in range(1, 10)] * 4 + SUITED * 2 + HONORS
+        hand = ['joker'] * rng.randint(2, 3)
+        while len(hand) < size:
+            tile = rng.choice(pool)
+            if hand.count(tile) < 4:
+                hand.append(tile)
+        hands.append(hand)
+    return hands
+
+
+def _calibration_work():
+    """固定的纯 Python 负载 (字典计数、排序、元组比较)，与引擎的热路径相近"""
+    counts = {}
+    for i in range(20000):
+        key = (i * 7919) % 97, i % 5
+        counts[key] = counts.get(key, 0) + 1
+    return sorted(counts.items())
+
+
+def _calibrate():
+    """校准负载的 CPU 时间 (秒)，取三次中最快的一次"""
+    best = float('inf')
+    for _ in range(3):
+        start = time.process_time()
+        _calibration_work()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def _measure(func, ops, repeat, min_time=0.05):
+    """
+    func 执行一轮 ops 次操作。第一轮用来预热 (填好本项用到的拆解表) 并决定每次计时运行几轮，
+    每次计时至少 min_time 秒 CPU 时间。返回 (每次操作用时的中位数 (微秒), 与校准负载用时之比的中位数)
+    """
+    start = time.process_time()
+    func()
+    number = max(1, int(min_time / max(time.process_time() - start, 1e-6)))
+    times = []
+    ratios = []
+    for _ in range(repeat):
+        calibration = _calibrate()
+        start = time.process_time()
+        for _ in range(number):
+            func()
+        elapsed = (time.process_time() - start) / (ops * number)
+        times.append(elapsed)
+        ratios.append(elapsed / calibration)
+    return statistics.median(times) * 1e6, statistics.median(ratios)
+
+
+def bench_can_hu_cold(repeat):
+    """关闭胡牌缓存，每张牌都重新计算听牌"""
+    rng = random.Random(1)
+    hands = _joker_hands(rng, 200)
+    tiles = [rng.choice(SUITED + HONORS) for _ in hands]
+    player = Mahjong.MahjongPlayer(0, 'bench')
+    game = Mahjong.MahjongServer(seed=1)
+
+    def run():
+        for hand, tile in zip(hands, tiles):
+            player.hands = hand
+            player.can_hu(tile, game.sort_rule, game.gamerule)
+
+    size = hu_cache.maxsize
+    hu_cache.configure(maxsize=0)
+    try:
+        return _measure(run, len(hands), repeat)
+    finally:
+        hu_cache.configure(maxsize=size)
+
+
+def bench_can_hu_warm(repeat):
+    """同一手牌反复询问不同的牌 (checkactions 的典型情况)"""
+    rng = random.Random(2)
+    hands = _joker_hands(rng, 50)
+    tiles = SUITED + HONORS
+    player = Mahjong.MahjongPlayer(0, 'bench')
+    game = Mahjong.MahjongServer(seed=2)
+
+    def run():
+        for hand in hands:
+            player.hands = hand
+            for tile in tiles:
+                player.can_hu(tile, game.sort_rule, game.gamerule)
+
+    return _measure(run, len(hands) * len(tiles), repeat)
+
+
+def bench_can_chow(repeat):
+    rng = random.Random(3)
+    hands = [rng.sample(SUITED * 4 + HONORS * 4, 16) for _ in range(100)]
+    tiles = SUITED + HONORS
+    players = []
+    for i, hand in enumerate(hands):
+        player = Mahjong.MahjongPlayer(i, 'bench')
+        player.hands = hand
+        players.append(player)
+    sort_rule = Mahjong.MahjongServer(seed=3).sort_rule
+
+    def run():
+        for player in players:
+            for tile in tiles:
+                player.can_chow(tile, sort_rule)
+
+    return _measure(run, len(players) * len(tiles), repeat)
+
+
+def _started_game(seed):
+    game = Mahjong.MahjongServer(seed=seed)
+    game.start()
+    game.new_tile()
+    return game
+
+
+def bench_checkactions(repeat):
+    """对一张打出的牌检查其余三家的吃碰杠胡"""
+    games = [_started_game(seed) for seed in range(20)]
+    tiles = SUITED + HONORS
+
+    def run():
+        for game in games:
+            for tile in tiles:
+                game.checkactions(tile)
+
+    return _measure(run, len(games) * len(tiles), repeat)
+
+
+def bench_shuffle_deal(repeat):
+    game = Mahjong.MahjongServer(seed=4)
+    game.build_tile_tables()
+    rng = random.Random(4)
+    dices = [rng.randint(2, 12) for _ in range(50)]
+
+    def run():
+        for dice in dices:
+            game.shuffle(dice)
+            game.deal()
+
+    return _measure(run, len(dices), repeat)
+
+
+def bench_getgamestate(repeat):
+    """一次广播所需的公共状态和四份私有状态，包括 JSON 序列化"""
+    games = [_started_game(seed) for seed in range(20)]
+
+    def run():
+        for game in games:
+            json.dumps(game.getgamestate())
+            for p in game.players:
+                json.dumps(game.getgamestate(playerid=p.id))
+
+    return _measure(run, len(games), repeat)
+
+
+def bench_full_game(repeat):
+    """随机策略打完整局 (引擎本身的开销，不含策略的向听数计算)"""
+    seeds = range(20)
+
+    def run():
+        for seed in seeds:
+            MahjongSim.play_game(seed, ('random',) * 4)
+
+    return _measure(run, len(seeds), repeat)
+
+
+def bench_replay(repeat):
+    """重放记录好的对局 (也可以换成线上保存的复现记录)"""
+    records = [MahjongSim.play_game(seed, ('random',) * 4, record=True)['replay'] for seed in range(20)]
+
+    def run():
+        for record in records:
+            MahjongReplay.replay(record, check=False)
+
+    return _measure(run, len(records), repeat)
+
+
+# 允许比基准慢的比例。单次操作不到 1 微秒的项目和整局对局 (内存分配、垃圾回收多) 波动更大
+TOLERANCES = {
+    'can_hu_cold': 0.3,
+    'can_hu_warm': 0.4,
+    'can_chow': 0.4,
+    'checkactions': 0.3,
+    'shuffle_deal': 0.3,
+    'getgamestate': 0.3,
+    'full_game': 0.4,
+    'replay': 0.4,
+}
+
+BENCHMARKS = {
+    'can_hu_cold': bench_can_hu_cold,
+    'can_hu_warm': bench_can_hu_warm,
+    'can_chow': bench_can_chow,
+    'checkactions': bench_checkactions,
+    'shuffle_deal': bench_shuffle_deal,
+    'getgamestate': bench_getgamestate,
+    'full_game': bench_full_game,
+    'replay': bench_replay,
+}
+
+
+def run_benchmarks(names, repeat):
+    results = {}
+    relative = {}
+    for name in names:
+        # 每项都从空的缓存和拆解表开始，不受前面运行过的项目影响
+        MahjongCache.clear_all()
+        gc.collect()
+        value, ratio = BENCHMARKS[name](repeat)
+        results[name] = round(value, 3)
+        relative[name] = float(f'{ratio:.4g}')  # 与校准负载之比，保留 4 位有效数字
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'us_per_op': results,
+        'relative': relative,
+    }
+
+
+def median_results(runs):
+    """多次 run_benchmarks 的结果，每项取中位数"""
+    merged = dict(runs[0])
+    for key in ('us_per_op', 'relative'):
+        merged[key] = {name: statistics.median(run[key][name] for run in runs) for name in runs[0][key]}
+    return merged
+
+
+def ratio(results, baseline, name):
+    """当前结果与基准之比，两边都有校准后的结果时用校准后的结果，否则用 us_per_op；没有基准时返回 None"""
+    for key in ('relative', 'us_per_op'):
+        base = baseline.get(key, {}).get(name)
+        value = results.get(key, {}).get(name)
+        if base and value is not None:
+            return value / base
+    return None
+
+
+def compare(results, baseline, tolerance=None):
+    """
+    返回比基准慢超过容差的项目 [(名称, 基准, 当前, 比值, 容差)]，基准和当前为 us_per_op。
+    tolerance 为 None 时按项目使用 TOLERANCES
+    """
+    regressions = []
+    for name, value in results['us_per_op'].items():
+        r = ratio(results, baseline, name)
+        limit = TOLERANCES.get(name, 0.3) if tolerance is None else tolerance
+        if r is not None and r > 1 + limit:
+            regressions.append((name, baseline.get('us_per_op', {}).get(name), value, r, limit))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="麻将引擎性能基准")
+    parser.add_argument('--only', default=None, help=f"只运行部分项目，逗号分隔: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=7, help="每项重复次数，取中位数")
+    parser.add_argument('--tolerance', type=float, default=None, help="允许比基准慢的比例，默认按项目使用 TOLERANCES (见文件开头的说明)")
+    parser.add_argument('--baseline', default=BASELINE, help="基准文件")
+    parser.add_argument('--save-baseline', action='store_true', help="运行三遍，把每项的中位数保存为基准")
+    parser.add_argument('--output', default=None, help="把本次结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的项目: {', '.join(unknown)}")
+
+    if args.save_baseline:
+        results = median_results([run_benchmarks(names, args.repeat) for _ in range(3)])
+    else:
+        results = run_benchmarks(names, args.repeat)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    for name, value in results['us_per_op'].items():
+        base = baseline.get('us_per_op', {}).get(name)
+        r = ratio(results, baseline, name)
+        shown = f"{r:6.2f}x" if r is not None else '      -'
+        print(f"{name:<14} {value:12.3f} us/op   基准 {base if base else '-':>10}   {shown}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+    if args.save_baseline:
+        for key in ('us_per_op', 'relative'):
+            baseline.setdefault(key, {}).update(results[key])
+        baseline.update({k: v for k, v in results.items() if k not in ('us_per_op', 'relative')})
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=4)
+        print(f"基准已保存到 {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    missing = [name for name in results['us_per_op'] if not baseline.get('us_per_op', {}).get(name)]
+    for name, base, value, r, limit in regressions:
+        print(f"性能退化: {name} {base:.3f} -> {value:.3f} us/op (校准后 {r:.2f}x，容差 {limit:.0%})")
+    if missing:
+        print(f"没有基准: {', '.join(missing)} (用 --save-baseline --only {','.join(missing)} 生成)")
+    if regressions or missing:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,9 @@ import json
 import sys
 import os
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+
+from libs import MahjongDelta
 
 # --- 配置和全局变量 (已修改) ---
 sio = socketio.Client()
@@ -23,6 +26,9 @@ last_refresh_time = time.time()
 current_user = {'name': '', 'server': '', 'connected': False, 'in_room': False, 'room_id': None, 'is_ready': False}
 current_room = {'name': 'Unknown', 'id': None, 'owner': 'Unknown', 'game': None, 'members': {}, 'messages': [], 'rules': {}, 'status': '', 'logs': []}
 room_list = []
+room_list_version = None
+room_list_filters = {}  # 请求房间列表 (get_rooms) 时的过滤条件，见 list 命令
+pending_join = None  # 被重定向到其他 worker 后，登录成功时要加入的房间
 should_exit = threading.Event()
 displayed_actions = []
 
@@ -300,12 +306,13 @@ def print_menu():
         config.list_items(config.config.get('name list',{}), "可用名称")
         config.list_items(config.config.get('server list',{}), "可用服务器")
     elif not current_user['in_room']:
-        print("  list - 刷新房间列表\n  create - 创建房间\n  join <房号> [密码] - 加入房间\n  disconnect - 断开连接\n  quit - 退出")
+        print("  list [waiting|playing|free|all] - 刷新房间列表，可以只看等待中/游戏中/有空位的房间\n  create - 创建房间\n  join <房号> [密码] - 加入房间\n  disconnect - 断开连接\n  quit - 退出")
     elif current_room.get('status') == 'playing':
         # --- 核心修改：根据有无待选操作，显示不同提示 ---
         if displayed_actions:
             print("  a <序号> - 执行一个操作 (例如: a 1 选择'过')")
         print("  d <序号> - 打出一张牌 (输入 'd' 打出新摸的牌)")
+        print("  hint - 出牌提示")
         print("  leave - 离开房间")
     else: # 等待或结束状态
         print("  chat <消息> - 发送聊天\n  ready - 切换准备状态\n  rules <JSON> - 修改规则(房主)\n  leave - 离开房间\n  quit - 退出")
@@ -320,8 +327,27 @@ def join_room_result(data):
         current_user.update({'in_room': True, 'room_id': data.get('id')})
         global current_game_state
         current_game_state = {'public': {}, 'private': {}} # 重置为初始结构
+    elif data.get('redirect'):
+        print(f"\n🔀 {data['message']}")
+        threading.Thread(target=follow_redirect, args=(data['redirect'],), daemon=True).start()
     else:
         print(f"\n❌ {data['message']}")
+
+def follow_redirect(redirect):
+    """房间在其他 worker 上: 断开后连接到那个 worker，重新登录并加入房间"""
+    global pending_join
+    url = redirect.get('url')
+    if not url:
+        parts = urlsplit(current_user['server'])
+        url = urlunsplit(parts._replace(netloc=f"{parts.hostname}:{redirect['port']}"))
+    pending_join = {'room_id': redirect['room_id'], 'ticket': redirect.get('ticket')}
+    sio.disconnect()
+    current_user['server'] = url
+    try:
+        sio.connect(url, transports=['websocket'])
+    except Exception as e:
+        pending_join = None
+        print(f"❌ 连接失败: {e}")
     
 @sio.event
 def game_initialized(data):
@@ -336,22 +362,51 @@ def game_initialized(data):
     print("\n" + "="*20 + f"\n      🎉 游戏开始！🎉\n  你的座位: 【{my_seat}】\n  本局金牌: 【{_replacements.get(data.get('golden_tile'), data.get('golden_tile'))}】\n" + "="*20)
     refresh_display()
 
+def apply_state_message(part, message):
+    """
+    把带版本号的状态消息应用到 public 或 private 部分。
+    快照直接替换；增量只能应用在它的 base 版本上，对不上时请求快照，返回是否已更新。
+    """
+    versions = current_game_state.setdefault('versions', {})
+    if 'state' in message:
+        state = message['state']
+    elif versions.get(part) == message['base']:
+        state = MahjongDelta.apply(current_game_state[part], message['delta'])
+    else:
+        sio.emit('sync_game_state', {})
+        return False
+    versions[part] = message['version']
+    current_game_state[part] = state
+    return True
+
 @sio.event
 def game_state_update(data):
-    """收到公共状态，完全替换 public 部分"""
-    current_game_state['public'] = data
-    current_room['status'] = data.get('status', current_room['status'])
+    """收到公共状态的快照或增量"""
+    if not apply_state_message('public', data):
+        return
+    current_room['status'] = current_game_state['public'].get('status', current_room['status'])
     refresh_display()
 
 @sio.event
 def private_state_update(data):
-    """收到私有状态，完全替换 private 部分"""
+    """收到私有状态的快照或增量"""
     # 同时保留从 game_initialized 获得的初始信息
-    data['my_id'] = current_game_state['private'].get('my_id')
-    data['golden_tile'] = current_game_state['private'].get('golden_tile')
-    current_game_state['private'] = data
+    my_id = current_game_state['private'].get('my_id')
+    golden_tile = current_game_state['private'].get('golden_tile')
+    if not apply_state_message('private', data):
+        return
+    current_game_state['private']['my_id'] = my_id
+    current_game_state['private']['golden_tile'] = golden_tile
     refresh_display()
 
+@sio.event
+def batch(data):
+    """房间把一次动作产生的多条消息合并成一帧发送，按顺序交给各自的处理函数"""
+    handlers = sio.handlers.get('/', {})
+    for event, payload in data['messages']:
+        if event in handlers:
+            handlers[event](payload)
+
 # --- 其他事件和函数 (无变化) ---
 @sio.event
 def connect():
@@ -371,18 +426,58 @@ def join_server_result(data):
     if data['success']:
         print(f"\n✅ {data['message']}")
         current_user['connected'] = True
-        global room_list
-        room_list = data.get('room_list', [])
+        set_room_list(data)
+        global pending_join
+        if pending_join:
+            sio.emit('join_room', pending_join)
+            pending_join = None
     else:
         print(f"\n❌ {data['message']}")
         sio.disconnect()
     refresh_display()
+def set_room_list_filters(words):
+    """list 命令的参数: waiting/playing/finished 按状态过滤，free 只看有空位的房间，all 取消过滤；没有参数时保持不变"""
+    if not words:
+        return
+    room_list_filters.clear()
+    for word in words:
+        if word in ('waiting', 'playing', 'finished'):
+            room_list_filters['status'] = word
+        elif word == 'free':
+            room_list_filters['free'] = True
+def set_room_list(data):
+    """收到完整的房间列表 (登录、离开房间、请求房间列表时)"""
+    global room_list, room_list_version
+    room_list = list(data.get('room_list', []))
+    room_list_version = data.get('version')
+
 @sio.event
 def room_list_update(data):
-    global room_list
-    room_list = data
+    if not data.get('success', True): return
+    set_room_list(data)
     if not current_user['in_room']: refresh_display()
 @sio.event
+def room_list_delta(data):
+    """大厅房间列表的增量，版本对不上时重新请求完整列表"""
+    global room_list_version
+    if room_list_version != data['base']:
+        sio.emit('get_rooms', room_list_filters)
+        return
+    rooms_by_id = {room['id']: room for room in room_list}
+    for change in data['changes']:
+        if change['op'] == 'remove':
+            rooms_by_id.pop(change['id'], None)
+        else:
+            rooms_by_id[change['id']] = change['room']
+    room_list[:] = rooms_by_id.values()
+    room_list_version = data['version']
+    if not current_user['in_room']: refresh_display()
+@sio.event
+def room_list_stale(data):
+    """带过滤条件请求过房间列表时，服务器只通知列表有变化，用同样的条件重新请求"""
+    if room_list_version is None or room_list_version < data['version']:
+        sio.emit('get_rooms', room_list_filters)
+@sio.event
 def create_room_result(data):
     if data['success']:
         print(f"\n✅ {data['message']}")
@@ -410,9 +505,19 @@ def game_action_result(data):
     msg_type = "✅" if data.get('success') else "❌"
     print(f"\n{msg_type} {data.get('message', '收到服务器响应')}")
 @sio.event
+def hint_result(data):
+    if not data.get('success'):
+        print(f"\n❌ {data.get('message', '无法获取提示')}")
+        return
+    print("\n💡 出牌提示:")
+    for option in data['options']:
+        useful = ''.join(_replacements.get(t, t) for t in option['useful'])
+        print(f"  打 {_replacements.get(option['tile'], option['tile'])}  向听 {option['shanten']}  有效牌 {len(option['useful'])} 种 {useful}")
+@sio.event
 def room_deleted(data):
     print(f"\n🏠 {data['message']}")
     current_user.update({'in_room': False, 'room_id': None, 'is_ready': False})
+    set_room_list(data)
     global current_room, current_game_state
     current_room = {'name': 'Unknown', 'id': None, 'owner': 'Unknown', 'game': None, 'members': {}, 'messages': [], 'rules': {}, 'status': '', 'logs': []}
     current_game_state = {'public': {}, 'private': {}}
@@ -492,7 +597,9 @@ def handle_command(command):
         return
 
     if not current_user['in_room']:
-        if cmd == 'list': sio.emit('request_room_list', {})
+        if cmd == 'list':
+            set_room_list_filters(parts[1:])
+            sio.emit('get_rooms', room_list_filters)
         elif cmd == 'create':
             room_name = input("请输入房间名: ").strip()
             if room_name: sio.emit('create_room', {'name': room_name, 'password': input("请输入房间密码 (可选): ").strip()})
@@ -543,8 +650,10 @@ def handle_command(command):
                     # 如果没有提供序号 (例如只输入 'd')，则设为 None
                     action_payload['tileindex'] = None
                 sio.emit('game_action', action_payload)
+            elif cmd in ('h', 'hint'):
+                sio.emit('get_hint', {})
             else:
-                print(f"❌ 游戏中未知命令: {cmd}。可用命令: a(操作), d(出牌), leave, chat。")
+                print(f"❌ 游戏中未知命令: {cmd}。可用命令: a(操作), d(出牌), h(提示), leave, chat。")
         
         else: # 房间处于等待或结束状态
             if cmd in ('ready', 'r'):
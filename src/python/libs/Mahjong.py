@@ -1,217 +1,252 @@
 import random
-from collections import Counter
-import logging
+from .MahjongTiles import DEFAULT_SORT_RULE, Wall, base_tiles, get_tileset
+from .MahjongTables import min_jokers, winning_tiles, shanten
+from .MahjongCache import hu_cache, shanten_cache
+from .MahjongMetrics import metrics, ENGINE_BUCKETS
+from .MahjongLog import EventLogger, ENGINE_TRACE
+
+# 每个动作都会多次执行的日志只在 ENGINE_TRACE 打开时记录 (见 MahjongLog)
+log = EventLogger('engine')
+
+# 只在每个动作的入口统计一次 (perform_discard 中的 checkactions)，can_hu 等内层调用每个动作要执行几十次，不单独计时
+engine_seconds = metrics.histogram('mahjong_engine_seconds', '每个动作中牌型判断的用时 (出牌后的 checkactions)', ('call',), ENGINE_BUCKETS)
+
+def cached_shanten(tileset, counts, three_golden=True, seven_pairs=False):
+    """MahjongTables.shanten 的缓存版本，返回 (向听数, 有效牌 id 的 frozenset)"""
+    key = (tileset, tuple(counts), three_golden, seven_pairs)
+    result = shanten_cache.get(key)
+    if result is None:
+        value, useful = shanten(tileset, counts, three_golden, seven_pairs)
+        result = (value, frozenset(useful))
+        shanten_cache.put(key, result)
+    return result
 
 # (MahjongPlayer 类和自定义异常基本不变，这里为了简洁省略，仅展示 MahjongServer 的变化)
 class NotAcceptTime(Exception): pass
 class AlreadyActed(Exception): pass
 
 class MahjongPlayer:
-    # ... (这个类的内容保持不变) ...
-    def __init__(self, id, name):
+    def __init__(self, id, name, tileset=None):
         """玩家实例拥有 id 和名字，以及手牌、锁牌、新牌、已经打出的牌，开始游戏后才使用这里的玩家实例"""
         self.id = id
         self.sid = None
         self.decorator = None # 未来会添加个性化支持
         self.name = name
-        self.hands = []  # 玩家手牌
+        self.tileset = tileset or get_tileset(DEFAULT_SORT_RULE)
+        self.counts = [0] * self.tileset.size  # 玩家手牌，按牌的 id 计数
+        self.hand_count = 0
+        self._hands_view = [] # 排好序的手牌，只在客户端需要时重新生成
+        self._waiting = None  # (规则开关, 听的牌 id 集合)，手牌变化时清空
         self.locked = []  # 已经碰杠吃的牌
         self.new = ''
         self.discarded = []  # 已经打出的牌
         self.actions = None
         self.active = False
 
+    @property
+    def hands(self):
+        """排好序的手牌列表 (只读视图)，修改手牌请使用 chow/pong/kong/discard 等方法"""
+        if self._hands_view is None:
+            self._hands_view = self.tileset.decode(self.counts)
+        return self._hands_view
+
+    @hands.setter
+    def hands(self, tiles):
+        self.counts = self.tileset.encode(tiles)
+        self.hand_count = len(tiles)
+        self._hands_view = None
+        self._waiting = None
+
+    def _add_tile(self, tile_id, n=1):
+        self.counts[tile_id] += n
+        self.hand_count += n
+        self._hands_view = None
+        self._waiting = None
+
+    def _remove_tile(self, tile_id, n=1):
+        self.counts[tile_id] -= n
+        self.hand_count -= n
+        self._hands_view = None
+        self._waiting = None
+
+    def _tile_at(self, tile_index):
+        """返回排好序的手牌中第 tile_index 张牌的 id"""
+        for tile_id, c in enumerate(self.counts):
+            if tile_index < c:
+                return tile_id
+            tile_index -= c
+        return None
+
     def can_chow(self, tile, sort_rules):  # tile is list or tuple
-        """判断能否吃牌, tile 是要吃的牌，sort_rules 由 MahjongServer 提供"""
-        if 'joker' in tile or tile[0] in 'eswnbfz': return []
-        possible_chows = []; tile_val = sort_rules.get(tile); tile_suit = tile[-1]
-        if tile_val is None: return []
-        # (t-2, t-1), t
-        c1 = next((t for t, v in sort_rules.items() if v == tile_val - 2 and t[-1] == tile_suit), None)
-        c2 = next((t for t, v in sort_rules.items() if v == tile_val - 1 and t[-1] == tile_suit), None)
-        if c1 in self.hands and c2 in self.hands: possible_chows.append(tuple(sorted([c1, c2], key=lambda t: sort_rules.get(t))))
-        # (t-1, t+1), t
-        c1 = next((t for t, v in sort_rules.items() if v == tile_val - 1 and t[-1] == tile_suit), None)
-        c2 = next((t for t, v in sort_rules.items() if v == tile_val + 1 and t[-1] == tile_suit), None)
-        if c1 in self.hands and c2 in self.hands: possible_chows.append(tuple(sorted([c1, c2], key=lambda t: sort_rules.get(t))))
-        # t, (t+1, t+2)
-        c1 = next((t for t, v in sort_rules.items() if v == tile_val + 1 and t[-1] == tile_suit), None)
-        c2 = next((t for t, v in sort_rules.items() if v == tile_val + 2 and t[-1] == tile_suit), None)
-        if c1 in self.hands and c2 in self.hands: possible_chows.append(tuple(sorted([c1, c2], key=lambda t: sort_rules.get(t))))
-        logging.info(f"Player {self.name} can chow with tile {tile}: {possible_chows}") # 仅在服务端可见，不会广播给客户端
-        return list(set(possible_chows))
-    
+        """判断能否吃牌, tile 是要吃的牌。邻牌查 TileSet 预先算好的表，sort_rules 仅为兼容旧调用保留"""
+        tile_id = self.tileset.ids.get(tile)
+        if tile_id is None: return []
+        names = self.tileset.names; counts = self.counts
+        # (t-2, t-1), (t-1, t+1), (t+1, t+2)
+        possible_chows = [(names[c1], names[c2]) for c1, c2 in self.tileset.chow_pairs[tile_id] if counts[c1] and counts[c2]]
+        if ENGINE_TRACE:
+            log.debug('can_chow', player=self.name, tile=tile, chows=possible_chows)
+        return possible_chows
+
     def can_hu(self, tile=None, sort_rules=None, gamerule=None):
-        """tile 为其他人打出的牌或者新摸的牌, 检查玩家是否可以胡牌"""
-        hands = self.hands.copy()
+        """tile 为其他人打出的牌或者新摸的牌, 检查玩家是否可以胡牌。有 tile 时只需查听牌集合"""
         if tile:
-            hands.append(tile)  # 将要胡的牌加入手牌
-        counts = Counter(hands)
-        joker_count = counts.pop('joker', 0)
-
-        if gamerule.get('three golden win', True) and joker_count >= 3:
-            logging.info(f"Player {self.name} can hu with three jokers")
-            return True
-        if gamerule.get('allow seven pairs', False) and self.can_seven_pairs(counts, joker_count):
-            logging.info(f"Player {self.name} can hu with seven pairs")
-            return True
-         # 规则3: 标准胡牌 (n * ABC/AAA + DD)
-        # 找出所有可能的对子（将牌）
-        possible_pairs = [t for t, c in counts.items() if c >= 2]
-        # 如果牌不够凑成对子，可以用金来凑
-        if joker_count > 0:
-            possible_pairs.extend([t for t, c in counts.items() if c == 1])
-        # 甚至可以用两张金自成一对
-        if joker_count >= 2:
-            possible_pairs.append('joker_pair')
-
-        # 遍历每一种可能的对子
-        for pair_tile in set(possible_pairs):
-            temp_counts = counts.copy()
-            temp_joker_count = joker_count
-            
-            if pair_tile == 'joker_pair':
-                temp_joker_count -= 2
-            elif temp_counts[pair_tile] == 1:
-                temp_counts.pop(pair_tile)
-                temp_joker_count -= 1
-            else:
-                temp_counts[pair_tile] -= 2
-                if temp_counts[pair_tile] == 0:
-                    temp_counts.pop(pair_tile)
-            
-            # 检查剩下的牌能否组成顺子或刻子
-            if self._can_form_melds(temp_counts, temp_joker_count, sort_rules):
-                logging.info(f"Player {self.name} can hu with standard melds.")
+            tile_id = self.tileset.ids.get(tile)
+            if tile_id is None: return False
+            if tile_id in self.waiting_tiles(gamerule):
+                if ENGINE_TRACE:
+                    log.debug('can_hu', player=self.name, tile=tile)
                 return True
+            return False
+        counts = self.counts.copy()
+        three_golden = gamerule.get('three golden win', True)
+        seven_pairs = gamerule.get('allow seven pairs', False)
+        # 相同的 (手牌计数, 规则开关) 在所有房间之间共用判定结果
+        key = (self.tileset, tuple(counts), three_golden, seven_pairs)
+        reason = hu_cache.get(key)
+        if reason is None:
+            reason = self._hu_reason(counts, three_golden, seven_pairs)
+            hu_cache.put(key, reason)
+        if reason:
+            if ENGINE_TRACE:
+                log.debug('can_hu', player=self.name, reason=reason)
+            return True
         return False
-    def _can_form_melds(self, counts, joker_count, sort_rules):
-        """递归辅助函数，检查手牌能否组成顺子或刻子"""
-        if not counts:
-            return True # 所有牌都已组成面子
-
-        # 从最小的牌开始尝试
-        tile = min(counts.keys(), key=lambda t: sort_rules.get(t, 99))
-        
-        # 尝试组成刻子 (AAA)
-        if counts[tile] >= 3:
-            new_counts = counts.copy()
-            new_counts[tile] -= 3
-            if new_counts[tile] == 0:
-                del new_counts[tile]
-            if self._can_form_melds(new_counts, joker_count, sort_rules):
-                return True
-        # 尝试用金补刻子
-        if counts[tile] == 2 and joker_count >= 1:
-            new_counts = counts.copy()
-            del new_counts[tile]
-            if self._can_form_melds(new_counts, joker_count - 1, sort_rules):
-                return True
-        if counts[tile] == 1 and joker_count >= 2:
-            new_counts = counts.copy()
-            del new_counts[tile]
-            if self._can_form_melds(new_counts, joker_count - 2, sort_rules):
-                return True
 
-        # 尝试组成顺子 (ABC)，仅对万、条、筒有效
-        tile_val = sort_rules.get(tile)
-        if tile_val and tile[0] not in 'eswnbfzjapoc':  # 排除风牌和花牌
-            tile_suit = tile[-1]
-            c2_val = tile_val + 1
-            c3_val = tile_val + 2
-            c2 = next((t for t, v in sort_rules.items() if v == c2_val and t[-1] == tile_suit), None)
-            c3 = next((t for t, v in sort_rules.items() if v == c3_val and t[-1] == tile_suit), None)
-
-            if c2 and c3:
-                # 尝试不同的组合方式，优先使用手上的牌
-                # 1. 手上有 c2, c3
-                if c2 in counts and c3 in counts:
-                    new_counts = counts.copy()
-                    new_counts[tile] -= 1; new_counts[c2] -= 1; new_counts[c3] -= 1
-                    # 清理数量为0的牌
-                    new_counts = {k: v for k, v in new_counts.items() if v > 0}
-                    if self._can_form_melds(new_counts, joker_count, sort_rules):
-                        return True
-                # 2. 手上有 c2, 缺 c3 (用金补)
-                if c2 in counts and c3 not in counts and joker_count >= 1:
-                    new_counts = counts.copy()
-                    new_counts[tile] -= 1; new_counts[c2] -= 1
-                    new_counts = {k: v for k, v in new_counts.items() if v > 0}
-                    if self._can_form_melds(new_counts, joker_count - 1, sort_rules):
-                        return True
-                # 3. 手上有 c3, 缺 c2 (用金补)
-                if c3 in counts and c2 not in counts and joker_count >= 1:
-                    new_counts = counts.copy()
-                    new_counts[tile] -= 1; new_counts[c3] -= 1
-                    new_counts = {k: v for k, v in new_counts.items() if v > 0}
-                    if self._can_form_melds(new_counts, joker_count - 1, sort_rules):
-                        return True
-                # 4. 缺 c2, c3 (用两金补)
-                if c2 not in counts and c3 not in counts and joker_count >= 2:
-                    new_counts = counts.copy()
-                    new_counts[tile] -= 1
-                    new_counts = {k: v for k, v in new_counts.items() if v > 0}
-                    if self._can_form_melds(new_counts, joker_count - 2, sort_rules):
-                        return True
-
-        return False # 如果所有组合都失败 
+    def waiting_tiles(self, gamerule):
+        """
+        返回当前手牌 (不含 self.new) 再加哪一张就能胡，结果是牌 id 的集合。
+        只在手牌变化 (出牌、吃、碰、杠) 后的第一次查询时重新计算，相同的手牌在所有房间之间共用结果。
+        """
+        flags = (gamerule.get('three golden win', True), gamerule.get('allow seven pairs', False))
+        if self._waiting is None or self._waiting[0] != flags:
+            key = ('waiting', self.tileset, tuple(self.counts)) + flags
+            waits = hu_cache.get(key)
+            if waits is None:
+                waits = self._compute_waiting(*flags)
+                hu_cache.put(key, waits)
+            self._waiting = (flags, waits)
+        return self._waiting[1]
+
+    def _compute_waiting(self, three_golden, seven_pairs):
+        counts = self.counts.copy()
+        joker = self.tileset.joker
+        joker_count = 0
+        if joker is not None:
+            joker_count = counts[joker]
+            counts[joker] = 0
+        if three_golden and joker_count >= 3:
+            return frozenset(range(self.tileset.size))  # 已经有三金，摸什么都能胡
+        waits = winning_tiles(self.tileset, counts, joker_count)
+        if three_golden and joker is not None and joker_count == 2:
+            waits.add(joker)
+        if seven_pairs:
+            holes = sum(c % 2 for c in counts)
+            for tile_id, c in enumerate(counts):
+                if tile_id == joker:
+                    if self.can_seven_pairs(counts, joker_count + 1): waits.add(tile_id)
+                    continue
+                new_holes = holes - 1 if c % 2 else holes + 1
+                if joker_count >= new_holes and (joker_count - new_holes) % 2 == 0:
+                    waits.add(tile_id)
+        return frozenset(waits)
+
+    def shanten(self, gamerule, tile=None, exclude=()):
+        """
+        返回 (向听数, 有效牌列表)，计算的是手牌加上 self.new (以及 tile)。-1 表示已经胡牌，0 表示听牌。
+        有效牌是摸到后能让向听数减少的牌；手上已经有新牌时，是打出最合适的一张之后的有效牌。
+        规则中去掉的牌、exclude 中的牌 (例如已经全部变成金的金牌) 和已经有四张的牌不会出现在有效牌中。
+        """
+        counts = self.counts.copy()
+        for t in (self.new, tile):
+            if t:
+                counts[self.tileset.ids[t]] += 1
+        value, useful = cached_shanten(self.tileset, counts, gamerule.get('three golden win', True), gamerule.get('allow seven pairs', False))
+        names = self.tileset.names
+        removed = [t for t in gamerule.get('items to remove', []) if t != 'joker'] + list(exclude)
+        if not gamerule.get('golden tile', True):
+            removed.append('joker')
+        return value, [names[i] for i in sorted(useful) if names[i] not in removed and counts[i] < 4]
+
+    def _hu_reason(self, counts, three_golden, seven_pairs):
+        """返回胡牌的牌型，不能胡时返回空字符串。counts 为加入了要胡的牌之后的计数数组 (会被修改)"""
+        joker = self.tileset.joker
+        joker_count = 0
+        if joker is not None:
+            joker_count = counts[joker]
+            counts[joker] = 0
+
+        if three_golden and joker_count >= 3:
+            return 'three jokers'
+        if seven_pairs and self.can_seven_pairs(counts, joker_count):
+            return 'seven pairs'
+        # 规则3: 标准胡牌 (n * ABC/AAA + DD)，按花色查拆解表，算出凑成面子和将最少需要几张金
+        if min_jokers(self.tileset, counts) <= joker_count:
+            return 'standard melds'
+        return ''
 
     def can_kong(self, tile):
         """检查玩家是否由三张相同牌"""
         if tile == 'joker': return False
-        return self.hands.count(tile) == 3
+        tile_id = self.tileset.ids.get(tile)
+        return tile_id is not None and self.counts[tile_id] == 3
     def _can_kong(self):
         """检查玩家是否有四张相同牌"""
-        counts = Counter(self.hands)
-        for tile, count in counts.items():
-            if tile != 'joker' and count == 4:
-                return tile
+        for tile_id, count in enumerate(self.counts):
+            if tile_id != self.tileset.joker and count == 4:
+                return self.tileset.names[tile_id]
         return None
     def can_pong(self, tile):
         """检查玩家是否有两张相同牌"""
         if tile == 'joker': return False
-        return self.hands.count(tile) >= 2
+        tile_id = self.tileset.ids.get(tile)
+        return tile_id is not None and self.counts[tile_id] >= 2
     def can_seven_pairs(self, counts, joker_count):
         """辅助函数，手牌数不为 13 时，服务端自动设定 allow seven pairs 为 False"""
-        """检查金牌能否填补七对的空缺"""
-        holes = sum(count % 2 for count in counts.values())
+        """检查金牌能否填补七对的空缺, counts 为计数数组 (不含金)"""
+        holes = sum(count % 2 for count in counts)
         return joker_count >= holes and (joker_count - holes) % 2 == 0
     def drawtile(self,tile = None):     # 摸牌
         if tile and self.new == '':
             """设置新牌, tile 是新摸的牌"""
             self.new = tile
-            logging.info(f"Player {self.name} has a new tile: {tile}")
-        return self.new    
+            if ENGINE_TRACE:
+                log.debug('draw', player=self.name, tile=tile)
+        return self.new
 
     def integrate_new_tile(self):
         """将新摸的牌 self.new 正式放入手牌，并清空 self.new"""
         if self.new:
-            self.hands.append(self.new)
+            self._add_tile(self.tileset.ids[self.new])
             self.new = ''
 
     def discard(self, tile_index = None):
         """
         出牌。如果指定 tile_index，则从手牌打出；否则打出刚摸的牌 self.new。
+        tile_index 是排好序的手牌 (self.hands) 中的位置。
         """
-        if tile_index is not None and tile_index in range(len(self.hands)):
+        if tile_index is not None and tile_index in range(self.hand_count):
             # 从手牌中打出一张
-            tile = self.hands.pop(tile_index)
+            tile_id = self._tile_at(tile_index)
+            self._remove_tile(tile_id)
+            tile = self.tileset.names[tile_id]
         elif self.new:
             # 打出新摸的牌
             tile = self.new
             self.new = ''
-        else:
+        elif self.hand_count:
             # 索引无效或无新牌，为防止崩溃，打出最后一张牌
-            logging.warning(f"Invalid discard index or no new tile, discarding last tile.")
-            tile = self.hands.pop(-1)
+            log.warning('invalid_discard', player=self.name, index=tile_index)
+            tile_id = self._tile_at(self.hand_count - 1)
+            self._remove_tile(tile_id)
+            tile = self.tileset.names[tile_id]
+        else:
+            raise ValueError("没有可以打出的牌")
 
         self.discarded.append(tile)
-        logging.info(f"Player {self.name} discarded tile: {tile}")
+        if ENGINE_TRACE:
+            log.debug('discard', player=self.name, tile=tile)
         return tile
-    
-    def sort_hands(self, sort_rule):
-        """对手牌进行排序, 规则在 MahjongServer 中定义"""
-        self.hands.sort(key=lambda x: sort_rule.get(x, -1))
 
     def chow(self, tile, chow_pair, sort_rule):
         """吃牌, tile 是要吃的牌，chow_pair 是吃的牌对"""
@@ -219,23 +254,21 @@ class MahjongPlayer:
         for meld in melds:
             self.locked.append(meld)
         for t in chow_pair:
-            self.hands.remove(t)
+            self._remove_tile(self.tileset.ids[t])
     def kong(self, tile):
         """杠牌, tile 是要杠的牌"""
         for _ in range(4):
             self.locked.append(tile)
         # 杠牌后需要补一张牌，这个逻辑由服务端处理
-        for _ in range(3):
-            self.hands.remove(tile)
+        self._remove_tile(self.tileset.ids[tile], 3)
     def dark_kong(self, tile=None):
         """暗杠不会记录到 locked 上"""
-        if self.new and self.hands.count(self.new) == 3: # 摸到的新牌能杠
-            for _ in range(3):
-                self.hands.remove(self.new)
+        ids = self.tileset.ids
+        if self.new and self.counts[ids[self.new]] == 3: # 摸到的新牌能杠
+            self._remove_tile(ids[self.new], 3)
             self.new = ''
-        elif self.hands.count(tile) == 4: # 手上有四张能杠
-            for _ in range(4):
-                self.hands.remove(tile)
+        elif tile in ids and self.counts[ids[tile]] == 4: # 手上有四张能杠
+            self._remove_tile(ids[tile], 4)
 
 
 
@@ -243,33 +276,35 @@ class MahjongPlayer:
         """碰牌, tile 是要碰的牌"""
         for _ in range(3):
             self.locked.append(tile)
-        for _ in range(2):
-            self.hands.remove(tile)      
+        self._remove_tile(self.tileset.ids[tile], 2)
 
 
 class MahjongServer:
-    def __init__(self, playersnames=None):
+    def __init__(self, playersnames=None, seed=None):
+        """
+        :param seed: 本局的随机种子，洗牌和掷骰子都只使用由它生成的 self.rng。
+                     同一个种子加上同一份动作记录 (replay_log) 可以完整复现一局，见 MahjongReplay。
+        """
         # ... (原有属性不变) ...
-        self.players = [MahjongPlayer(i, name) for i, name in enumerate(playersnames or ['Player1', 'Player2', 'Player3', 'Player4'])]
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.dice = None
+        self.replay_log = []  # 只追加的动作记录，每项为 (代码, 玩家 id, ...)，代码含义见 MahjongReplay
         self.playerindex = 0
         # 新增: 存储当前回合的临时状态
         self.pending_claims = {}
         self.submitted_claims = {}
+        self.passed_claims = set()  # 本轮选择「过」的玩家
         self.last_discarded_tile = None
         self.status = 'waiting' # waiting, playing, finished
         self.winner_id = None   # 记录胜利者ID
         self.winner_hands = []  # 胜利者的手牌
         self.acceptspecialactions = False
         self.golden_tile = None  # 金牌
-        self.sort_rule = {
-            '1o': 2, '2o': 3, '3o': 4, '4o': 5, '5o': 6, '6o': 7, '7o': 8, '8o': 9, '9o': 10,
-            '1t': 12, '2t': 13, '3t': 14, '4t': 15, '5t': 16, '6t': 17, '7t': 18, '8t': 19, '9t': 20,
-            '1w': 22, '2w': 23, '3w': 24, '4w': 25, '5w': 26, '6w': 27, '7w': 28, '8w': 29, '9w': 30,
-            'e': 32, 's': 34, 'w': 36, 'n': 38, 'b': 42, 'f': 44, 'z': 46, 'joker': 0,
-            'spring': 50, 'summer': 53, 'autumn': 56, 'winter': 59,
-            'plum': 62, 'orchid': 65, 'bamboo': 68, 'chrysanthemum': 71
-            }
-        self.wall = []  # 剩余牌堆
+        self.sort_rule = dict(DEFAULT_SORT_RULE)
+        self.tileset = get_tileset(self.sort_rule)  # 牌的整数编码和邻牌表，玩家手牌以计数数组保存
+        self.players = [MahjongPlayer(i, name, self.tileset) for i, name in enumerate(playersnames or ['Player1', 'Player2', 'Player3', 'Player4'])]
+        self.wall = Wall()  # 剩余牌堆
         self.gamerule = {
             "rules": "classic",
             "max players": 4,
@@ -287,15 +322,18 @@ class MahjongServer:
         """
         获取游戏状态的核心方法 (已修改)
         现在返回一个更结构化的 "players" 列表
+        会被原地修改的列表 (副露、弃牌、可执行操作) 返回拷贝，返回的状态可以直接交给 StateStream 保存；
+        手牌视图只会整体替换，不拷贝。
         """
         if playerid is not None:
+            player = self.players[playerid]
             return {
-                "hands": self.players[playerid].hands,
-                "locked": self.players[playerid].locked,
-                "new": self.players[playerid].new,
-                "discarded": self.players[playerid].discarded,
-                "id":self.players[playerid].id,
-                "actions": self.players[playerid].actions,
+                "hands": player.hands,
+                "locked": player.locked.copy(),
+                "new": player.new,
+                "discarded": player.discarded.copy(),
+                "id": player.id,
+                "actions": dict(player.actions) if player.actions else player.actions,
                 "active": self.players[playerid].active # 由客户端计算是否 Active
             }
         else:
@@ -308,45 +346,68 @@ class MahjongServer:
                         "hasnew": bool(p.new),
                         "id": p.id,
                         "name": p.name,
-                        "hand_count": len(p.hands),
-                        "locked": p.locked,
-                        "discarded": p.discarded
+                        "hand_count": p.hand_count,
+                        "locked": p.locked.copy(),
+                        "discarded": p.discarded.copy()
                     } for p in self.players
                 ],
             }
     def getgamerule(self):
         return self.gamerule
+    def export_replay(self):
+        """导出复现本局所需的全部信息 (可直接 JSON 序列化)，由 MahjongReplay.replay 重放"""
+        record = {
+            'version': 1,
+            'seed': self.seed,
+            'dice': self.dice,
+            'players': [p.name for p in self.players],
+            'gamerule': self.gamerule,
+            'events': [list(event) for event in self.replay_log],
+        }
+        if self.sort_rule != DEFAULT_SORT_RULE:
+            record['sort_rule'] = self.sort_rule
+        return record
+    def shanten(self, player_id):
+        """玩家当前手牌 (含新摸的牌) 的向听数和有效牌，供机器人、提示和统计使用"""
+        exclude = (self.golden_tile,) if self.golden_tile and self.gamerule.get('golden tile', True) else ()
+        return self.players[player_id].shanten(self.gamerule, exclude=exclude)
+    def hint_args(self, player_id):
+        """discard_hint 的参数，都是可以 pickle 的简单数据，可以交给进程池计算"""
+        player = self.players[player_id]
+        exclude = (self.golden_tile,) if self.golden_tile and self.gamerule.get('golden tile', True) else ()
+        return (self.sort_rule, list(player.hands), player.new, self.gamerule, exclude)
+    def build_tile_tables(self):
+        """根据当前 sort_rule 取得牌的编码和邻牌表 (同一套 sort_rule 全进程只构建一次)，变体修改 sort_rule 后在开局时生效"""
+        self.tileset = get_tileset(self.sort_rule)
+        for player in self.players:
+            player.tileset = self.tileset
     def shuffle(self, dice = 2):
-        """洗牌"""
-        tileswall = [item for item in self.sort_rule if item not in self.gamerule.get("items to remove", [])]
-        logging.info(f"Tiles removed: {self.gamerule['items to remove']}")  
-        
-        self.wall = [name for name in tileswall for _ in range(4)]
-        random.shuffle(self.wall)
-        jokertile = self.wall[-dice]
+        """洗牌。一副牌按规则缓存，每局只需复制后打乱"""
+        tiles = list(base_tiles(self.sort_rule, self.gamerule.get("items to remove", [])))
+        self.rng.shuffle(tiles)
+        jokertile = tiles[-dice]
         self.golden_tile = jokertile
         if self.gamerule.get("golden tile", True):
-            logging.info(f"{jokertile} is the golden tile")
-            self.wall = ['joker' if tile == jokertile else tile for tile in self.wall]
+            tiles = ['joker' if tile == jokertile else tile for tile in tiles]
         if self.gamerule['golden tile number'] == 3:
-            self.wall.pop(-dice)
-        logging.info(f"完成洗牌")
+            tiles.pop(-dice)
+        self.wall = Wall(tiles)
+        log.info('shuffle', removed=self.gamerule['items to remove'], golden=jokertile if self.gamerule.get("golden tile", True) else None)
 
     def deal(self):
         """发牌"""
         tilesnumber = self.gamerule['tiles number']
         for player in self.players:
-            player.hands = self.wall[:tilesnumber]
-            self.wall = self.wall[tilesnumber:]
-            player.sort_hands(self.sort_rule)
-            logging.info(f"Player {player.name} dealt hands: {player.hands}")  
-    def new_tile(self):
-        """摸牌"""
-        if not self.wall:
-            logging.warning("No more tiles in the wall")
+            player.hands = self.wall.deal(tilesnumber)
+            log.debug('deal', player=player.name, hands=player.hands)
+    def new_tile(self, from_back=False):
+        """摸牌。from_back 为 True 时从牌墙后面摸 (杠后补牌)"""
+        tile = self.wall.draw_back() if from_back else self.wall.draw()
+        if tile is None:
+            log.info('wall_empty')
             return None
-        tile = self.wall.pop(0)
         self.players[self.playerindex].drawtile(tile)
+        self.replay_log.append(('B' if from_back else 'D', self.playerindex, tile))
         return tile
     def turntonext(self, actor_id=None): # 提供 id 则以 id 为准，不提供则按顺序推进
         """轮转到下一个玩家"""
@@ -354,7 +415,8 @@ class MahjongServer:
             self.playerindex = actor_id
         else:
             self.playerindex = (self.playerindex + 1) % len(self.players)
-        logging.info(f"Turn is now on player index: {self.playerindex}")
+        if ENGINE_TRACE:
+            log.debug('turn', player=self.playerindex)
 
 
     def checkactions(self, tile):
@@ -418,55 +480,48 @@ class MahjongServer:
 
         # 更新服务端的 pending_claims，只保留有玩家可以执行的动作类型
         self.pending_claims = {k: v for k, v in server_actions.items() if v}
+        self.passed_claims = set()
 
-        if checkpoint:
-            logging.info(f"Actions available for tile {tile}: {self.pending_claims}")
-            # 额外打印出每个玩家的具体可行操作
-            for p in self.players:
-                if p.actions:
-                    logging.info(f"Player {p.name} (ID: {p.id}) can perform: {p.actions}")
-            return True        
-        else:
-            logging.info(f"No actions available for tile {tile}")
-            return False
+        if ENGINE_TRACE:
+            log.debug('checkactions', tile=tile, claims=self.pending_claims, actions={p.name: p.actions for p in self.players if p.actions})
+        return checkpoint
 
     def endgame(self, winner_id=None, reason="unknown", win_tile=None):
         if self.status == 'finished':
-            logging.warning("游戏已经结束。")
+            log.warning('endgame_twice')
             return
         
         self.status = 'finished'
         self.winner_id = winner_id
+        self.replay_log.append(('E', winner_id, reason))
         
 
         if reason == 'hu' and winner_id is not None and win_tile is not None:
             winner_name = self.players[winner_id].name
             self.winner_hands = self.players[winner_id].hands.copy() + [win_tile]
             self.winner_hands.sort(key=lambda x: self.sort_rule.get(x, -1))
-            logging.info(f"🎉 游戏结束！玩家 {winner_name} 点炮胡牌，胡的牌是: {win_tile}")
         elif reason == 'self_drawn_hu' and winner_id is not None:
             winner_name = self.players[winner_id].name
-            logging.info(f"🎉 游戏结束！玩家 {winner_name} 自摸胡牌！")
             self.winner_hands = self.players[winner_id].hands.copy() + [self.players[winner_id].new]
             self.winner_hands.sort(key=lambda x: self.sort_rule.get(x, -1))
-        elif reason == 'draw':
-            logging.info("牌墙已空，游戏荒庄。")
-        else:
-            logging.info(f"游戏因 '{reason}' 结束")
-        
+        log.info('endgame', reason=reason, winner=self.players[winner_id].name if winner_id is not None else None, tile=win_tile)
         return self.getgamestate()
 
-    def start(self, dice=2):
-        """开始游戏"""
+    def start(self, dice=None):
+        """开始游戏。不指定 dice 时用本局的 rng 掷骰子 (指定时也照常掷一次，保证后面洗牌的随机序列不变)"""
         if self.status == 'playing':
-            logging.warning("Game already started")
+            log.warning('start_twice')
             return None
+        rolled = self.rng.randint(2, 12)
+        self.dice = dice = rolled if dice is None else dice
+        self.replay_log = []
+        self.build_tile_tables()
         self.shuffle(dice)
         self.deal()
         # 庄家是ID 0的玩家
         self.playerindex = 0
         self.status = 'playing'
-        logging.info("Game started")
+        log.info('start', players=[p.name for p in self.players], seed=self.seed, dice=dice)
         return self.getgamestate()
 
 
@@ -484,10 +539,11 @@ class MahjongServer:
         discarded_tile = player.discard(tile_index)
         if player.new:
             player.integrate_new_tile()
-        player.sort_hands(self.sort_rule)
         
         self.last_discarded_tile = discarded_tile
-        isPending =  self.checkactions(discarded_tile)
+        self.replay_log.append(('X', player_id, discarded_tile))
+        with engine_seconds.time('checkactions'):
+            isPending = self.checkactions(discarded_tile)
         
 
         return {
@@ -498,14 +554,14 @@ class MahjongServer:
     def submit_claim(self, player_id, data):
         """
         接收并验证玩家的宣告动作（吃碰杠胡）。
-        :raises: NotAcceptTime, AlreadyActed, ValueError
+        :return: 宣告的结果是否已经确定 (见 claims_decided)，无效的宣告返回 None。
         """
         action_type = data['action']
         if not self.pending_claims or action_type not in self.pending_claims or player_id not in self.pending_claims[action_type]:
-            logging.info(f"Player {self.players[player_id].name} cannot perform action '{action_type}' now.")
+            log.debug('claim_rejected', player=self.players[player_id].name, action=action_type)
             return
         if player_id in self.submitted_claims:
-            logging.info(f"Player {self.players[player_id].name} has already submitted an action this round.")
+            log.debug('claim_repeated', player=self.players[player_id].name, action=action_type)
             return
 
         claim_data = action_type
@@ -513,12 +569,43 @@ class MahjongServer:
             chow_pair = tuple(sorted(data.get('tiles', [])))
             possible_chows = self.players[player_id].can_chow(self.last_discarded_tile, self.sort_rule)
             if chow_pair not in possible_chows:
-                print(f"Invalid chow pair {chow_pair} for player {player_id}, possible: {possible_chows}")
+                log.warning('invalid_chow', player=self.players[player_id].name, tiles=chow_pair, possible=possible_chows)
                 return
             claim_data = ('chow', chow_pair)
 
         self.submitted_claims[player_id] = claim_data
-        logging.info(f"玩家 {self.players[player_id].name} 提交了操作: {claim_data}")
+        self.replay_log.append(('C', player_id, action_type) + ((list(claim_data[1]),) if action_type == 'chow' else ()))
+        log.debug('claim', player=self.players[player_id].name, claim=claim_data)
+        return self.claims_decided()
+
+    def pass_claim(self, player_id):
+        """
+        玩家放弃本轮的宣告。
+        :return: 宣告的结果是否已经确定，不在宣告阶段或已经表态过时返回 None。
+        """
+        if player_id in self.submitted_claims or player_id in self.passed_claims:
+            return None
+        if not any(player_id in seats for seats in self.pending_claims.values()):
+            return None
+        self.passed_claims.add(player_id)
+        log.debug('pass', player=self.players[player_id].name)
+        return self.claims_decided()
+
+    def claims_decided(self):
+        """
+        宣告的结果是否已经不会再改变: 还没表态的玩家能做的动作，优先级都不高于已经提交的最优宣告。
+        所有有资格的玩家都表态后一定成立，此时不必再等待，可以直接调用 process_submitted_claims。
+        """
+        best = 10
+        for pid, action_data in self.submitted_claims.items():
+            action_type = action_data[0] if isinstance(action_data, tuple) else action_data
+            best = min(best, self.pending_claims[action_type][pid])
+        for seats in self.pending_claims.values():
+            for pid, priority in seats.items():
+                # 优先级相同时先提交的生效，所以只有更高的优先级 (数值更小) 才可能改变结果
+                if priority < best and pid not in self.submitted_claims and pid not in self.passed_claims:
+                    return False
+        return True
 
     def process_submitted_claims(self):
         """
@@ -542,7 +629,9 @@ class MahjongServer:
         # 清空本轮的临时状态
         self.pending_claims = {}
         self.submitted_claims = {}
+        self.passed_claims = set()
         info = None
+        self.replay_log.append(('R', actor_id))
 
         if actor_id is not None:
             action_type = best_action[0] if isinstance(best_action, tuple) else best_action
@@ -552,7 +641,7 @@ class MahjongServer:
             discarding_player = self.players[self.playerindex]
             discarded_tile = discarding_player.discarded.pop(-1)
             
-            logging.info(f"Player {actor.name} performs action '{action_type}' on tile {discarded_tile}")
+            log.info('claim_resolved', player=actor.name, action=action_type, tile=discarded_tile)
 
             if action_type == 'hu':
                 self.endgame(actor_id, 'hu', discarded_tile)
@@ -569,4 +658,24 @@ class MahjongServer:
                 info = {'id': actor_id, 'action': 'chow'}
             for p in self.players:
                 p.actions = None # 重置玩家可执行操作。
-        return info
\ No newline at end of file
+        return info
+
+def discard_hint(sort_rule, hands, new, gamerule, exclude=()):
+    """
+    出牌提示: 依次假设打出手牌 (含新摸的牌) 中的每一种牌，计算之后的向听数和有效牌。
+    返回 [{'tile', 'shanten', 'useful'}]，向听数小、有效牌多的排在前面。金不作为候选。
+    只依赖参数，可以在进程池中运行。
+    """
+    player = MahjongPlayer(0, '', get_tileset(sort_rule))
+    tiles = list(hands) + ([new] if new else [])
+    options = []
+    for tile in dict.fromkeys(tiles):
+        if tile == 'joker':
+            continue
+        rest = tiles.copy()
+        rest.remove(tile)
+        player.hands = rest
+        value, useful = player.shanten(gamerule, exclude=exclude)
+        options.append({'tile': tile, 'shanten': value, 'useful': useful})
+    options.sort(key=lambda o: (o['shanten'], -len(o['useful'])))
+    return options
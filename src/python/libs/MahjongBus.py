@@ -0,0 +1,151 @@
+"""
+多进程部署时各个 worker 之间的消息总线。
+
+每个 worker 用 connect(worker_id, handler) 接入总线，得到一个端点，端点的 publish(topic, data) 把消息发给
+其他所有 worker (不会发回给自己)，对方的 handler(topic, data, sender) 收到消息。data 必须可以 JSON 序列化。
+某个 worker 与 UnixSocketBus 的连接断开时，其他 worker 会收到 topic 为 'worker_exit' 的消息。
+
+    LocalBus      同一进程内的总线，用于测试或单进程模拟多个 worker
+    UnixSocketBus 通过 Unix socket 连接到 serve_hub 启动的转发进程，每行一条 JSON 消息
+
+要换成 Redis 等其他实现，只需要提供相同的 connect / publish 接口。
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+
+
+class LocalBus:
+    def __init__(self):
+        self.handlers = {}  # {worker_id: handler}
+
+    def connect(self, worker_id, handler, spawn=None):
+        self.handlers[worker_id] = handler
+        return LocalEndpoint(self, worker_id)
+
+
+class LocalEndpoint:
+    def __init__(self, bus, worker_id):
+        self.bus = bus
+        self.worker_id = worker_id
+
+    def publish(self, topic, data):
+        for worker_id, handler in list(self.bus.handlers.items()):
+            if worker_id != self.worker_id:
+                handler(topic, data, self.worker_id)
+
+    def close(self):
+        self.bus.handlers.pop(self.worker_id, None)
+
+
+class UnixSocketBus:
+    def __init__(self, path, socket_module=socket, lock_factory=threading.Lock):
+        """
+        :param path: serve_hub 监听的 Unix socket 路径。
+        :param socket_module: 创建连接用的 socket 模块，eventlet 下传入 eventlet.green.socket，读取时不阻塞其他任务。
+        :param lock_factory: 保证每条消息完整写出的锁，eventlet 下传入 eventlet.semaphore.Semaphore。
+        """
+        self.path = path
+        self.socket_module = socket_module
+        self.lock_factory = lock_factory
+
+    def connect(self, worker_id, handler, spawn=None):
+        """
+        :param spawn: 启动后台读取任务的函数 (如 sio.start_background_task)，默认使用线程。
+        """
+        sock = self.socket_module.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        endpoint = UnixSocketEndpoint(sock, worker_id, handler, self.lock_factory())
+        if spawn is None:
+            threading.Thread(target=endpoint.run, daemon=True).start()
+        else:
+            spawn(endpoint.run)
+        return endpoint
+
+
+class UnixSocketEndpoint:
+    def __init__(self, sock, worker_id, handler, lock):
+        self.sock = sock
+        self.worker_id = worker_id
+        self.handler = handler
+        self._lock = lock
+
+    def publish(self, topic, data):
+        line = json.dumps({'topic': topic, 'data': data, 'from': self.worker_id}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self.sock.sendall(line.encode('utf-8'))
+
+    def run(self):
+        """读取转发进程发来的消息，连接断开时返回"""
+        buffer = b''
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                logging.warning(f"worker {self.worker_id} 与消息总线的连接已断开")
+                return
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                message = json.loads(line)
+                try:
+                    self.handler(message['topic'], message['data'], message['from'])
+                except Exception:
+                    logging.exception(f"处理总线消息 {message['topic']} 时出错")
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class _HubHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        hub = self.server
+        worker_id = None
+        with hub.lock:
+            hub.clients.add(self.wfile)
+        try:
+            for line in self.rfile:
+                if worker_id is None:
+                    worker_id = json.loads(line)['from']
+                self.forward(line)
+        finally:
+            with hub.lock:
+                hub.clients.discard(self.wfile)
+            if worker_id is not None:  # 通知其他 worker 这个 worker 已经退出
+                self.forward((json.dumps({'topic': 'worker_exit', 'data': None, 'from': worker_id}) + '\n').encode('utf-8'))
+
+    def forward(self, line):
+        hub = self.server
+        with hub.lock:
+            for wfile in list(hub.clients):
+                if wfile is self.wfile:
+                    continue
+                try:
+                    wfile.write(line)
+                    wfile.flush()
+                except OSError:
+                    hub.clients.discard(wfile)
+
+
+class _Hub(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, _HubHandler)
+        self.clients = set()
+        self.lock = threading.Lock()
+
+
+def serve_hub(path):
+    """在后台线程中启动转发进程: 把每个连接发来的消息转发给其他所有连接。返回服务器对象，shutdown() 停止"""
+    if os.path.exists(path):
+        os.unlink(path)
+    hub = _Hub(path)
+    threading.Thread(target=hub.serve_forever, daemon=True).start()
+    return hub
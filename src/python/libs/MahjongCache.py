@@ -0,0 +1,128 @@
+"""
+进程级的有界缓存。
+
+多个房间经常出现相同的 (手牌计数, 金的数量, 规则开关) 组合，胡牌判定和向听数的结果可以直接复用。
+缓存大小和淘汰策略可以在运行时调整，命中/未命中/淘汰次数可以随时查询。
+所有进程级的缓存 (包括 MahjongTables 的拆解表) 都用 register() 登记，stats() 汇总，clear_all() 全部清空。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    POLICIES = ('lru', 'fifo')
+
+    def __init__(self, maxsize=65536, policy='lru'):
+        """
+        :param maxsize: 最多保存的条目数，0 表示不缓存。
+        :param policy: 'lru' 淘汰最久未使用的条目；'fifo' 淘汰最早写入的条目 (命中时不调整顺序，开销更小)。
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的淘汰策略: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._data = OrderedDict()
+        self._lock = threading.Lock()  # eventlet 下不会真正争用，仅防止多线程环境中 OrderedDict 被并发修改
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.policy == 'lru':
+            try:
+                self._data.move_to_end(key)
+            except KeyError:  # 其他线程刚好把它淘汰了
+                pass
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            data = self._data
+            data[key] = value
+            if self.policy == 'lru':
+                data.move_to_end(key)
+            while len(data) > self.maxsize:
+                data.popitem(last=False)
+                self.evictions += 1
+
+    def configure(self, maxsize=None, policy=None):
+        """运行时调整大小或淘汰策略，缩小时立即淘汰多出的条目"""
+        if policy is not None:
+            if policy not in self.POLICIES:
+                raise ValueError(f"未知的淘汰策略: {policy}")
+            self.policy = policy
+        if maxsize is not None:
+            with self._lock:
+                self.maxsize = maxsize
+                while len(self._data) > max(maxsize, 0):
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'policy': self.policy,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+caches = {}  # {名字: LRUCache}
+
+
+def register(name, cache):
+    """登记一个进程级的缓存，返回 cache"""
+    caches[name] = cache
+    return cache
+
+
+def stats():
+    """所有登记的缓存的统计 {名字: LRUCache.stats()}"""
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def clear_all():
+    for cache in caches.values():
+        cache.clear()
+
+
+# 胡牌判定结果缓存，全进程共用。大小可通过环境变量 MAHJONG_HU_CACHE_SIZE 设置
+hu_cache = register('hu', LRUCache(
+    maxsize=int(os.environ.get('MAHJONG_HU_CACHE_SIZE', 65536)),
+    policy=os.environ.get('MAHJONG_HU_CACHE_POLICY', 'lru'),
+))
+
+# 向听数和有效牌的缓存，机器人和提示会频繁查询。大小可通过环境变量 MAHJONG_SHANTEN_CACHE_SIZE 设置
+shanten_cache = register('shanten', LRUCache(
+    maxsize=int(os.environ.get('MAHJONG_SHANTEN_CACHE_SIZE', 16384)),
+    policy=os.environ.get('MAHJONG_SHANTEN_CACHE_POLICY', 'lru'),
+))
+
+# 拆解表 (MahjongTables) 中每一张备忘表的上限。拆解表按需填表，命中时不调整顺序 (fifo)，
+# 被淘汰的模式下次用到时重新计算。大小可通过环境变量 MAHJONG_TABLE_CACHE_SIZE 设置
+TABLE_CACHE_SIZE = int(os.environ.get('MAHJONG_TABLE_CACHE_SIZE', 131072))
+
+
+def table_cache(name, maxsize=None):
+    return register(f'tables.{name}', LRUCache(maxsize=TABLE_CACHE_SIZE if maxsize is None else maxsize, policy='fifo'))
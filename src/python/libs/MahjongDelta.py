@@ -0,0 +1,100 @@
+"""
+游戏状态的增量更新。
+
+房间每次广播时只发送与上一个版本相比的变化，客户端按顺序应用。增量的格式 (可直接 JSON 序列化，浏览器端
+src/stores/delta.ts 有相同的实现):
+
+    ['=', 值]          整体替换
+    ['+', [元素...]]   列表在末尾追加 (弃牌、副露等只增不减的列表)
+    ['-']              删除字典中的键
+    {键: 增量, ...}    逐项修改字典，或逐项修改等长的列表 (键为下标)
+
+消息的格式:
+
+    {'version': v, 'base': b, 'state': 完整状态}   快照
+    {'version': v, 'base': b, 'delta': 增量}       增量，只能应用在版本 b 上
+
+客户端发现 base 与自己持有的版本不一致 (刚加入、断线重连) 时发送 sync_game_state 请求快照。
+"""
+
+
+def diff(old, new):
+    """old 到 new 的增量，没有变化时返回 None"""
+    if old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = {}
+        for key, value in new.items():
+            if key not in old:
+                patch[key] = ['=', value]
+            else:
+                change = diff(old[key], value)
+                if change is not None:
+                    patch[key] = change
+        for key in old:
+            if key not in new:
+                patch[key] = ['-']
+        return patch
+    if isinstance(old, list) and isinstance(new, list):
+        if len(new) > len(old) and new[:len(old)] == old:
+            return ['+', new[len(old):]]
+        if len(new) == len(old) and all(isinstance(item, (dict, list)) for item in new):
+            return {str(i): change for i, change in enumerate(map(diff, old, new)) if change is not None}
+    return ['=', new]
+
+
+def apply(value, delta):
+    """把增量应用到 value 上，返回新的值 (字典和列表原地修改)"""
+    if isinstance(delta, list):
+        if delta[0] == '=':
+            return delta[1]
+        if delta[0] == '+':
+            value.extend(delta[1])
+            return value
+        raise ValueError(f"未知的增量操作: {delta[0]}")
+    if isinstance(value, list):
+        for key, change in delta.items():
+            value[int(key)] = apply(value[int(key)], change)
+        return value
+    for key, change in delta.items():
+        if change == ['-']:
+            value.pop(key, None)
+        else:
+            value[key] = apply(value.get(key), change)
+    return value
+
+
+class StateStream:
+    """
+    一路带版本号的状态流 (公共状态或某个玩家的私有状态)，记住上一次发出的内容用来计算增量。
+    传入的 state 交给状态流保存，之后不能再原地修改: 快照和增量直接引用它，消息在稍后编码 (asyncio 模式) 时
+    内容不会变化。MahjongServer.getgamestate 返回的状态已经拷贝了游戏中会被修改的列表 (副露、弃牌)。
+    last 只整体替换，不原地修改。
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.last = None
+
+    def update(self, state, version):
+        """返回要发送的消息，与上次发送的相同时返回 None"""
+        if self.last is None:
+            return self.snapshot(state, version)
+        delta = diff(self.last, state)
+        if not delta:
+            return None
+        message = {'version': version, 'base': self.version, 'delta': delta}
+        self.last = state
+        self.version = version
+        return message
+
+    def current(self):
+        """最近一次发出的状态的快照，发给掉队的客户端，不影响其他客户端的版本"""
+        return {'version': self.version, 'base': self.version, 'state': self.last}
+
+    def snapshot(self, state, version):
+        """完整快照，之后的增量以它为基础"""
+        self.last = state
+        message = {'version': version, 'base': self.version, 'state': state}
+        self.version = version
+        return message
@@ -0,0 +1,229 @@
+"""
+引擎计算的执行层。
+
+牌型判断 (checkactions / can_hu) 已经是查表加缓存，单次只需要几微秒，仍然在事件循环里直接计算；
+出牌提示、机器人决策这类要反复计算向听数的工作交给进程池，不占用事件循环:
+
+    engine.submit('hint', Mahjong.discard_hint, args, callback)  # 稍后在事件循环中调用 callback(result, error)
+
+- 进程池中排队和运行的调用合计不超过 max_pending 个，超出时立即以 EngineBusy 回调，不会在事件循环里越积越多
+- 每次调用都有超时 (timeout 秒)，超时后以 EngineTimeout 回调，之后才到达的结果被丢弃
+- 快速路径: cheap=True，或者同名调用最近的平均耗时低于 inline_ms 时，直接在事件循环中计算，
+  省去进程间传递参数和结果的开销。平均耗时是衰减平均，进程池中和直接计算的用时都计入，
+  同名调用变慢后 (例如局面变复杂) 会自动回到进程池
+- workers=0 时不启动进程池，所有调用都直接计算
+
+进程池完成的结果先放进线程安全的队列，由事件循环中的周期任务取出后再调用回调，
+eventlet 和 asyncio 下回调都在事件循环中执行，不需要跨线程调度。
+
+LoopMonitor 周期性地测量事件循环的延迟 (周期任务比预定时间晚运行了多久)，也就是事件循环被阻塞的时间。
+EngineExecutor.stats() 中的 inline_ms 是在事件循环中计算的总用时，offloaded_ms 是交给进程池的计算在工作进程中的总用时，
+两者之和是全部在事件循环中计算时会阻塞的时间。
+"""
+import collections
+import concurrent.futures
+import logging
+import time
+
+
+class EngineBusy(Exception):
+    """进程池的队列已满"""
+
+
+class EngineTimeout(Exception):
+    """调用超时"""
+
+
+def _timed(fn, args):
+    """在工作进程中运行，返回 (结果, 用时)"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class _Call:
+    __slots__ = ('name', 'callback', 'deadline', 'submitted', 'future')
+
+    def __init__(self, name, callback, deadline, submitted):
+        self.name = name
+        self.callback = callback
+        self.deadline = deadline
+        self.submitted = submitted
+        self.future = None
+
+
+class EngineExecutor:
+    def __init__(self, workers=0, max_pending=64, timeout=2.0, inline_ms=0.5, poll=0.01, decay=0.2):
+        """
+        :param workers: 进程池的进程数，0 表示所有调用都在事件循环中计算。
+        :param max_pending: 进程池中同时排队和运行的调用数上限。
+        :param timeout: 每次调用的超时 (秒)。
+        :param inline_ms: 同名调用的平均用时低于该值 (毫秒) 时改为直接计算。
+        :param poll: 事件循环检查完成结果和超时的间隔 (秒)。
+        :param decay: 平均用时的衰减系数，每次新的用时占平均值的比例。
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.inline_ms = inline_ms
+        self.poll_interval = poll
+        self.decay = decay
+        self.pool = None
+        self.pending = {}  # {id(_Call): _Call}，已提交到进程池、尚未回调的调用
+        self.done = collections.deque()  # 进程池线程放入的 (_Call, future)
+        self.cost = {}  # {name: (测得用时的次数, 平均用时)}
+        self._stats = {'inline': 0, 'pooled': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0,
+                       'inline_time': 0.0, 'max_inline': 0.0, 'offloaded_time': 0.0, 'wait_time': 0.0, 'max_wait': 0.0}
+
+    def start(self, runtime):
+        """启动进程池和在事件循环中收取结果的周期任务"""
+        if self.workers > 0 and self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+            runtime.start_periodic(self.poll_interval, self.poll)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def submit(self, name, fn, args, callback, cheap=False):
+        """
+        计算 fn(*args)，完成后在事件循环中调用 callback(result, error)，error 为 None 或异常对象。
+        交给进程池时 fn 必须是模块级函数，args 和返回值都必须可以 pickle。
+        :param name: 调用的类别，用于统计和决定是否走快速路径。
+        :param cheap: 为 True 时直接计算。
+        """
+        if self.pool is None or cheap or self._is_cheap(name):
+            self._run_inline(name, fn, args, callback)
+            return
+        if len(self.pending) >= self.max_pending:
+            self._stats['rejected'] += 1
+            callback(None, EngineBusy('引擎繁忙，请稍后再试'))
+            return
+        now = time.monotonic()
+        call = _Call(name, callback, now + self.timeout, now)
+        try:
+            call.future = self.pool.submit(_timed, fn, args)
+        except RuntimeError as e:  # 进程池已经关闭或损坏
+            callback(None, e)
+            return
+        self._stats['pooled'] += 1
+        self.pending[id(call)] = call
+        call.future.add_done_callback(lambda future: self.done.append(call))
+
+    def _is_cheap(self, name):
+        count, average = self.cost.get(name, (0, 0.0))
+        return count >= 8 and average * 1e3 < self.inline_ms
+
+    def _record_cost(self, name, elapsed):
+        """计入一次用时: 前 8 次取算术平均，之后取衰减平均，跟上最近的变化"""
+        count, average = self.cost.get(name, (0, 0.0))
+        if count < 8:
+            average += (elapsed - average) / (count + 1)
+        else:
+            average += (elapsed - average) * self.decay
+        self.cost[name] = (count + 1, average)
+
+    def _run_inline(self, name, fn, args, callback):
+        start = time.perf_counter()
+        try:
+            result, error = fn(*args), None
+        except Exception as e:
+            result, error = None, e
+            self._stats['errors'] += 1
+        elapsed = time.perf_counter() - start
+        self._record_cost(name, elapsed)
+        self._stats['inline'] += 1
+        self._stats['inline_time'] += elapsed
+        self._stats['max_inline'] = max(self._stats['max_inline'], elapsed)
+        self._callback(callback, result, error)
+
+    def poll(self):
+        """在事件循环中运行: 对完成的调用和超时的调用执行回调"""
+        now = time.monotonic()
+        while self.done:
+            call = self.done.popleft()
+            if self.pending.pop(id(call), None) is None:
+                continue  # 已经超时
+            self._finish(call, now)
+        for key, call in list(self.pending.items()):
+            if now >= call.deadline:
+                del self.pending[key]
+                call.future.cancel()
+                self._stats['timeouts'] += 1
+                self._callback(call.callback, None, EngineTimeout(f'{call.name} 超过 {self.timeout} 秒没有完成'))
+
+    def _finish(self, call, now):
+        stats = self._stats
+        wait = now - call.submitted
+        stats['wait_time'] += wait
+        stats['max_wait'] = max(stats['max_wait'], wait)
+        try:
+            result, elapsed = call.future.result()
+        except Exception as e:
+            stats['errors'] += 1
+            self._callback(call.callback, None, e)
+            return
+        stats['offloaded_time'] += elapsed
+        self._record_cost(call.name, elapsed)
+        self._callback(call.callback, result, None)
+
+    def _callback(self, callback, result, error):
+        try:
+            callback(result, error)
+        except Exception:
+            logging.exception("引擎调用的回调出错")
+
+    def stats(self):
+        """调用次数和用时 (毫秒)，wait 为进程池调用从提交到回调的时间"""
+        stats = self._stats
+        return {
+            'workers': self.workers if self.pool is not None else 0,
+            'pending': len(self.pending),
+            'inline': stats['inline'],
+            'pooled': stats['pooled'],
+            'rejected': stats['rejected'],
+            'timeouts': stats['timeouts'],
+            'errors': stats['errors'],
+            'inline_ms': stats['inline_time'] * 1e3,
+            'max_inline_ms': stats['max_inline'] * 1e3,
+            'offloaded_ms': stats['offloaded_time'] * 1e3,
+            'avg_wait_ms': stats['wait_time'] / (stats['pooled'] or 1) * 1e3,
+            'max_wait_ms': stats['max_wait'] * 1e3,
+            'avg_cost_ms': {name: average * 1e3 for name, (count, average) in self.cost.items()},
+        }
+
+
+class LoopMonitor:
+    """测量事件循环被阻塞的时间: 每 interval 秒运行一次的任务实际晚了多久"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.last = None
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0  # 延迟超过 100 毫秒的次数
+
+    def start(self, runtime):
+        if self.last is None:
+            self.last = time.monotonic()
+            runtime.start_periodic(self.interval, self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self.last - self.interval)
+        self.last = now
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag > 0.1:
+            self.stalls += 1
+
+    def stats(self):
+        return {
+            'samples': self.samples,
+            'avg_lag_ms': self.total_lag / (self.samples or 1) * 1e3,
+            'max_lag_ms': self.max_lag * 1e3,
+            'stalls': self.stalls,
+        }
@@ -0,0 +1,93 @@
+"""
+按连接 (sid) 和事件类型限流的令牌桶。
+
+每个 sid 的每种受限事件各有一个桶，另有一个所有事件共用的桶 ('*')，两个桶都有令牌时才放行:
+
+    limiter = RateLimiter({'game_action': (10, 20), 'chat_message': (2, 5), '*': (50, 100)})  # (每秒补充的令牌数, 桶容量)
+    if not limiter.allow(sid, 'game_action'):
+        ...  # 丢弃
+
+被限流的事件直接丢弃，只在连续丢弃中的第一次通知客户端 (notify 为 True)，丢弃本身不会再产生大量消息。
+连接断开时调用 forget(sid) 释放它的桶。
+"""
+import time
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'notified')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.notified = False  # 本轮连续丢弃是否已经通知过客户端
+
+    def peek(self, now):
+        """补充令牌，返回是否至少有一个令牌 (不取走)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1
+
+
+class RateLimiter:
+    def __init__(self, limits, exempt=('connect', 'disconnect')):
+        """
+        :param limits: {事件名: (每秒补充的令牌数, 桶容量)}，'*' 为每个 sid 所有事件共用的限制。没有列出的事件只受 '*' 限制。
+        :param exempt: 不限流的事件。
+        """
+        self.limits = dict(limits)
+        self.exempt = frozenset(exempt)
+        self.buckets = {}  # {sid: {事件名: TokenBucket}}
+        self.stats_allowed = {}  # {事件名: 放行次数}
+        self.stats_shed = {}  # {事件名: 丢弃次数}
+        self.notify = False  # 最近一次 allow 返回 False 时，是否应当通知客户端
+
+    def allow(self, sid, event):
+        if event in self.exempt or not self.limits:
+            return True
+        now = time.monotonic()
+        buckets = self.buckets.get(sid)
+        if buckets is None:
+            buckets = self.buckets[sid] = {}
+        # 两个桶都有令牌时才同时取走，被其中一个拒绝时另一个的令牌不受影响
+        checked = []
+        for key in (event, '*'):
+            limit = self.limits.get(key)
+            if limit is None:
+                continue
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = TokenBucket(limit[0], limit[1], now)
+            if not bucket.peek(now):
+                self.stats_shed[event] = self.stats_shed.get(event, 0) + 1
+                self.notify = not bucket.notified
+                bucket.notified = True
+                return False
+            checked.append(bucket)
+        for bucket in checked:
+            bucket.tokens -= 1
+            bucket.notified = False
+        self.stats_allowed[event] = self.stats_allowed.get(event, 0) + 1
+        return True
+
+    def forget(self, sid):
+        self.buckets.pop(sid, None)
+
+    def stats(self):
+        return {
+            'limits': {event: list(limit) for event, limit in self.limits.items()},
+            'tracked_sids': len(self.buckets),
+            'allowed': dict(self.stats_allowed),
+            'shed': dict(self.stats_shed),
+        }
+
+
+def parse_limits(text):
+    """'game_action=10/20,chat_message=2/5' -> {'game_action': (10.0, 20.0), 'chat_message': (2.0, 5.0)}"""
+    limits = {}
+    for item in filter(None, (text or '').split(',')):
+        event, _, value = item.partition('=')
+        rate, _, burst = value.partition('/')
+        limits[event.strip()] = (float(rate), float(burst or rate))
+    return limits
@@ -0,0 +1,286 @@
+"""
+通过 Socket.IO 对本地服务器做容量测试的机器人客户端。
+
+每个机器人是一个独立的 socketio.Client 连接，和真实客户端走相同的协议:
+join_server 登录，每 4 个机器人中的第一个 create_room 建房，其余 join_room 加入，player_ready 准备，
+之后根据 game_state_update / private_state_update 的状态自动出牌 (打出刚摸的牌)、能胡就胡、其余宣告一律过，
+一局结束、房间回到等待状态后再次准备，循环到测试时间结束。
+
+统计:
+    动作往返延迟  从发出 game_action 到收到服务器对它的第一条回应 (动作结果或状态更新)
+    局数          每个房间由建房的机器人统计 game_over
+    错误          连接失败、意外断开、加入房间失败、被服务器拒绝的动作、处理消息时的异常
+"""
+import random
+import threading
+import time
+
+import socketio
+
+from . import MahjongDelta
+
+RESPONSE_EVENTS = ('game_action_result', 'private_state_update', 'game_state_update', 'game_over')
+
+
+class LoadStats:
+    """所有机器人共用的统计，回调在各个连接的线程中执行，用锁保护"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rtts = []  # 动作往返延迟 (秒)
+        self.counts = {'actions': 0, 'games': 0, 'connected': 0}
+        self.errors = {}
+        self.start = time.perf_counter()
+        self.end = None
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def rtt(self, seconds):
+        with self.lock:
+            self.rtts.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            elapsed = (self.end or time.perf_counter()) - self.start
+            rtts = sorted(self.rtts)
+            errors = sum(self.errors.values())
+            return {
+                'elapsed': elapsed,
+                'connected': self.counts['connected'],
+                'games': self.counts['games'],
+                'games_per_min': self.counts['games'] / elapsed * 60 if elapsed else 0.0,
+                'actions': self.counts['actions'],
+                'actions_per_sec': self.counts['actions'] / elapsed if elapsed else 0.0,
+                'rtt_ms': {f'p{p}': _percentile(rtts, p) * 1e3 for p in (50, 90, 99)} | {'max': rtts[-1] * 1e3 if rtts else 0.0},
+                'errors': dict(self.errors),
+                'error_rate': errors / (self.counts['actions'] or 1),
+            }
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Bot:
+    def __init__(self, index, url, stats, rooms, think=0.0):
+        """
+        :param rooms: 所有机器人共用的 {组号: 房间ID}，建房的机器人写入，同组的其他机器人等待后加入。
+        :param think: 每次行动前的等待时间 (秒)，模拟真人的思考时间。
+        """
+        self.index = index
+        self.name = f'bot-{index}'
+        self.url = url
+        self.stats = stats
+        self.rooms = rooms
+        self.think = think
+        self.group = index // 4
+        self.is_owner = index % 4 == 0
+        self.rng = random.Random(index)
+        self.sio = socketio.Client(reconnection=False)
+        self.running = True
+        self.reset()
+        for event in ('connect', 'disconnect', 'join_server_result', 'create_room_result', 'join_room_result', 'room_info_update',
+                      'game_initialized', 'game_state_update', 'private_state_update', 'game_action_result', 'game_over', 'batch'):
+            self.sio.on(event, self._guard(event, getattr(self, f'on_{event}')))
+
+    def reset(self):
+        self.my_id = None
+        self.state = {'public': None, 'private': None}
+        self.versions = {}
+        self.last_key = None
+        self.sent = None  # 最近一次动作的发送时间，收到回应后清空
+        self.in_batch = False
+
+    def _guard(self, event, handler):
+        def wrapper(*args):
+            if event in RESPONSE_EVENTS and self.sent is not None:
+                self.stats.rtt(time.perf_counter() - self.sent)
+                self.sent = None
+            try:
+                handler(*args)
+            except Exception:
+                self.stats.error('client')
+        return wrapper
+
+    # --- 连接和房间 ---
+    def start(self):
+        try:
+            self.sio.connect(self.url, transports=['websocket'])
+        except Exception:
+            self.stats.error('connect')
+
+    def stop(self):
+        self.running = False
+        if self.sio.connected:
+            self.sio.disconnect()
+
+    def on_connect(self):
+        self.stats.count('connected')
+        self.sio.emit('join_server', {'name': self.name})
+
+    def on_disconnect(self, *args):
+        if self.running:
+            self.stats.error('disconnect')
+
+    def on_join_server_result(self, data):
+        if not data['success']:
+            self.stats.error('login')
+            return
+        if self.is_owner:
+            self.sio.emit('create_room', {'name': f'load-{self.group}', 'password': ''})
+        else:
+            self.sio.start_background_task(self._join_when_created)
+
+    def _join_when_created(self):
+        deadline = time.monotonic() + 30
+        while self.group not in self.rooms:
+            if not self.running or time.monotonic() > deadline:
+                self.stats.error('join')
+                return
+            time.sleep(0.05)
+        self.sio.emit('join_room', {'room_id': self.rooms[self.group], 'password': ''})
+
+    def on_create_room_result(self, data):
+        if data['success']:
+            self.rooms[self.group] = data['room_id']
+        else:
+            self.stats.error('create')
+
+    def on_join_room_result(self, data):
+        if not data['success']:
+            self.stats.error('join')
+
+    def on_room_info_update(self, data):
+        """等待状态下自己没有准备时准备 (加入房间后和每局结束后)"""
+        me = data.get('members', {}).get(self.sio.get_sid())
+        if me is not None and not me.get('ready'):
+            self.sio.emit('player_ready', {'ready': True})
+
+    # --- 对局 ---
+    def on_game_initialized(self, data):
+        self.reset()
+        self.my_id = data.get('my_id')
+
+    def on_game_state_update(self, data):
+        self._apply('public', data)
+
+    def on_private_state_update(self, data):
+        self._apply('private', data)
+
+    def on_batch(self, data):
+        """一帧中的多条消息全部应用后才做决定，避免只看到一半的状态"""
+        self.in_batch = True
+        try:
+            for event, payload in data['messages']:
+                handler = self.sio.handlers.get('/', {}).get(event)
+                if handler is not None:
+                    handler(payload)
+        finally:
+            self.in_batch = False
+        self.decide()
+
+    def _apply(self, part, message):
+        if 'state' in message:
+            self.state[part] = message['state']
+        elif self.versions.get(part) == message['base']:
+            self.state[part] = MahjongDelta.apply(self.state[part], message['delta'])
+        else:
+            self.stats.error('desync')
+            self.sio.emit('sync_game_state', {})
+            return
+        self.versions[part] = message['version']
+        if not self.in_batch:
+            self.decide()
+
+    def on_game_action_result(self, data):
+        if not data.get('success'):
+            self.stats.error('rejected')
+
+    def on_game_over(self, data):
+        if self.is_owner:
+            self.stats.count('games')
+        self.reset()
+
+    def decide(self):
+        """每个决策点 (摸牌后、宣告阶段、吃碰后) 只行动一次"""
+        public, private = self.state['public'], self.state['private']
+        if not self.running or public is None or private is None or self.my_id is None:
+            return
+        index = public.get('playerindex')
+        actions = private.get('actions') or {}
+        key = (public.get('wall_count'), index, private.get('new'), len(private.get('locked') or ()), bool(actions))
+        if key == self.last_key:
+            return
+        if index == 5:  # 宣告阶段
+            if not actions:
+                return
+            self.last_key = key
+            self.act({'action': 'hu'} if 'hu' in actions else {'action': 'pass'})
+        elif index == self.my_id and (len(private.get('hands') or ()) + bool(private.get('new'))) % 3 == 2:  # 手上多一张牌，需要出牌
+            self.last_key = key
+            if actions.get('hu'):
+                self.act({'action': 'hu'})
+            elif private.get('new'):
+                self.act({'action': 'discard', 'tileindex': None})
+            else:  # 吃碰之后没有新牌，随机打出一张手牌
+                self.act({'action': 'discard', 'tileindex': self.rng.randrange(len(private.get('hands') or [None]))})
+
+    def act(self, payload):
+        if self.think:
+            self.sio.start_background_task(self._act_later, payload)
+        else:
+            self._send(payload)
+
+    def _act_later(self, payload):
+        time.sleep(self.think)
+        if self.running:
+            self._send(payload)
+
+    def _send(self, payload):
+        self.stats.count('actions')
+        self.sent = time.perf_counter()
+        self.sio.emit('game_action', payload)
+
+
+def run(url, bots=4, duration=60.0, think=0.0, ramp=0.02, progress=None):
+    """
+    启动 bots 个机器人 (向上取整为 4 的倍数) 连接到 url，运行 duration 秒后断开，返回统计摘要。
+    :param ramp: 相邻两个机器人连接之间的间隔 (秒)，避免同时建立大量连接。
+    :param progress: 每 5 秒调用一次 progress(summary)。
+    """
+    bots = -(-bots // 4) * 4
+    stats = LoadStats()
+    rooms = {}
+    clients = [Bot(i, url, stats, rooms, think) for i in range(bots)]
+    for bot in clients:
+        bot.start()
+        time.sleep(ramp)
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        time.sleep(min(5.0, max(0.0, deadline - time.monotonic())))
+        if progress is not None:
+            progress(stats.summary())
+    stats.end = time.perf_counter()
+    for bot in clients:
+        bot.stop()
+    return stats.summary()
+
+
+def format_report(summary):
+    rtt = summary['rtt_ms']
+    lines = [
+        f"用时 {summary['elapsed']:.1f} s，连接 {summary['connected']}",
+        f"对局 {summary['games']}，{summary['games_per_min']:.1f} 局/分钟",
+        f"动作 {summary['actions']}，{summary['actions_per_sec']:.1f} 次/秒",
+        f"往返延迟 p50 {rtt['p50']:.1f} ms  p90 {rtt['p90']:.1f} ms  p99 {rtt['p99']:.1f} ms  max {rtt['max']:.1f} ms",
+        f"错误率 {summary['error_rate']:.2%} {summary['errors'] or ''}",
+    ]
+    return '\n'.join(lines)
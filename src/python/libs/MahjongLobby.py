@@ -0,0 +1,161 @@
+"""
+大厅房间列表。
+
+只有在大厅里的用户 (已登录、不在房间中) 加入 Socket.IO 的 lobby 房间。房间信息变化时 (MahjongRoom.touch)
+不再向所有人广播整个房间列表，而是记下变化的房间，短暂合并后向大厅发送一次增量:
+
+    room_list_delta  {'version': v, 'base': b, 'changes': [
+        {'op': 'add', 'id': 房间ID, 'room': 房间条目},
+        {'op': 'update', 'id': 房间ID, 'room': 房间条目},
+        {'op': 'remove', 'id': 房间ID},
+    ]}
+
+客户端持有的版本与 base 不一致时重新请求房间列表 (get_rooms)。
+
+增量是相对完整的、不过滤不分页的房间列表的。用过滤或分页条件请求过列表的客户端 (set_view) 改为加入
+lobby-filtered 房间，不会收到增量，而是在同样的时机收到 room_list_stale {'version': v}，由客户端用自己的条件重新请求。
+
+多进程部署时每个 worker 只拥有自己的房间，本地房间的变化通过消息总线 (MahjongBus) 发给其他 worker，
+收到的其他 worker 的变化合并进本地的房间列表，再以本地的版本号发给本 worker 大厅里的用户。
+"""
+from .MahjongPayload import CachedPayload
+from .MahjongTimer import timer_wheel
+
+LOBBY = 'lobby'
+LOBBY_FILTERED = 'lobby-filtered'
+
+
+def room_entry(room):
+    """房间列表中的一项"""
+    return {
+        'id': room.id,
+        'name': room.name,
+        'game': room.game,
+        'owner': room.owner,
+        'members': room.get_member_count(),
+        'max_members': room.rules['max players'],
+        'has_password': bool(room.password),
+        'status': room.status
+    }
+
+
+class Lobby:
+    def __init__(self, sio, rooms, delay=0.2, bus=None):
+        """
+        :param sio: Socket.IO 服务器的调度层 (MahjongRuntime.Runtime)。
+        :param rooms: 服务器的 {room_id: MahjongRoom}，房间解散时先从中删除再调用 close()。
+        :param delay: 合并变化的时间 (秒)，期间的多次变化只发送一次增量。
+        :param bus: 消息总线的端点，多进程部署时用来和其他 worker 交换房间列表的变化。
+        """
+        self.sio = sio
+        self.rooms = rooms
+        self.delay = delay
+        self.version = 0
+        self.entries = {}  # 最近一次发出的 {room_id: 房间条目}
+        self.dirty = set()
+        self.timer = None
+        self.cache = None  # (version, CachedPayload)，完整的房间列表
+        self.stats = {'changes': 0, 'deltas': 0}
+        self.bus = bus
+        self.remote = {}  # {room_id: worker}，其他 worker 的房间
+
+    def enter(self, sid):
+        """进入大厅，默认看到完整的房间列表"""
+        self.sio.leave_room(sid, LOBBY_FILTERED)
+        self.sio.enter_room(sid, LOBBY)
+
+    def leave(self, sid):
+        self.sio.leave_room(sid, LOBBY)
+        self.sio.leave_room(sid, LOBBY_FILTERED)
+
+    def set_view(self, sid, filtered):
+        """大厅中的用户最近一次请求的是过滤/分页的列表 (filtered=True) 还是完整列表"""
+        self.sio.leave_room(sid, LOBBY if filtered else LOBBY_FILTERED)
+        self.sio.enter_room(sid, LOBBY_FILTERED if filtered else LOBBY)
+
+    def mark(self, room_id):
+        """房间信息发生了变化，稍后合并发送"""
+        self.dirty.add(room_id)
+        if self.timer is None:
+            timer_wheel.ensure_running(self.sio)
+            self.timer = timer_wheel.call_later(self.delay, self.flush)
+
+    def flush(self):
+        """计算变化的房间条目并向大厅发送一次增量"""
+        self.timer = None
+        dirty, self.dirty = self.dirty, set()
+        changes = []
+        for room_id in sorted(dirty, key=lambda i: self.rooms[i].created_time if i in self.rooms else ''):
+            room = self.rooms.get(room_id)
+            if room is None:
+                if self.entries.pop(room_id, None) is not None:
+                    changes.append({'op': 'remove', 'id': room_id})
+                continue
+            entry = room_entry(room)
+            old = self.entries.get(room_id)
+            if old == entry:
+                continue
+            self.entries[room_id] = entry
+            changes.append({'op': 'add' if old is None else 'update', 'id': room_id, 'room': entry})
+        if changes and self.bus is not None:
+            self.bus.publish('lobby', changes)
+        self._send(changes)
+
+    def apply_remote(self, changes, worker):
+        """合并其他 worker 的房间列表变化"""
+        applied = []
+        for change in changes:
+            room_id = change['id']
+            if change['op'] == 'remove':
+                self.remote.pop(room_id, None)
+                if self.entries.pop(room_id, None) is not None:
+                    applied.append(change)
+                continue
+            old = self.entries.get(room_id)
+            self.entries[room_id] = change['room']
+            self.remote[room_id] = worker
+            applied.append({'op': 'add' if old is None else 'update', 'id': room_id, 'room': change['room']})
+        self._send(applied)
+
+    def local_changes(self):
+        """本 worker 所有房间的条目 (作为 add)，发给新加入总线的 worker"""
+        return [{'op': 'add', 'id': room_id, 'room': entry} for room_id, entry in self.entries.items() if room_id not in self.remote]
+
+    def drop_worker(self, worker):
+        """某个 worker 退出后删除它的房间"""
+        self.apply_remote([{'op': 'remove', 'id': room_id} for room_id, owner in list(self.remote.items()) if owner == worker], worker)
+
+    def _send(self, changes):
+        if not changes:
+            return
+        self.version += 1
+        self.stats['changes'] += len(changes)
+        self.stats['deltas'] += 1
+        self.sio.emit('room_list_delta', {'version': self.version, 'base': self.version - 1, 'changes': changes}, room=LOBBY)
+        self.sio.emit('room_list_stale', {'version': self.version}, room=LOBBY_FILTERED)
+
+    def room_list(self, status=None, free=None, password=None, offset=0, limit=None):
+        """
+        房间列表快照，可以按条件过滤和分页。没有过滤和分页时返回缓存的完整列表。
+        :param status: 只返回该状态的房间 ('waiting', 'playing', 'finished')。
+        :param free: 为 True 时只返回还有空位的房间。
+        :param password: 为 True/False 时只返回有/没有密码的房间。
+        :return: {'version', 'total', 'room_list'}，total 为过滤后、分页前的房间数。
+        """
+        if self.dirty:  # 还没有发出的变化先发出去，快照的版本才能和增量衔接
+            if self.timer is not None:
+                self.timer.cancel()
+            self.flush()
+        entries = list(self.entries.values())
+        if status is None and free is None and password is None and not offset and limit is None:
+            if self.cache is None or self.cache[0] != self.version:
+                self.cache = (self.version, CachedPayload(entries))
+            return {'version': self.version, 'total': len(entries), 'room_list': self.cache[1]}
+        if status is not None:
+            entries = [e for e in entries if e['status'] == status]
+        if free:
+            entries = [e for e in entries if e['members'] < e['max_members']]
+        if password is not None:
+            entries = [e for e in entries if e['has_password'] == bool(password)]
+        page = entries[offset:offset + limit if limit is not None else None]
+        return {'version': self.version, 'total': len(entries), 'room_list': page}
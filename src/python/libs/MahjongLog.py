@@ -0,0 +1,135 @@
+"""
+结构化的事件日志。
+
+每个子系统一个 logger (mahjong.engine、mahjong.room、mahjong.server)，级别可以分别设置。
+日志以「事件名 + 字段」的形式记录，只有级别启用时才会构造记录，格式化推迟到写出时:
+
+    log = EventLogger('room')
+    log.info('join', room=room.name, player=name)             # join room=... player=...
+    log.debug('update', every=100, room=room.name)            # 采样: 每 100 次只记录 1 次
+
+setup() 让所有日志先进入队列，由后台线程格式化并写出，处理事件的任务不会因为写日志而阻塞。
+text 格式输出 "时间 - 级别 - logger - 事件 字段=值"，json 格式每行一个 JSON 对象。
+
+引擎内层循环 (can_hu、can_chow、摸牌、出牌、checkactions 等每个动作都要执行多次的地方) 的日志写成
+
+    if ENGINE_TRACE:
+        log.debug(...)
+
+ENGINE_TRACE 在导入时由环境变量 MAHJONG_ENGINE_TRACE=1 决定，默认关闭，关闭时只剩一次常量判断，不构造任何参数。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+ENGINE_TRACE = os.environ.get('MAHJONG_ENGINE_TRACE') == '1'
+
+
+class _Event:
+    """日志记录的消息，写出时才格式化"""
+    __slots__ = ('name', 'fields')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __str__(self):
+        if not self.fields:
+            return self.name
+        return self.name + ' ' + ' '.join(f'{key}={value}' for key, value in self.fields.items())
+
+
+class EventLogger:
+    def __init__(self, subsystem):
+        self.logger = logging.getLogger(f'mahjong.{subsystem}')
+        self.counters = {}  # {事件名: 调用次数}，用于采样
+
+    def log(self, level, event, /, every=1, **fields):
+        """
+        记录一个事件。事件名只能按位置传入，字段可以使用任何名字 (包括 name)。
+        :param every: 采样间隔，每 every 次只记录 1 次 (记录中带有 sampled 字段)。
+        :param fields: 事件的字段。列表、字典和集合会被浅拷贝，写出时看到的是记录时的内容。
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        if every > 1:
+            count = self.counters.get(event, 0)
+            self.counters[event] = count + 1
+            if count % every:
+                return
+            fields['sampled'] = every
+        for key, value in fields.items():
+            if isinstance(value, (list, dict, set)):
+                fields[key] = value.copy()
+        self.logger.log(level, '%s', _Event(event, fields))
+
+    def debug(self, event, /, every=1, **fields):
+        self.log(logging.DEBUG, event, every=every, **fields)
+
+    def info(self, event, /, every=1, **fields):
+        self.log(logging.INFO, event, every=every, **fields)
+
+    def warning(self, event, /, every=1, **fields):
+        self.log(logging.WARNING, event, every=every, **fields)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出一行 JSON: {'time', 'level', 'logger', 'event', 字段...}"""
+
+    def format(self, record):
+        event = record.args[0] if isinstance(record.args, tuple) and record.args and isinstance(record.args[0], _Event) else None
+        data = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name}
+        if event is not None:
+            data['event'] = event.name
+            data.update(event.fields)
+        else:
+            data['message'] = record.getMessage()
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """把记录原样放进队列，格式化留给写出线程 (标准的 QueueHandler 会在调用者的线程里先格式化)"""
+
+    def prepare(self, record):
+        return record
+
+
+def parse_levels(text):
+    """'engine=WARNING,room=DEBUG' -> {'engine': 'WARNING', 'room': 'DEBUG'}"""
+    levels = {}
+    for item in filter(None, (text or '').split(',')):
+        subsystem, _, level = item.partition('=')
+        levels[subsystem.strip()] = level.strip().upper()
+    return levels
+
+
+def setup(level='INFO', levels=None, fmt='text', stream=None):
+    """
+    配置全进程的日志: 根 logger 只把记录放进队列，由后台线程写到 stream (默认 stderr)。
+    :param level: 默认级别。
+    :param levels: 各子系统的级别，如 {'engine': 'WARNING', 'room': 'DEBUG'}。
+    :param fmt: 'text' 或 'json'。
+    :return: 后台写出的 QueueListener，进程退出时自动停止。
+    """
+    handler = logging.StreamHandler(stream)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(_DeferredQueueHandler(records))
+    root.setLevel(level)
+    for subsystem, subsystem_level in (levels or {}).items():
+        logging.getLogger(f'mahjong.{subsystem}').setLevel(subsystem_level)
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,179 @@
+"""
+服务器的运行指标，以 Prometheus 文本格式输出，现有的监控可以直接抓取。
+
+全进程共用一个登记表 metrics，各模块在导入时登记自己的指标:
+
+    handler_seconds = metrics.histogram('mahjong_handler_seconds', 'Socket.IO 事件处理用时', ('event',))
+    handler_seconds.observe(elapsed, 'game_action')
+
+    Counter    只增不减的计数，inc(amount, *标签值)
+    Histogram  分桶统计 (秒)，observe(value, *标签值)，同时给出次数和总和
+    gauge      抓取时调用函数取得当前值，函数返回数值或 {标签值元组: 数值}
+
+wsgi_app / asgi_app 返回只响应 /metrics 的应用，作为 Socket.IO 应用的 other app 挂在同一个端口上。
+多进程部署时每个 worker 的端口分别抓取。
+"""
+import bisect
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ENGINE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+WINDOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}  # {标签值元组: 数值}
+
+    def inc(self, amount=1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.values = {}  # {标签值元组: [各桶计数..., 次数, 总和]}
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def time(self, *labels):
+        """with histogram.time('label'): ... 统计代码块的用时"""
+        return _Timing(self, labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labelnames + ('le',)
+        for labels, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(names, labels + ("+Inf",))} {series[-2]}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {series[-2]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}')
+        return lines
+
+
+class _Timing:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Gauge:
+    def __init__(self, name, help, labelnames, fn):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        value = self.fn()
+        items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        for labels, v in items:
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(v)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}  # {name: 指标}，按登记顺序输出
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'指标 {metric.name} 已经登记')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, tuple(labelnames)))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, tuple(labelnames), buckets))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        """fn() 在抓取时调用"""
+        return self._register(Gauge(name, help, tuple(labelnames), fn))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def wsgi_app(registry=metrics, path='/metrics'):
+    def app(environ, start_response):
+        if environ.get('PATH_INFO') != path:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'not found']
+        body = registry.render().encode('utf-8')
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE), ('Content-Length', str(len(body)))])
+        return [body]
+    return app
+
+
+def asgi_app(registry=metrics, path='/metrics'):
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        if scope['path'] != path:
+            status, headers, body = 404, [(b'content-type', b'text/plain')], b'not found'
+        else:
+            body = registry.render().encode('utf-8')
+            status, headers = 200, [(b'content-type', CONTENT_TYPE.encode())]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+    return app
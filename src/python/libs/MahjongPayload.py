@@ -0,0 +1,63 @@
+"""
+编码一次、发给多个接收者的消息数据。
+
+房间的公共状态、房间信息和大厅房间列表对每个接收者都相同，用 CachedPayload 包装后放进消息里，
+第一次编码时把 JSON 文本缓存下来，之后发给其他接收者时直接拼接，不再重复编码。
+CachedPayload 本身不可修改，内容变化时 (版本号变化) 创建新的对象。
+
+本模块可以直接作为 Socket.IO 的 json 模块:
+
+    sio = socketio.Server(json=MahjongPayload)
+
+dumps 不区分编码的是什么数据。每个事件名的帧数和字节数 (MahjongMetrics) 由发送处调用 count_frame 统计，
+服务器在 Socket.IO 的事件包编码后调用 (见 server.FramePacket)，确认包等其他数据包不计入。
+"""
+import json
+import uuid
+
+from .MahjongMetrics import metrics
+
+emit_frames = metrics.counter('mahjong_emit_frames_total', '编码的 Socket.IO 事件帧数 (发给一个房间的帧只编码一次)', ('event',))
+emit_bytes = metrics.counter('mahjong_emit_bytes_total', '编码后的事件帧字节数', ('event',))
+
+_marker = f'cached-payload-{uuid.uuid4().hex}-'
+
+
+class CachedPayload:
+    __slots__ = ('value', '_text')
+
+    def __init__(self, value):
+        self.value = value
+        self._text = None
+
+    @property
+    def text(self):
+        """value 的 JSON 文本，只编码一次"""
+        if self._text is None:
+            self._text = json.dumps(self.value, separators=(',', ':'), ensure_ascii=False)
+        return self._text
+
+
+def dumps(obj, **kwargs):
+    """与 json.dumps 相同，其中的 CachedPayload 直接替换为缓存的文本"""
+    cached = []
+
+    def default(o):
+        if isinstance(o, CachedPayload):
+            cached.append(o)
+            return f'{_marker}{len(cached) - 1}'
+        raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+    text = json.dumps(obj, default=default, **kwargs)
+    for i, payload in enumerate(cached):
+        text = text.replace(f'"{_marker}{i}"', payload.text, 1)
+    return text
+
+
+def count_frame(event, text):
+    """记录一个编码好的事件帧 text (发给一个房间的帧只编码、只记录一次)"""
+    emit_frames.inc(1, event)
+    emit_bytes.inc(len(text.encode('utf-8')), event)
+
+
+loads = json.loads
@@ -0,0 +1,101 @@
+"""
+对局复现。
+
+MahjongServer 的洗牌和掷骰子只使用由 seed 生成的 rng，引擎的每个动作都追加到 replay_log:
+
+    ('D', 玩家, 牌)          从牌墙前面摸牌
+    ('B', 玩家, 牌)          从牌墙后面摸牌 (杠后补牌)
+    ('X', 玩家, 牌)          出牌
+    ('C', 玩家, 动作[, 吃的两张牌])  提交宣告
+    ('R', 玩家或 None)       裁决宣告，None 表示无人执行
+    ('E', 胜者或 None, 原因)  结束
+
+export_replay() 得到的记录可以在没有服务器的情况下全速重放，用于把线上出问题或很慢的对局变成固定的测试和基准输入。
+
+    python -m libs.MahjongReplay game.json [...]
+"""
+import json
+import sys
+import time
+
+from .Mahjong import MahjongServer
+
+
+class ReplayMismatch(Exception):
+    """重放得到的结果与记录不一致 (引擎的行为发生了变化，或记录不完整)"""
+    pass
+
+
+def replay(record, check=True):
+    """
+    按记录重放一局，返回结束时的 MahjongServer。
+    :param check: 为 True 时逐项核对摸到的牌、裁决结果和引擎重新生成的记录，不一致时抛出 ReplayMismatch。
+    """
+    game = MahjongServer(playersnames=record['players'], seed=record['seed'])
+    game.gamerule.update(record['gamerule'])
+    if 'sort_rule' in record:
+        game.sort_rule = dict(record['sort_rule'])
+    game.start(dice=record['dice'])
+    players = game.players
+
+    for n, event in enumerate(record['events']):
+        code, player_id = event[0], event[1]
+        if code in ('D', 'B'):
+            game.turntonext(actor_id=player_id)
+            tile = game.new_tile(from_back=code == 'B')
+            if check and tile != event[2]:
+                raise ReplayMismatch(f"第 {n} 项: 摸到 {tile}，记录为 {event[2]}")
+        elif code == 'X':
+            player = players[player_id]
+            tile_id = player.tileset.ids[event[2]]
+            # 手牌中有这张就打手牌中的，否则打新摸的牌；两者打完后的手牌相同
+            index = sum(player.counts[:tile_id]) if player.counts[tile_id] else player.hand_count
+            game.turntonext(actor_id=player_id)
+            game.perform_discard(player_id, index)
+        elif code == 'C':
+            data = {'action': event[2]}
+            if len(event) > 3:
+                data['tiles'] = event[3]
+            game.submit_claim(player_id, data)
+        elif code == 'R':
+            result = game.process_submitted_claims()
+            actor_id = result['id'] if result else None
+            if check and actor_id != player_id:
+                raise ReplayMismatch(f"第 {n} 项: 裁决结果为 {actor_id}，记录为 {player_id}")
+            if result and game.status != 'finished':
+                game.turntonext(actor_id=actor_id)
+        elif code == 'E':
+            if game.status != 'finished':
+                game.endgame(winner_id=player_id, reason=event[2])
+        else:
+            raise ReplayMismatch(f"第 {n} 项: 未知的动作代码 {code}")
+
+    if check:
+        events = [list(event) for event in game.replay_log]
+        if events != [list(event) for event in record['events']]:
+            raise ReplayMismatch("重放生成的动作记录与原记录不一致")
+    return game
+
+
+def save(record, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(paths):
+    for path in paths:
+        record = load(path)
+        start = time.perf_counter()
+        game = replay(record)
+        elapsed = time.perf_counter() - start
+        winner = game.players[game.winner_id].name if game.winner_id is not None else '荒庄'
+        print(f"{path}: {len(record['events'])} 个动作, 胜者 {winner}, 重放耗时 {elapsed * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,9 +1,15 @@
+import os
 import uuid
 from datetime import datetime
 import time
 from . import Mahjong
-import random
-import logging
+from . import MahjongReplay
+from .MahjongDelta import StateStream
+from .MahjongExecutor import EngineExecutor
+from .MahjongMetrics import metrics, WINDOW_BUCKETS
+from .MahjongLog import EventLogger
+from .MahjongPayload import CachedPayload
+from .MahjongTimer import timer_wheel
 
 # ... (_replacements, NotAcceptTime, AlreadyActed 定义不变) ...
 _replacements = {
@@ -15,6 +21,12 @@ _replacements = {
     'plum': '🀢', 'orchid': '🀣', 'bamboo': '🀤', 'chrysanthemum': '🀥'
 }
 
+log = EventLogger('room')
+
+room_event_seconds = metrics.histogram('mahjong_room_event_seconds', '房间收件箱处理一个事件的用时', ('handler',))
+room_wait_seconds = metrics.histogram('mahjong_room_wait_seconds', '事件在房间收件箱中等待的时间')
+claim_window_seconds = metrics.histogram('mahjong_claim_window_seconds', '宣告阶段从出牌到结算的时间', ('outcome',), WINDOW_BUCKETS)
+
 class NotAcceptTime(Exception):
     """自定义异常，表示在错误的时间执行了操作。"""
     pass
@@ -26,22 +38,32 @@ class AlreadyActed(Exception):
 
 class MahjongRoom:
     # ... (__init__, 房间管理方法, 状态广播方法等保持不变) ...
-    def __init__(self, name, password, sio_server, owner_sid, owner_name, id=None):
+    max_inbound = 64  # 收件箱中最多排队的客户端事件数，超过时 offer 直接拒绝 (定时器等内部事件不受限制)
+
+    def __init__(self, name, password, sio_server, owner_sid, owner_name, id=None, lobby=None, sessions=None, engine=None):
         """
         初始化一个麻将房间。
 
         :param name: 房间名称。
         :param password: 房间密码 (可以是None)。
-        :param sio_server: Socket.IO服务器实例。
+        :param sio_server: Socket.IO 服务器的调度层 (MahjongRuntime.Runtime)。
         :param owner_sid: 创建者的 session ID。
         :param owner_name: 创建者的名称。
         :param id: 房间的唯一ID, 如果为None则自动生成。
+        :param lobby: 大厅 (MahjongLobby.Lobby)，房间信息变化时通知它更新房间列表。
+        :param sessions: 会话登记表 (MahjongSessions.SessionRegistry)，成员加入和离开时更新其中的房间索引。
+        :param engine: 引擎计算的执行层 (MahjongExecutor.EngineExecutor)，出牌提示等耗时的计算交给它，默认在事件循环中直接计算。
         """
         self.sio = sio_server
+        self.lobby = lobby
+        self.sessions = sessions
+        self.engine = engine or EngineExecutor()
+        self.info_version = 0  # 房间信息 (成员、规则、状态) 的版本号，用于缓存编码好的消息
+        self.payload_cache = {}  # {'room_info' | 'public_snapshot': (版本号, CachedPayload)}
         self.name = name
         self.game = 'mahjong'
         self.log = ''
-        self.id = id if id else str(uuid.uuid4())
+        self.id = id if id else str(uuid.uuid4())  # 必须在设置 status 之前，touch 需要用到
         self.password = password
         self.owner = owner_name
         self.winner = None
@@ -51,7 +73,29 @@ class MahjongRoom:
         self.game_instance = None
         self.created_time = datetime.now().isoformat()
         self.tmp_discarder = None  # 临时存储刚出牌的玩家ID，确保此时谁都无法出牌
-        self.action_history = {} # 检测有无执行， time.time() 作为 key, value 为 boolean
+        self.claim_window = None  # 当前宣告阶段的 action_time，宣告结算后为 None
+
+        # 收件箱: 玩家的游戏动作和定时器到期都作为事件放进同一个队列，由一个任务按顺序处理，
+        # 所有修改 game_instance 的代码都在这个任务里运行，不会互相穿插
+        self.mailbox = None
+        self.closed = False  # close() 之后不再接收事件，也不会重新创建收件箱
+        self.mailbox_stats = {'processed': 0, 'max_depth': 0, 'wait': 0.0, 'max_wait': 0.0, 'busy': 0.0, 'max_busy': 0.0, 'shed': 0, 'dropped': 0}
+
+        # 定时器: 出牌超时、宣告窗口、开局倒计时等都登记在全进程共用的时间轮上，到期时把事件放进收件箱
+        self.timers = {}  # {'turn' | 'claim' | 'countdown' | 'return': (序号, Timer)}
+        self.timer_seq = 0
+
+        # 游戏状态按版本号增量广播: 公共状态一路，每个玩家的私有状态各一路
+        self.state_version = 0
+        self.public_stream = StateStream()
+        self.private_streams = {}  # {player_id: StateStream}
+
+        # 发件箱: 收件箱处理一个事件期间要发送的消息先收集起来，事件处理完后每个接收者只发送一帧
+        self.outbox = None  # 处理事件期间为 [(接收者, 事件名, 数据)]，其余时间为 None，消息直接发送
+        self.state_dirty = False  # 处理事件期间调用过 update_clients，发送时只计算一次状态
+        self.pending_report = None
+        self.broadcast_stats = {'actions': 0, 'messages': 0, 'frames': 0}
+        self.turn_seq = 0  # 每轮到一个玩家出牌加一，过期的出牌超时据此忽略
         
         # 默认游戏规则
         self.rules = {
@@ -84,6 +128,9 @@ class MahjongRoom:
         # members 为游戏前，Players 为游戏中
         self.sio.enter_room(sid, self.id)
         self.members[sid] = {'name': name, 'ready': False, 'ip': ip_address, 'decorator': None}
+        if self.sessions is not None:
+            self.sessions.join_room(sid, self.id)
+        self.touch()
         self.update_clients(f"{name} 加入房间")
  
 
@@ -92,11 +139,43 @@ class MahjongRoom:
         if sid in self.members:
             name = self.members[sid]['name']
             del self.members[sid]
+            if self.sessions is not None:
+                self.sessions.leave_room(sid)
+            self.touch()
             self.sio.leave_room(sid, self.id)
             self.update_clients(f"{name} 离开房间")
             return name
         return None
 
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        self._status = value
+        self.touch()
+
+    def touch(self):
+        """房间信息发生了变化: 缓存的房间信息失效，并通知大厅更新房间列表"""
+        self.info_version += 1
+        if self.lobby is not None:
+            self.lobby.mark(self.id)
+
+    def cached_payload(self, key, version, build):
+        """同一版本的消息只构建和编码一次"""
+        cached = self.payload_cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, CachedPayload(build()))
+            self.payload_cache[key] = cached
+        return cached[1]
+
+    def member_sids(self):
+        """房间成员的 sid，按加入顺序。有会话登记表时直接查它的房间索引"""
+        if self.sessions is not None:
+            return self.sessions.sids_in(self.id)
+        return list(self.members)
+
     def get_member_count(self):
         """返回当前房间人数。"""
         return len(self.members)
@@ -108,14 +187,16 @@ class MahjongRoom:
     def modify_rules(self, new_rules, sid):
         """修改房间规则。"""
         self.rules.update(new_rules)
+        self.touch()
         self.log = f"{datetime.now().isoformat()} {self.members[sid]['name']} 修改了房间规则"
-        logging.info(f"✅ 房间 {self.name} 的规则已更新: {self.rules}")
+        log.info('rules', room=self.name, rules=self.rules)
         self.update_clients("房间规则已更新")
 
     def set_player_ready(self, sid, is_ready):
         """设置玩家的准备状态。"""
         if sid in self.members:
             self.members[sid]['ready'] = is_ready
+            self.touch()
             log_msg = f"{self.members[sid]['name']} {'准备' if is_ready else '取消准备'}"
             self.update_clients(log_msg)
             self.check_all_ready_to_start()
@@ -125,7 +206,109 @@ class MahjongRoom:
         if self.status != 'waiting':
             return
         if self.get_member_count() == self.rules['max players'] and all(m['ready'] for m in self.members.values()):
-            self.sio.start_background_task(self._start_game_countdown)
+            if 'countdown' not in self.timers:
+                self._start_game_countdown()
+
+    # --- 收件箱 ---
+    def post(self, handler, *args):
+        """
+        把事件放进收件箱，稍后由收件箱任务调用 handler(*args)。第一次调用时创建队列并启动任务。
+        房间已经关闭时丢弃事件并返回 False。
+        """
+        if self.closed:
+            self.mailbox_stats['dropped'] += 1
+            log.debug('post_after_close', room=self.name, handler=getattr(handler, '__name__', handler))
+            return False
+        if self.mailbox is None:
+            self.mailbox = self.sio.create_mailbox(self._process)
+        self.mailbox.put((time.perf_counter(), handler, args))
+        self.mailbox_stats['max_depth'] = max(self.mailbox_stats['max_depth'], self.mailbox.qsize())
+        return True
+
+    def offer(self, handler, *args):
+        """
+        放入客户端发来的事件。收件箱中已经有 max_inbound 个事件在排队时不放入并返回 False，
+        一个刷屏的客户端只会让自己的房间拒绝事件，不会让积压无限增长。房间已经关闭时同样返回 False。
+        """
+        if self.mailbox is not None and self.mailbox.qsize() >= self.max_inbound:
+            self.mailbox_stats['shed'] += 1
+            return False
+        return self.post(handler, *args)
+
+    def close(self):
+        """
+        房间解散时取消所有定时器并停止收件箱任务 (已经在队列中的事件会先处理完)。
+        之后 post / offer 的事件都被丢弃，不会重新创建收件箱和任务。
+        """
+        self.closed = True
+        self.touch()
+        for name in list(self.timers):
+            self.cancel_timer(name)
+        if self.mailbox is not None:
+            self.mailbox.put(None)
+            self.mailbox = None
+
+    def _process(self, item):
+        """收件箱任务处理一个事件"""
+        stats = self.mailbox_stats
+        posted, handler, args = item
+        start = time.perf_counter()
+        self.outbox = []
+        try:
+            handler(*args)
+        except Exception:
+            log.logger.exception(f"房间 {self.name} 处理事件 {getattr(handler, '__name__', handler)} 时出错")
+        finally:
+            self.flush()
+        done = time.perf_counter()
+        target = args[2] if handler == self._run_timer else handler  # 定时器事件按实际的处理函数统计
+        room_event_seconds.observe(done - start, getattr(target, '__name__', 'unknown'))
+        room_wait_seconds.observe(start - posted)
+        stats['processed'] += 1
+        stats['wait'] += start - posted
+        stats['max_wait'] = max(stats['max_wait'], start - posted)
+        stats['busy'] += done - start
+        stats['max_busy'] = max(stats['max_busy'], done - start)
+
+    def get_mailbox_stats(self):
+        """收件箱的队列深度和处理延迟 (wait 为事件在队列中等待的时间，busy 为处理用时，单位毫秒)"""
+        stats = self.mailbox_stats
+        processed = stats['processed'] or 1
+        return {
+            'depth': self.mailbox.qsize() if self.mailbox is not None else 0,
+            'max_depth': stats['max_depth'],
+            'processed': stats['processed'],
+            'shed': stats['shed'],
+            'dropped': stats['dropped'],
+            'avg_wait_ms': stats['wait'] / processed * 1e3,
+            'max_wait_ms': stats['max_wait'] * 1e3,
+            'avg_busy_ms': stats['busy'] / processed * 1e3,
+            'max_busy_ms': stats['max_busy'] * 1e3,
+        }
+
+    # --- 定时器 ---
+    def set_timer(self, name, delay, handler, *args):
+        """delay 秒后把 handler(*args) 放进收件箱。同名的定时器只保留最新的一个"""
+        self.cancel_timer(name)
+        timer_wheel.ensure_running(self.sio)
+        self.timer_seq += 1
+        self.timers[name] = (self.timer_seq, timer_wheel.call_later(delay, self._fire_timer, name, self.timer_seq, handler, args))
+
+    def cancel_timer(self, name):
+        entry = self.timers.pop(name, None)
+        if entry is not None:
+            entry[1].cancel()
+
+    def _fire_timer(self, name, seq, handler, args):
+        """在时间轮的任务中执行，只负责转交给收件箱"""
+        self.post(self._run_timer, name, seq, handler, args)
+
+    def _run_timer(self, name, seq, handler, args):
+        entry = self.timers.get(name)
+        if entry is None or entry[0] != seq:
+            return  # 触发后、处理前被取消或替换了
+        del self.timers[name]
+        handler(*args)
 
     # --- 状态广播 ---
     def get_room_state(self):
@@ -141,49 +324,153 @@ class MahjongRoom:
             'log': self.log
         }
 
+    # --- 发件箱 ---
+    def emit(self, event, data, room):
+        """发送消息。收件箱处理事件期间先放进发件箱，由 flush 合并发送"""
+        if self.outbox is None:
+            self.sio.emit(event, data, room=room)
+            self.broadcast_stats['messages'] += 1
+            self.broadcast_stats['frames'] += 1
+        else:
+            self.outbox.append((room, event, data))
+            self.broadcast_stats['messages'] += 1
+
+    def flush(self):
+        """发送发件箱中的消息: 每个接收者一帧，多条消息合并为一个 batch 事件"""
+        self._flush_state()
+        outbox, self.outbox = self.outbox, None
+        if not outbox:
+            return
+        stats = self.broadcast_stats
+        stats['actions'] += 1
+        if all(room == self.id for room, _, _ in outbox):
+            recipients = [self.id]  # 只有广播，整个房间共用一帧
+        else:
+            recipients = self.member_sids() + [room for room, _, _ in outbox if room != self.id and room not in self.members]
+            recipients = list(dict.fromkeys(recipients))
+        for recipient in recipients:
+            if recipient == self.id:
+                messages = [(event, data) for _, event, data in outbox]
+            elif recipient in self.members:
+                messages = [(event, data) for room, event, data in outbox if room == self.id or room == recipient]
+            else:
+                messages = [(event, data) for room, event, data in outbox if room == recipient]
+            if not messages:
+                continue
+            if len(messages) == 1:
+                self.sio.emit(messages[0][0], messages[0][1], room=recipient)
+            else:
+                self.sio.emit('batch', {'messages': messages}, room=recipient)
+            stats['frames'] += 1
+
+    def _flush_state(self):
+        """把处理事件期间推迟的 update_clients 合并成一次状态更新放进发件箱"""
+        if self.state_dirty:
+            self.state_dirty = False
+            report, self.pending_report = self.pending_report, None
+            counted = self.broadcast_stats['messages']  # update_clients 已经按不合并时的消息数计过
+            self._send_state(report)
+            self.broadcast_stats['messages'] = counted
+
+    def get_broadcast_stats(self):
+        """每个动作 (产生了消息的事件) 平均发送的消息数和实际发出的帧数"""
+        stats = self.broadcast_stats
+        actions = stats['actions'] or 1
+        return {
+            'actions': stats['actions'],
+            'messages': stats['messages'],
+            'frames': stats['frames'],
+            'messages_per_action': stats['messages'] / actions,
+            'frames_per_action': stats['frames'] / actions,
+        }
+
+    def get_room_info_payload(self):
+        """房间成员信息，每个版本只编码一次"""
+        return self.cached_payload('room_info', self.info_version, lambda: {"success": True, "message": "获取成功", "members": self.members})
+
     def update_clients(self, log_message=None):
         """
         根据游戏状态，向客户端广播房间或游戏的最新状态。
+        收件箱处理事件期间只做标记，事件处理完后合并为一次更新。
         """
-        logging.info(f"142 update_clients 广播房间/游戏状态更新, log_message: {log_message}")
+        if self.outbox is not None:
+            self.state_dirty = True
+            if log_message:
+                self.pending_report = log_message
+            # 不合并时每次调用要发送的消息数，用于和实际发出的帧数对比
+            self.broadcast_stats['messages'] += 1 + (len(self.game_instance.players) if self.status == 'playing' and self.game_instance else 0)
+            return
+        self._send_state(log_message)
+
+    def _send_state(self, log_message):
+        log.debug('update', every=20, room=self.name, message=log_message)
         # --- 情况1: 游戏正在进行中 ---
         if self.status == 'playing' and self.game_instance:
             # 获取公共游戏状态
             public_state = self.game_instance.getgamestate()
             if log_message:
                 public_state['report'] = log_message
+            self.state_version += 1
             
-            # 广播公共游戏状态
-            self.sio.emit('game_state_update', public_state, room=self.id)
+            # 广播公共游戏状态 (只包含与上一版本相比的变化)
+            message = self.public_stream.update(public_state, self.state_version)
+            if message:
+                self.emit('game_state_update', CachedPayload(message), room=self.id)
 
-            # 向每个玩家分别发送其私有游戏状态
+            # 向每个玩家分别发送其私有游戏状态，没有变化的玩家不发送
             for p in self.game_instance.players:
                 private_state = self.game_instance.getgamestate(playerid=p.id)
                 player_sid = self.player_id_to_sid.get(p.id)
-                if player_sid:
-                    self.sio.emit('private_state_update', private_state, room=player_sid)
+                message = self.private_streams[p.id].update(private_state, self.state_version)
+                if player_sid and message:
+                    self.emit('private_state_update', message, room=player_sid)
         
         # --- 情况2: 游戏处于等待或结束状态 ---
         elif self.status == 'finished' and self.game_instance: # 这段代码现阶段不会执行
             # 游戏已结束，暴露所有玩家的手牌
             hands = {p.id: p.hands for p in self.game_instance.players}
-            self.sio.emit('expose_hands', hands, room=self.id)
+            self.emit('expose_hands', hands, room=self.id)
         else:
             # 如果提供了日志消息，更新房间的日志
             if log_message:
                 self.log = f"{datetime.now().isoformat()} {log_message}"
             
             # 广播房间大厅的状态
-            self.sio.emit('room_info_update', {"success": True,"message": "获取成功", "members": self.members}, room=self.id)
+            self.emit('room_info_update', self.get_room_info_payload(), room=self.id)
+
+    def send_state_snapshot(self, sid):
+        """客户端的版本与收到的增量对不上时 (刚加入、断线重连) 请求完整快照"""
+        if self.status != 'playing' or self.public_stream.last is None:
+            return
+        self.emit('game_state_update', self.cached_payload('public_snapshot', self.public_stream.version, self.public_stream.current), room=sid)
+        player_id = self.sid_to_player_id.get(sid)
+        if player_id is not None:
+            self.emit('private_state_update', self.private_streams[player_id].current(), room=sid)
+
+    def request_hint(self, sid):
+        """出牌提示: 交给引擎执行层计算，结果回到收件箱后只发给请求的玩家"""
+        player_id = self.sid_to_player_id.get(sid)
+        if player_id is None or self.status != 'playing':
+            return
+        turn = self.turn_seq
+        self.engine.submit('hint', Mahjong.discard_hint, self.game_instance.hint_args(player_id),
+                           lambda result, error: self.post(self._send_hint, sid, turn, result, error))
+
+    def _send_hint(self, sid, turn, result, error):
+        if error is not None:
+            self.emit('hint_result', {'success': False, 'message': str(error)}, room=sid)
+        elif turn != self.turn_seq or self.status != 'playing':
+            self.emit('hint_result', {'success': False, 'message': '牌局已经变化，请重新获取提示'}, room=sid)
+        else:
+            self.emit('hint_result', {'success': True, 'options': result[:5]}, room=sid)
 
     # --- 游戏核心逻辑 ---
     def handle_player_action(self, sid, data):
         """处理来自客户端的游戏内动作，充当控制器角色。"""
-        logging.info('179 handle_player_action 收到玩家动作请求')
         action_type = data.get('action')
         player_id = self.sid_to_player_id.get(sid)
         if player_id is None: return
-        print('Player: ', player_id, 'Action: ', action_type, data)  # --- IGNORE ---
+        log.debug('action', room=self.name, player=player_id, data=data)
 
         try:
             if self.status != 'playing':
@@ -196,7 +483,6 @@ class MahjongRoom:
             if action_type == 'discard':
                 self._handle_discard(player_id, data)
             elif action_type == 'hu' and is_self_draw_action:
-                logging.info('_handle_self_drawn_hu 处理自摸胡请求')
                 self._handle_self_drawn_hu(player_id)
             # elif action_type == 'kong' and is_self_dark_kong_action:
             #     logging.info('_handle_self_dark_kong 处理自摸暗杠请求')
@@ -204,76 +490,86 @@ class MahjongRoom:
             # --- 结束新增分支 ---
             elif action_type in ['hu', 'pong', 'kong', 'chow']:
                 self._handle_claim(sid, player_id, data)
+            elif action_type == 'pass':
+                self._handle_pass(sid, player_id)
             else:
                 raise ValueError("未知的游戏操作")
                 
-        except (ValueError, NotAcceptTime, AlreadyActed) as e:
+        except (ValueError, NotAcceptTime, AlreadyActed, Mahjong.NotAcceptTime, Mahjong.AlreadyActed) as e:  # 引擎抛出的是 Mahjong 模块中的同名异常
             player_name = self.members.get(sid, {}).get('name', '未知玩家')
-            logging.warning(f"玩家 {player_id} ({player_name}) 操作无效: {e}")
-            self.sio.emit('game_action_result', {'success': False, 'message': str(e)}, room=sid)
+            log.info('invalid_action', room=self.name, player=player_name, action=action_type, error=e)
+            self.emit('game_action_result', {'success': False, 'message': str(e)}, room=sid)
 
     # --- 新增函数：处理自摸胡 ---
     def _handle_self_drawn_hu(self, player_id):
         """立即处理玩家的自摸胡动作。"""
-        logging.info('_handle_self_drawn_hu')
         player = self.game_instance.players[player_id]
         # 再次验证是否真的能胡
         if player.can_hu(player.new, self.game_instance.sort_rule, self.game_instance.gamerule):
-            logging.info(f"玩家 {player.name} 确认自摸胡牌。")
             # 直接调用游戏结束逻辑
             self.game_instance.endgame(winner_id=player_id, reason='self_drawn_hu')
             self.end_game(f"玩家 {player.name} 自摸胡牌！")
         else:
             # 如果因为某些原因客户端发送了错误的请求，记录日志并忽略
-            logging.warning(f"玩家 {player.name} 尝试自摸胡牌，但验证失败。")
-            self.sio.emit('game_action_result', {'success': False, 'message': '无效的胡牌操作'}, room=self.player_id_to_sid.get(player_id))
+            log.warning('invalid_self_drawn_hu', room=self.name, player=player.name)
+            self.emit('game_action_result', {'success': False, 'message': '无效的胡牌操作'}, room=self.player_id_to_sid.get(player_id))
     def _handle_self_dark_kong(self, player_id):
-        logging.info('_handle_self_dark_kong')
         player = self.game_instance.players[player_id]
-        self.game_instance.new_tile()
-        self.sio.emit('game_action_result', {'success': True, 'name': player.name, 'type': 'kong', 'message': f'玩家 {player.name} 完成了 暗杠'}, room=self.id)
+        self.game_instance.new_tile(from_back=True)
+        self.emit('game_action_result', {'success': True, 'name': player.name, 'type': 'kong', 'message': f'玩家 {player.name} 完成了 暗杠'}, room=self.id)
         self.update_clients(f"玩家 {player.name} 执行了 暗杠 操作。")
-        logging.info(f"玩家 {player.name} 确认暗杠。")
 
 
     def _handle_discard(self, player_id, data):
         """处理出牌动作，调用游戏引擎并处理结果。"""
-        logging.info('224 _handle_discard')
         tile_index = data.get('tileindex')
         result = self.game_instance.perform_discard(player_id, tile_index)
+        self.cancel_timer('turn')
         
         player_name = self.game_instance.players[player_id].name
         discarded_char = _replacements.get(result['tile'], result['tile'])
         self.update_clients(f"玩家 {player_name} 打出了: {discarded_char}")
-        self.sio.emit('game_action_result', {'success': True, 'type': 'discard', 'name': player_name, 'message': f'{player_name} 打出了 {discarded_char}'}, room=self.id)
+        self.emit('game_action_result', {'success': True, 'type': 'discard', 'name': player_name, 'message': f'{player_name} 打出了 {discarded_char}'}, room=self.id)
 
         if result['claims_pending']:
             action_time = time.time()
-            self.action_history[action_time] = False # 标记当前有玩家可以响应
-            print('有玩家可以响应，等待响应...') 
             self.tmp_discarder = self.game_instance.playerindex
             self.game_instance.playerindex = 5
+            self.claim_window = action_time
             self.update_clients(f"玩家 {player_name} 出牌后，等待其他玩家响应...")
-            self.sio.start_background_task(self._process_claims_after_delay, action_time, True)
+            self.set_timer('claim', self.rules.get('special delay', 5) or 0, self._resolve_claims, action_time)
         else:
-            print('没有玩家可以响应，直接下一个')
-            self.sio.start_background_task(self._transition_to_next_turn)
+            self.post(self._transition_to_next_turn)
 
     def _handle_claim(self, sid, player_id, data):
         """处理宣告动作，调用游戏引擎并通知客户端。"""
-        logging.info('244 _handle_claim')
         if self.game_instance.playerindex == 5:
-            self.game_instance.submit_claim(player_id, data) # 以后可以添加返回值以确认是否是最高优先级的动作，如果是则直接执行一个 delay 为 false 的 process_claims_after_delay
-            self.sio.emit('game_action_result', {'success': True, 'message': '操作已提交，等待其他玩家...'}, room=sid)
+            decided = self.game_instance.submit_claim(player_id, data)
+            self.emit('game_action_result', {'success': True, 'message': '操作已提交，等待其他玩家...'}, room=sid)
+            if decided:  # 其他玩家已经无法改变结果，不必等到 special delay 结束
+                self._resolve_claims(self.claim_window)
         else: 
-            logging.warning(f"玩家 {player_id} 试图在非响应时间宣告。")    
+            log.debug('late_claim', room=self.name, player=player_id)
+
+    def _handle_pass(self, sid, player_id):
+        """玩家放弃宣告。所有有资格的玩家都表态后立即结算"""
+        if self.game_instance.playerindex != 5:
+            return  # 自摸时选择「过」直接出牌即可
+        decided = self.game_instance.pass_claim(player_id)
+        if decided is None:
+            return
+        self.emit('game_action_result', {'success': True, 'message': '已选择过'}, room=sid)
+        if decided:
+            self._resolve_claims(self.claim_window)
 
-    def _process_claims_after_delay(self, action_time, delay: bool):
-        """在延迟后处理所有已提交的宣告。"""
-        logging.info("249 _process_claims_after_delay 处理玩家宣告前的延迟...")
-        delay = self.rules.get('special delay', 5)
-        if delay:
-            self.sio.sleep(delay)
+    def _resolve_claims(self, action_time):
+        """结算一次宣告阶段，每个 action_time 只结算一次 (提前结算和延迟到期都会调用)"""
+        if action_time is None or action_time != self.claim_window or self.status != 'playing':
+            return
+        self.claim_window = None
+        # 定时器还在说明所有玩家都已表态、提前结算，否则是等到了 special delay
+        claim_window_seconds.observe(time.time() - action_time, 'early' if 'claim' in self.timers else 'timeout')
+        self.cancel_timer('claim')
         game = self.game_instance
         
         if self.tmp_discarder is not None:
@@ -299,22 +595,20 @@ class MahjongRoom:
             
             game.turntonext(actor_id=actor_id)
             if action_type == 'kong':
-                game.new_tile()
-            self.sio.emit('game_action_result', {'success': True, 'name': actor_player.name, 'type': action_type, 'message': f'玩家 {actor_player.name} 完成了 {action_type}'}, room=self.id)
+                game.new_tile(from_back=True)
+            self.emit('game_action_result', {'success': True, 'name': actor_player.name, 'type': action_type, 'message': f'玩家 {actor_player.name} 完成了 {action_type}'}, room=self.id)
             self.update_clients(f"玩家 {actor_player.name} 执行了 {action_type} 操作。")
             if not actor_player.hands:
                 self.end_game("荒庄(有玩家无牌可打)")
                 return
-            self.action_history[action_time] = True # 标记此轮有玩家执行了动作, 以后可以添加更纤细的记录
+            self._start_turn_timer()
         else: # 没有人执行动作
             if game.status == 'playing':
                  self._transition_to_next_turn()
-                 del self.action_history[action_time] # 清理记录
 
 
     def _transition_to_next_turn(self):
         """轮到下一位玩家。"""
-        logging.info("289 _transition_to_next_turn 轮到下一位玩家...")
         game = self.game_instance
         if not game.wall:
             self.end_game("牌墙已空，游戏荒庄！")
@@ -328,9 +622,7 @@ class MahjongRoom:
         if not newly_drawn_tile:
             self.end_game("牌墙已空，游戏荒庄！")
             return
-            
-        logging.info(f"玩家 {next_player.name} 摸到了: {newly_drawn_tile}")
-        
+
         # 检查自摸
         if next_player.can_hu(newly_drawn_tile, game.sort_rule, game.gamerule):
             game.pending_claims = {'hu': {next_player_id: 0}}
@@ -338,8 +630,8 @@ class MahjongRoom:
             if next_player.actions is None:
                 next_player.actions = {}
             next_player.actions['hu'] = True
-            logging.info(f"玩家 {next_player.name} 可以自摸胡牌。")
             self.update_clients(f"轮到玩家 {next_player.name} 摸牌。")
+            self._start_turn_timer()
             return
         # if next_player.can_kong(newly_drawn_tile):
         #     game.pending_claims = {'kong': {next_player_id: 5}}
@@ -356,15 +648,32 @@ class MahjongRoom:
         #     logging.info(f"玩家 {next_player.name} 可以杠牌。")
 
         self.update_clients(f"轮到玩家 {next_player.name} 摸牌。")
+        self._start_turn_timer()
+
+    def _start_turn_timer(self):
+        """当前玩家需要出牌，stand delay 秒内没有出牌则自动打出一张 (stand delay 为 0 时不限时)"""
+        self.turn_seq += 1
+        delay = self.rules.get('stand delay')
+        if delay:
+            self.set_timer('turn', delay, self._auto_discard, self.game_instance.playerindex, self.turn_seq)
+        else:
+            self.cancel_timer('turn')
+
+    def _auto_discard(self, player_id, seq):
+        """出牌超时: 替玩家打出刚摸的牌 (没有新牌时打出最后一张)"""
+        game = self.game_instance
+        if self.status != 'playing' or seq != self.turn_seq or game.playerindex != player_id:
+            return
+        log.debug('auto_discard', room=self.name, player=game.players[player_id].name)
+        self._handle_discard(player_id, {'tileindex': None})
 
 
     def end_game(self, reason):
         """结束当前游戏。"""
         if self.status == 'finished':
             return
-        
-        logging.info(f"320 end_game 游戏结束: {reason}")
-        
+        self._flush_state()  # 本局最后的状态要在状态变为 finished 之前算出来
+        log.info('end_game', room=self.name, reason=reason)
         winner_name = "荒庄"
         if self.game_instance and self.game_instance.winner_id is not None:
             winner_name = self.game_instance.players[self.game_instance.winner_id].name
@@ -372,30 +681,55 @@ class MahjongRoom:
         # 确保游戏引擎状态也设置为 'finished'
         if self.game_instance and self.game_instance.status != 'finished':
             self.game_instance.endgame(reason=reason)
+        self.save_replay()
             
         self.status = 'finished'
-        self.sio.emit('game_over', {'success': True, 'reason': reason, 'winner': winner_name}, room=self.id)
-        self.sio.sleep(3)
+        self.cancel_timer('turn')
+        self.cancel_timer('claim')
+        self.emit('game_over', {'success': True, 'reason': reason, 'winner': winner_name}, room=self.id)
+        # 展示结果 3 秒后回到等待状态
+        self.set_timer('return', 3, self._return_to_waiting, reason, winner_name)
+
+    def _return_to_waiting(self, reason, winner_name):
+        if self.status != 'finished':
+            return
         self.status = 'waiting'
         for p in self.members.values():
             p['ready'] = False
-        logging.info(f"取消玩家的准备状态, {self.members}")
-        self.sio.emit('chat_message', {'type': 'log', 'level': 'info', 'message': f'游戏结束！{reason}。胜利者: {winner_name}'}, room=self.id) 
+        self.emit('chat_message', {'type': 'log', 'level': 'info', 'message': f'游戏结束！{reason}。胜利者: {winner_name}'}, room=self.id) 
         self.update_clients(f"游戏结束！{reason}。胜利者: {winner_name}")
 
-    def _start_game_countdown(self):
-        """游戏开始倒计时。"""
-        logging.info(f"341 _start_game_countdown 房间 {self.name} 准备开始倒计时...")
+    def save_replay(self):
+        """设置了环境变量 MAHJONG_REPLAY_DIR 时，把本局的复现记录保存到该目录"""
+        directory = os.environ.get('MAHJONG_REPLAY_DIR')
+        if not directory or not self.game_instance:
+            return
+        path = os.path.join(directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{self.id}.json")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            MahjongReplay.save(self.game_instance.export_replay(), path)
+            log.info('replay_saved', room=self.name, path=path, seed=self.game_instance.seed)
+        except OSError as e:
+            log.warning('replay_failed', room=self.name, error=e)
+
+    def _start_game_countdown(self, seconds=3):
+        """游戏开始倒计时，每秒由时间轮触发一次，结束后开局。"""
+        if seconds == 3:
+            log.info('countdown', room=self.name)
+        if seconds <= 0:
+            self._finish_countdown()
+            return
+        self.emit('chat_message', {
+            'type': 'log',
+            'level': 'info',
+            'message': f"游戏将在 {seconds} 秒后开始..."
+            }, room=self.id)
+        self.set_timer('countdown', 1, self._start_game_countdown, seconds - 1)
+
+    def _finish_countdown(self):
+        if self.status != 'waiting':
+            return
         self.game_instance = None # 重置游戏实例
-
-        for i in range(3, 0, -1):
-            self.sio.emit('chat_message', {
-                'type': 'log',
-                'level': 'info',
-                'message': f"游戏将在 {i} 秒后开始..."
-                }, room=self.id)
-            self.sio.sleep(1)
-
         # 倒计时结束后再次检查状态，防止有玩家退出
         if self.get_member_count() != self.rules['max players'] or not all(m['ready'] for m in self.members.values()):
             self.update_clients("有玩家取消准备或离开，游戏开始已取消")
@@ -409,16 +743,18 @@ class MahjongRoom:
         if self.status == 'playing':
             return
 
-        player_sids = list(self.members.keys())
+        player_sids = self.member_sids()
         player_names = [self.members[sid]['name'] for sid in player_sids]
         
         self.game_instance = Mahjong.MahjongServer(playersnames=player_names)
         self.status = 'playing'
         self.sid_to_player_id = {sid: i for i, sid in enumerate(player_sids)}
         self.player_id_to_sid = {i: sid for sid, i in self.sid_to_player_id.items()}
+        self.public_stream = StateStream()
+        self.private_streams = {i: StateStream() for i in self.player_id_to_sid}
 
-        # 1. 初始化游戏引擎
-        self.game_instance.start(dice=random.randint(2, 12))
+        # 1. 初始化游戏引擎 (骰子由本局的随机种子决定，便于复现)
+        self.game_instance.start()
         
         # 2. 庄家摸开局第一张牌
         dealer = self.game_instance.players[self.game_instance.playerindex]
@@ -426,15 +762,16 @@ class MahjongRoom:
 
         # 3. 为每个玩家单独发送初始化信息
         golden_tile = self.game_instance.golden_tile
-        self.sio.emit('chat_message', {'type': 'log', 'level': 'info', 'message': f'本局游戏金牌是 {_replacements.get(golden_tile, golden_tile)}'}, room=self.id)
+        self.emit('chat_message', {'type': 'log', 'level': 'info', 'message': f'本局游戏金牌是 {_replacements.get(golden_tile, golden_tile)}'}, room=self.id)
         for p in self.game_instance.players:
             player_sid = self.player_id_to_sid.get(p.id)
             if player_sid:
-                self.sio.emit('game_initialized', {
+                self.emit('game_initialized', {
                     'my_id': p.id
                 }, room=player_sid)
 
         # 4. 广播公共状态并通知庄家出牌
         golden_tile_char = _replacements.get(golden_tile, golden_tile)
         self.update_clients(f"游戏开始！金牌是 {golden_tile_char}。")
+        self._start_turn_timer()
         # self._notify_player_to_discard(dealer.id)
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Socket.IO 服务器的调度层。
+
+房间、大厅和时间轮只通过 Runtime 发送消息、加入/离开 Socket.IO 房间和启动后台任务，不直接依赖 eventlet 或 asyncio，
+同一套逻辑既可以运行在 socketio.Server (eventlet / 线程，WSGI) 上，也可以运行在 socketio.AsyncServer (asyncio，ASGI) 上。
+
+Runtime 的方法都不阻塞，可以在同步代码中调用。asyncio 下 emit / enter_room / leave_room 得到的协程按调用顺序
+由一个任务依次执行，消息的顺序与同步模式相同。
+"""
+import asyncio
+import inspect
+import logging
+
+from .MahjongMetrics import metrics
+
+emit_messages = metrics.counter('mahjong_emit_messages_total', '发出的消息数，batch 帧中的消息按各自的事件名统计', ('event',))
+
+class Runtime:
+    def __init__(self, sio=None):
+        self.sio = None
+        self.is_async = False
+        self._outbox = None  # asyncio 下待执行的协程
+        if sio is not None:
+            self.attach(sio)
+
+    def attach(self, sio):
+        """绑定 Socket.IO 服务器，根据它的类型选择调度方式"""
+        self.sio = sio
+        self.is_async = asyncio.iscoroutinefunction(sio.emit)
+
+    # --- Socket.IO ---
+    def emit(self, event, data=None, room=None):
+        if event == 'batch':
+            for name, _ in data['messages']:
+                emit_messages.inc(1, name)
+        else:
+            emit_messages.inc(1, event)
+        self._call(self.sio.emit(event, data, room=room))
+
+    def enter_room(self, sid, room):
+        self._call(self.sio.enter_room(sid, room))
+
+    def leave_room(self, sid, room):
+        self._call(self.sio.leave_room(sid, room))
+
+    def _call(self, result):
+        if not inspect.isawaitable(result):
+            return
+        if self._outbox is None:
+            self._outbox = asyncio.Queue()
+            self.sio.start_background_task(self._drain, self._outbox)
+        self._outbox.put_nowait(result)
+
+    async def _drain(self, outbox):
+        while True:
+            coro = await outbox.get()
+            try:
+                await coro
+            except Exception:
+                logging.exception("发送消息时出错")
+
+    # --- 后台任务 ---
+    def start_background_task(self, target, *args):
+        """启动后台任务。asyncio 下 target 必须是协程函数"""
+        return self.sio.start_background_task(target, *args)
+
+    def start_periodic(self, interval, callback):
+        """每隔 interval 秒调用一次 callback()"""
+        if self.is_async:
+            async def run():
+                while True:
+                    await asyncio.sleep(interval)
+                    callback()
+        else:
+            def run():
+                while True:
+                    self.sio.sleep(interval)
+                    callback()
+        self.sio.start_background_task(run)
+
+    def create_mailbox(self, handler):
+        """创建一个队列，由一个后台任务按顺序对放进去的每一项调用 handler(item)，放入 None 时结束"""
+        if self.is_async:
+            queue = asyncio.Queue()
+
+            async def run():
+                while (item := await queue.get()) is not None:
+                    handler(item)
+        else:
+            queue = self.sio.eio.create_queue()
+
+            def run():
+                while (item := queue.get()) is not None:
+                    handler(item)
+        self.sio.start_background_task(run)
+        return Mailbox(queue)
+
+    def threadsafe(self, callback):
+        """
+        包装在其他线程中调用的回调 (如消息总线的读取线程)。
+        asyncio 下必须在事件循环中调用本方法，回调会被转交到事件循环中执行；eventlet 下原样返回。
+        """
+        if not self.is_async:
+            return callback
+        loop = asyncio.get_running_loop()
+        return lambda *args: loop.call_soon_threadsafe(callback, *args)
+
+
+class Mailbox:
+    """create_mailbox 返回的队列，put 不阻塞"""
+    __slots__ = ('queue',)
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def put(self, item):
+        self.queue.put_nowait(item)
+
+    def qsize(self):
+        return self.queue.qsize()
@@ -0,0 +1,134 @@
+"""
+连接会话登记表。
+
+服务器的每个连接 (sid) 对应一个会话字典 {'ip', 'name', 'room_id', 'status'}，status 为
+'offline' (已连接、未登录)、'online' (在大厅) 或 'in_room'。登记表维护以下索引，查询都是 O(1):
+
+    名字 -> sid        (登录时占用名字，断开时释放)
+    sid -> 房间         (会话字典的 room_id)
+    房间 -> sid 集合
+    状态 -> 人数
+
+会话字典只能读取，修改名字、房间和状态都要通过登记表的方法，索引才能保持一致。
+"""
+import threading
+
+
+class SessionRegistry:
+    def __init__(self):
+        self.sessions = {}  # {sid: {'ip': str, 'name': str, 'room_id': str, 'status': str}}
+        self.names = {}  # {name: sid}
+        self.rooms = {}  # {room_id: {sid: None}}，保持加入顺序
+        self.counts = {'offline': 0, 'online': 0, 'in_room': 0}
+        self._lock = threading.Lock()
+
+    def __contains__(self, sid):
+        return sid in self.sessions
+
+    def __getitem__(self, sid):
+        return self.sessions[sid]
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, sid, default=None):
+        return self.sessions.get(sid, default)
+
+    def connect(self, sid, ip):
+        """新的连接，尚未登录"""
+        with self._lock:
+            self.sessions[sid] = {'ip': ip, 'name': '', 'room_id': None, 'status': 'offline'}
+            self.counts['offline'] += 1
+            return self.sessions[sid]
+
+    def disconnect(self, sid):
+        """连接断开: 离开房间的索引并释放名字，返回被删除的会话 (不存在时返回 None)"""
+        with self._lock:
+            session = self.sessions.pop(sid, None)
+            if session is None:
+                return None
+            self._leave_room(sid, session)
+            if self.names.get(session['name']) == sid:
+                del self.names[session['name']]
+            self.counts[session['status']] -= 1
+            return session
+
+    def claim_name(self, sid, name):
+        """占用名字并进入大厅。名字已被其他连接占用时返回 False"""
+        with self._lock:
+            owner = self.names.get(name)
+            if owner is not None and owner != sid:
+                return False
+            session = self.sessions[sid]
+            if session['name'] and self.names.get(session['name']) == sid:
+                del self.names[session['name']]
+            self.names[name] = sid
+            session['name'] = name
+            self._set_status(session, 'online')
+            return True
+
+    def release_name(self, sid):
+        """释放名字，回到未登录状态"""
+        with self._lock:
+            session = self.sessions[sid]
+            if self.names.get(session['name']) == sid:
+                del self.names[session['name']]
+            session['name'] = ''
+            self._set_status(session, 'offline')
+
+    def room_of(self, sid):
+        session = self.sessions.get(sid)
+        return session['room_id'] if session else None
+
+    def sids_in(self, room_id):
+        """房间中的所有 sid，按加入顺序"""
+        return list(self.rooms.get(room_id, ()))
+
+    def join_room(self, sid, room_id):
+        with self._lock:
+            session = self.sessions.get(sid)
+            if session is None:
+                return
+            self._leave_room(sid, session)
+            session['room_id'] = room_id
+            self.rooms.setdefault(room_id, {})[sid] = None
+            self._set_status(session, 'in_room')
+
+    def leave_room(self, sid):
+        """离开房间回到大厅"""
+        with self._lock:
+            session = self.sessions.get(sid)
+            if session is None:
+                return
+            self._leave_room(sid, session)
+            self._set_status(session, 'online')
+
+    def drop_room(self, room_id):
+        """房间解散: 房间中的所有连接回到大厅，返回这些 sid"""
+        with self._lock:
+            sids = list(self.rooms.pop(room_id, ()))
+            for sid in sids:
+                session = self.sessions[sid]
+                session['room_id'] = None
+                self._set_status(session, 'online')
+            return sids
+
+    def stats(self):
+        """各状态的在线人数"""
+        return dict(self.counts, total=len(self.sessions), rooms=len(self.rooms))
+
+    def _leave_room(self, sid, session):
+        room_id = session['room_id']
+        if room_id is None:
+            return
+        members = self.rooms.get(room_id)
+        if members is not None:
+            members.pop(sid, None)
+            if not members:
+                del self.rooms[room_id]
+        session['room_id'] = None
+
+    def _set_status(self, session, status):
+        self.counts[session['status']] -= 1
+        self.counts[status] += 1
+        session['status'] = status
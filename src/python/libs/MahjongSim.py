@@ -0,0 +1,276 @@
+"""
+无网络、无延迟的对局模拟。
+
+直接驱动 MahjongServer，按 MahjongRoom 的流程 (出牌 -> 宣告 -> 裁决 -> 下一家摸牌) 把整局打完，
+玩家的决策交给可替换的策略。多局对局分给进程池并行执行，统计每秒局数、每秒动作数和各阶段的 CPU 时间，
+用于衡量引擎改动和估算比赛期间需要的机器。
+"""
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .Mahjong import MahjongServer, cached_shanten
+
+PHASES = ('deal', 'draw', 'discard', 'claim', 'policy')
+
+
+class RandomPolicy:
+    """能胡就胡，其余操作随机决定"""
+    name = 'random'
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def discard(self, game, player):
+        """返回要打出的牌在手牌中的位置，等于 hand_count 时打出新摸的牌"""
+        return self.rng.randrange(player.hand_count + (1 if player.new else 0))
+
+    def claim(self, game, player, actions):
+        """返回要提交的宣告 (与客户端发送的数据格式相同)，不宣告时返回 None"""
+        if 'hu' in actions:
+            return {'action': 'hu'}
+        options = [{'action': a} for a in ('kong', 'pong') if a in actions]
+        options += [{'action': 'chow', 'tiles': list(pair)} for pair in actions.get('chow', [])]
+        if options and self.rng.random() < 0.5:
+            return self.rng.choice(options)
+        return None
+
+    def self_drawn_hu(self, game, player):
+        return True
+
+
+class GreedyPolicy(RandomPolicy):
+    """按向听数贪心: 打出后向听数最小 (相同时有效牌最多) 的牌，宣告能让向听数减少时才宣告"""
+    name = 'greedy'
+
+    def _flags(self, game):
+        return game.gamerule.get('three golden win', True), game.gamerule.get('allow seven pairs', False)
+
+    def discard(self, game, player):
+        tileset = player.tileset
+        counts = player.counts.copy()
+        new_id = tileset.ids[player.new] if player.new else None
+        if new_id is not None:
+            counts[new_id] += 1
+        flags = self._flags(game)
+        total = sum(counts)
+        best = None
+        for tile_id, c in enumerate(counts):
+            if c == 0 or (tile_id == tileset.joker and c < total):
+                continue  # 金不打
+            counts[tile_id] -= 1
+            value, useful = cached_shanten(tileset, counts, *flags)
+            counts[tile_id] += 1
+            score = (value, -len(useful), -tile_id)
+            if best is None or score < best[0]:
+                best = (score, tile_id)
+        tile_id = best[1]
+        if player.counts[tile_id] == 0:
+            return player.hand_count  # 只能是新摸的牌
+        return sum(player.counts[:tile_id])
+
+    def claim(self, game, player, actions):
+        if 'hu' in actions:
+            return {'action': 'hu'}
+        tileset = player.tileset
+        flags = self._flags(game)
+        current = cached_shanten(tileset, player.counts, *flags)[0]
+        tile_id = tileset.ids[game.last_discarded_tile]
+        options = []
+        if 'kong' in actions:
+            options.append(({'action': 'kong'}, {tile_id: 3}))
+        if 'pong' in actions:
+            options.append(({'action': 'pong'}, {tile_id: 2}))
+        for a, b in actions.get('chow', []):
+            options.append(({'action': 'chow', 'tiles': [a, b]}, {tileset.ids[a]: 1, tileset.ids[b]: 1}))
+        best = None
+        for data, used in options:
+            counts = player.counts.copy()
+            for i, n in used.items():
+                counts[i] -= n
+            value = cached_shanten(tileset, counts, *flags)[0]
+            # 杠之后还要补一张，向听数不变也值得
+            if value < current or (data['action'] == 'kong' and value <= current):
+                if best is None or value < best[0]:
+                    best = (value, data)
+        return best[1] if best else None
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, GreedyPolicy)}
+
+
+def play_game(seed, policies=('greedy',) * 4, gamerule=None, record=False):
+    """
+    打完一局，返回这一局的统计。
+    :param seed: 同一个 seed 和同一组策略会打出完全相同的一局。
+    :param policies: 每个座位的策略名 (POLICIES 中的键)。
+    :param gamerule: 覆盖 MahjongServer.gamerule 中的规则。
+    :param record: 为 True 时在结果中附带 export_replay() 的复现记录。
+    """
+    rng = random.Random(seed)
+    game = MahjongServer(playersnames=[f'{name}{i}' for i, name in enumerate(policies)], seed=seed)
+    if gamerule:
+        game.gamerule.update(gamerule)
+    players = game.players
+    agents = [POLICIES[name](random.Random(rng.random())) for name in policies]
+    phases = dict.fromkeys(PHASES, 0.0)
+    stats = {'actions': 0, 'draws': 0, 'claims': 0}
+    clock = time.process_time
+
+    t = clock()
+    game.start()
+    game.new_tile()
+    phases['deal'] += clock() - t
+    reason = None
+    while reason is None:
+        # 当前玩家出牌
+        player = players[game.playerindex]
+        t = clock()
+        index = agents[player.id].discard(game, player)
+        t2 = clock()
+        result = game.perform_discard(player.id, index)
+        t3 = clock()
+        phases['policy'] += t2 - t
+        phases['discard'] += t3 - t2
+        stats['actions'] += 1
+
+        if result['claims_pending']:
+            for p in players:
+                if p.actions:
+                    t = clock()
+                    data = agents[p.id].claim(game, p, p.actions)
+                    t2 = clock()
+                    phases['policy'] += t2 - t
+                    if data:
+                        game.submit_claim(p.id, data)
+                        phases['claim'] += clock() - t2
+            t = clock()
+            claimed = game.process_submitted_claims()
+            for p in players:
+                p.actions = None
+            phases['claim'] += clock() - t
+            if game.status == 'finished':
+                reason = 'hu'
+                break
+            if claimed:
+                stats['actions'] += 1
+                stats['claims'] += 1
+                actor = players[claimed['id']]
+                game.turntonext(actor_id=actor.id)
+                if claimed['action'] == 'kong':
+                    t = clock()
+                    game.new_tile(from_back=True)
+                    phases['draw'] += clock() - t
+                    stats['draws'] += 1
+                if not actor.hands:
+                    reason = 'no tiles'
+                continue
+
+        # 下一家摸牌
+        if not game.wall:
+            reason = 'draw'
+            break
+        t = clock()
+        game.turntonext()
+        player = players[game.playerindex]
+        tile = game.new_tile()
+        hu = tile and player.can_hu(tile, game.sort_rule, game.gamerule)
+        phases['draw'] += clock() - t
+        stats['draws'] += 1
+        if not tile:
+            reason = 'draw'
+        elif hu:
+            t = clock()
+            if agents[player.id].self_drawn_hu(game, player):
+                game.endgame(winner_id=player.id, reason='self_drawn_hu')
+                reason = 'self_drawn_hu'
+                stats['actions'] += 1
+            phases['policy'] += clock() - t
+
+    if game.status != 'finished':
+        game.endgame(reason=reason)
+    stats.update(seed=seed, reason=reason, winner=game.winner_id, wall_left=len(game.wall), phases=phases)
+    if record:
+        stats['replay'] = game.export_replay()
+    return stats
+
+
+def _run_batch(seeds, policies, gamerule):
+    """在一个进程中连续打多局，只把汇总结果传回主进程"""
+    summary = _empty_summary()
+    for seed in seeds:
+        _merge(summary, play_game(seed, policies, gamerule))
+    return summary
+
+
+def _empty_summary():
+    return {'games': 0, 'actions': 0, 'draws': 0, 'claims': 0, 'reasons': {}, 'wins': {},
+            'phases': dict.fromkeys(PHASES, 0.0)}
+
+
+def _merge(summary, stats):
+    """把一局的统计或另一份汇总合并进 summary"""
+    if 'seed' in stats:
+        summary['games'] += 1
+        summary['reasons'][stats['reason']] = summary['reasons'].get(stats['reason'], 0) + 1
+        if stats['winner'] is not None:
+            summary['wins'][stats['winner']] = summary['wins'].get(stats['winner'], 0) + 1
+    else:
+        summary['games'] += stats['games']
+        for key in ('reasons', 'wins'):
+            for k, v in stats[key].items():
+                summary[key][k] = summary[key].get(k, 0) + v
+    for key in ('actions', 'draws', 'claims'):
+        summary[key] += stats[key]
+    for phase, seconds in stats['phases'].items():
+        summary['phases'][phase] += seconds
+
+
+def simulate(games, workers=None, policies=('greedy',) * 4, seed=0, gamerule=None, batch=None):
+    """
+    并行打 games 局，返回汇总报告。
+    :param workers: 进程数，None 为 CPU 核数，0 或 1 在当前进程内执行。
+    :param seed: 第 i 局使用 seed + i，结果可以复现。
+    :param batch: 每个任务连续打的局数，默认让每个进程分到约 4 个任务。
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    seeds = list(range(seed, seed + games))
+    summary = _empty_summary()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    if workers <= 1:
+        _merge(summary, _run_batch(seeds, tuple(policies), gamerule))
+    else:
+        batch = batch or max(1, games // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_batch, seeds[i:i + batch], tuple(policies), gamerule)
+                       for i in range(0, games, batch)]
+            for future in futures:
+                _merge(summary, future.result())
+    elapsed = time.perf_counter() - start
+    summary.update(
+        workers=max(workers, 1),
+        policies=list(policies),
+        seconds=elapsed,
+        main_cpu=time.process_time() - cpu,
+        games_per_sec=summary['games'] / elapsed if elapsed else 0.0,
+        actions_per_sec=summary['actions'] / elapsed if elapsed else 0.0,
+    )
+    return summary
+
+
+def format_report(summary):
+    """把 simulate 的结果整理成便于阅读的文本"""
+    lines = [
+        f"{summary['games']} 局, {summary['workers']} 个进程, 策略 {', '.join(summary['policies'])}",
+        f"耗时 {summary['seconds']:.2f} s, {summary['games_per_sec']:.1f} 局/s, {summary['actions_per_sec']:.0f} 动作/s",
+        f"动作 {summary['actions']}, 摸牌 {summary['draws']}, 宣告 {summary['claims']}",
+        f"结果 {summary['reasons']}, 胜者座位 {summary['wins']}",
+        "各阶段 CPU 时间 (所有进程合计):",
+    ]
+    total = sum(summary['phases'].values()) or 1.0
+    games = summary['games'] or 1
+    for phase, seconds in summary['phases'].items():
+        lines.append(f"  {phase:<8} {seconds:8.3f} s  {seconds / total:6.1%}  {seconds / games * 1e3:8.3f} ms/局")
+    return '\n'.join(lines)
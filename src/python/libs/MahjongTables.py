@@ -0,0 +1,468 @@
+"""
+胡牌判定用的分组拆解表。
+
+TileSet 把能连成顺子的牌按花色分组 (默认是万、条、筒各 1~9)，其余的牌 (字牌、花牌) 各自独立。
+每组的计数模式 -> (全部拆成面子最少要几张金, 拆成面子加一对将最少要几张金)。
+形状相同的组 (三门 1~9) 共用一张表，某个模式第一次出现时算出并填表，之后只需查表。
+
+拆法与原来的递归检查器一致: 每次取组内最小的牌，尝试刻子、用金补刻子、以它为最小牌的顺子 (缺的牌用金补)。
+不同组之间互不影响，所以整手牌需要的金 = 各组所需之和，再加上将牌放在哪一组 (或两张金作将) 的最小代价。
+
+向听数用另一张表: 每组的模式 -> 放进最多 b 个面子块和最多 p 个将块时最多能用上几张牌，
+各组之间按 max-plus 合并，凑齐胡牌还差的张数减去手上的金，再减一就是向听数。
+
+所有备忘表都是 MahjongCache 中登记的有界缓存 (tables.*)，超过上限时淘汰最早填入的模式，需要时重新计算。
+"""
+from .MahjongCache import table_cache
+
+INF = 99  # 表示不可能 (例如空组里找将)
+MAX_BLOCKS = 6  # 面子块最多 6 个，支持到 20 张的手牌 (默认 16 张为 5 个面子加 1 对将)
+_B = MAX_BLOCKS + 1
+_ZERO_BLOCKS = (0,) * (2 * _B)
+
+
+class GroupTable:
+    def __init__(self, links, name):
+        """
+        links[i] 为以组内第 i 张牌为最小牌的顺子中另外两张牌的组内下标 (j, k)，不能组顺子时为 None。
+        name 用于在 MahjongCache 中登记备忘表。
+        """
+        self.links = links
+        self.size = len(links)
+        self.melds = table_cache(f'{name}.melds')      # 模式 -> 全部拆成面子最少需要的金
+        self.entries = table_cache(f'{name}.entries')  # 模式 -> (面子, 面子+将) 最少需要的金
+        self._blocks = table_cache(f'{name}.blocks')   # 模式 -> 面子块/将块最多能用上的牌数，见 blocks()
+        self._plus = table_cache(f'{name}.plus')       # 模式 -> 每个位置加一张之后的块表
+        # 同一个顺子窗口里的两张牌 (i < j) 可以作为缺一张的面子块 (搭子)
+        self.partials = [set() for _ in links]
+        for i, link in enumerate(links):
+            if link:
+                window = sorted((i,) + tuple(link))
+                for x in range(3):
+                    for y in range(x + 1, 3):
+                        self.partials[window[x]].add(window[y])
+
+    def meld_cost(self, pattern):
+        cost = self.melds.get(pattern)
+        if cost is None:
+            cost = self._meld_cost(pattern)
+            self.melds.put(pattern, cost)
+        return cost
+
+    def _meld_cost(self, pattern):
+        i = 0
+        while i < self.size and pattern[i] == 0:
+            i += 1
+        if i == self.size:
+            return 0  # 所有牌都已组成面子
+        c = pattern[i]
+        rest = list(pattern)
+        # 刻子 (AAA)，或者用金补刻子
+        rest[i] = c - 3 if c >= 3 else 0
+        best = (0 if c >= 3 else 3 - c) + self.meld_cost(tuple(rest))
+        # 以这张牌为最小牌的顺子 (ABC)，手上有的牌优先，缺的用金补
+        link = self.links[i]
+        if link:
+            j, k = link
+            rest = list(pattern)
+            rest[i] -= 1
+            jokers = 0
+            for n in (j, k):
+                if rest[n]:
+                    rest[n] -= 1
+                else:
+                    jokers += 1
+            best = min(best, jokers + self.meld_cost(tuple(rest)))
+        return best
+
+    def lookup(self, pattern):
+        """返回 (面子, 面子+将) 各自最少需要的金。将可以是自带的对子，也可以是单张配一张金"""
+        entry = self.entries.get(pattern)
+        if entry is None:
+            pair = INF
+            rest = list(pattern)
+            for i, c in enumerate(pattern):
+                if c == 0:
+                    continue
+                rest[i] = c - 2 if c >= 2 else 0
+                pair = min(pair, (0 if c >= 2 else 1) + self.meld_cost(tuple(rest)))
+                rest[i] = c
+            entry = (self.meld_cost(pattern), pair)
+            self.entries.put(pattern, entry)
+        return entry
+
+
+    def blocks(self, pattern):
+        """
+        模式中的牌放进最多 b 个面子块 (刻子、顺子或它们缺牌的部分) 和最多 p 个将块 (p 为 0 或 1)，
+        最多能用上几张牌。返回长度为 2 * (MAX_BLOCKS + 1) 的元组，下标为 b * 2 + p。
+        """
+        result = self._blocks.get(pattern)
+        if result is None:
+            result = self._compute_blocks(pattern)
+            self._blocks.put(pattern, result)
+        return result
+
+    def plus_blocks(self, pattern):
+        """给模式中每个位置各加一张牌之后的块表，按位置排列"""
+        result = self._plus.get(pattern)
+        if result is None:
+            rest = list(pattern)
+            result = []
+            for pos in range(self.size):
+                rest[pos] += 1
+                result.append(self.blocks(tuple(rest)))
+                rest[pos] -= 1
+            result = tuple(result)
+            self._plus.put(pattern, result)
+        return result
+
+    def _compute_blocks(self, pattern):
+        i = 0
+        while i < self.size and pattern[i] == 0:
+            i += 1
+        if i == self.size:
+            return _ZERO_BLOCKS
+        c = pattern[i]
+        rest = list(pattern)
+        rest[i] -= 1
+        best = list(self.blocks(tuple(rest)))  # 这张牌不用
+
+        def take(positions, meld):
+            rest = list(pattern)
+            for pos in positions:
+                rest[pos] -= 1
+            sub = self.blocks(tuple(rest))
+            gain = len(positions)
+            for b in range(_B):
+                for p in (0, 1):
+                    if meld:
+                        if b == 0: continue
+                        value = gain + sub[(b - 1) * 2 + p]
+                    else:
+                        if p == 0: continue
+                        value = gain + sub[b * 2]
+                    if value > best[b * 2 + p]:
+                        best[b * 2 + p] = value
+
+        # 以这张牌为最小牌的面子块: 单张、对子、刻子、搭子、顺子
+        take((i,), True)
+        take((i,), False)
+        if c >= 2:
+            take((i, i), True)
+            take((i, i), False)
+        if c >= 3:
+            take((i, i, i), True)
+        for j in self.partials[i]:
+            if pattern[j]:
+                take((i, j), True)
+        link = self.links[i]
+        if link and pattern[link[0]] and pattern[link[1]]:
+            take((i,) + tuple(link), True)
+        return tuple(best)
+
+
+_tables = {}  # 组的形状只有几种 (三门 1~9 和独立的牌)，不需要上限
+
+def group_table(links):
+    """形状相同的组共用一张表"""
+    links = tuple(links)
+    table = _tables.get(links)
+    if table is None:
+        table = _tables[links] = GroupTable(links, f'group{len(_tables)}')
+    return table
+
+
+# 独立的牌 (字牌、花牌) 只能组刻子，按张数直接查
+_single = group_table((None,))
+_SINGLE = [_single.lookup((c,)) for c in range(9)]
+
+
+def min_jokers(tileset, counts):
+    """
+    counts 为不含金的计数数组，返回凑成「n 组面子 + 一对将」最少需要的金。
+    两张金可以自成一对将。结果 <= 手上金的数量即可胡牌。
+    """
+    total = 0
+    pair_extra = 2  # 两张金作将
+    for table, ids, a, b in tileset.suits:
+        meld, pair = table.lookup(tuple(counts[a:b]) if a is not None else tuple(counts[i] for i in ids))
+        total += meld
+        if pair - meld < pair_extra:
+            pair_extra = pair - meld
+    for i in tileset.isolated:
+        c = counts[i]
+        if c:
+            meld, pair = _SINGLE[c] if c < 9 else _single.lookup((c,))
+            total += meld
+            if pair - meld < pair_extra:
+                pair_extra = pair - meld
+    return total + pair_extra
+
+
+def _group_entries(tileset, counts):
+    """按组取出 (拆解表, 组内的牌 id, 模式, (面子, 面子+将))，独立的牌各自算一组"""
+    groups = []
+    for table, ids, a, b in tileset.suits:
+        pattern = tuple(counts[a:b]) if a is not None else tuple(counts[i] for i in ids)
+        groups.append((table, ids, pattern, table.lookup(pattern)))
+    for i in tileset.isolated:
+        c = counts[i]
+        groups.append((_single, (i,), (c,), _SINGLE[c] if c < 9 else _single.lookup((c,))))
+    return groups
+
+
+def winning_tiles(tileset, counts, joker_count):
+    """
+    返回再加一张就能凑成标准胡牌的牌 id 集合 (包括金)。counts 为不含金的计数数组。
+    先算出每组的基础代价，逐张尝试时只需重新查被加牌的那一组。
+    """
+    groups = _group_entries(tileset, counts)
+    total = sum(entry[0] for _, _, _, entry in groups)
+    deltas = [entry[1] - entry[0] for _, _, _, entry in groups]
+    # 除第 g 组以外其他组里最便宜的将 (前缀/后缀最小值)，两张金作将的代价为 2
+    n = len(deltas)
+    prefix = [2] * (n + 1)
+    suffix = [2] * (n + 1)
+    for g in range(n):
+        prefix[g + 1] = min(prefix[g], deltas[g])
+        suffix[n - g - 1] = min(suffix[n - g], deltas[n - g - 1])
+    waits = set()
+    if tileset.joker is not None and total + prefix[n] <= joker_count + 1:
+        waits.add(tileset.joker)
+    for g, (table, ids, pattern, (meld, _)) in enumerate(groups):
+        others = min(prefix[g], suffix[g + 1])
+        base = total - meld
+        rest = list(pattern)
+        for pos, tile_id in enumerate(ids):
+            rest[pos] += 1
+            new_meld, new_pair = table.lookup(tuple(rest))
+            rest[pos] -= 1
+            if base + new_meld + min(others, new_pair - new_meld) <= joker_count:
+                waits.add(tile_id)
+    return waits
+
+
+_combined = table_cache('combined', 200000)
+
+def _combine(x, y):
+    """两张块表按 max-plus 合并: 面子块和将块在两边之间任意分配"""
+    if x is _ZERO_BLOCKS:
+        return y
+    if y is _ZERO_BLOCKS:
+        return x
+    result = _combined.get((x, y))
+    if result is None:
+        result = _combine_blocks(x, y)
+        _combined.put((x, y), result)
+    return result
+
+
+def _combine_blocks(x, y):
+    out = []
+    for b in range(_B):
+        best0 = best1 = 0
+        for b1 in range(b + 1):
+            i = 2 * b1
+            j = 2 * (b - b1)
+            x0 = x[i]; y0 = y[j]
+            value = x0 + y0
+            if value > best0: best0 = value
+            value = x[i + 1] + y0
+            if value > best1: best1 = value
+            value = x0 + y[j + 1]
+            if value > best1: best1 = value
+        out.append(best0)
+        out.append(best1)
+    return tuple(out)
+
+
+def _usable(x, y, k):
+    """x、y 合并后在最多 k 个面子块、1 个将块下最多能用上的牌数 (只算需要的那一格)"""
+    best = 0
+    for b1 in range(k + 1):
+        i = 2 * b1
+        j = 2 * (k - b1)
+        value = x[i] + y[j + 1]
+        if value > best: best = value
+        value = x[i + 1] + y[j]
+        if value > best: best = value
+    return best
+
+
+_honor_blocks = table_cache('honor_blocks')
+_honor_plus = table_cache('honor_plus')
+
+def _isolated_blocks(key):
+    """独立的牌互相等价，只按张数排序后的元组缓存"""
+    result = _honor_blocks.get(key)
+    if result is None:
+        result = _ZERO_BLOCKS
+        for c in key:
+            result = _combine(result, _single.blocks((c,)))
+        _honor_blocks.put(key, result)
+    return result
+
+
+def _isolated_plus(key, c):
+    """在张数为 key 的独立牌中，给一张原来有 c 张的牌加一张之后的块表"""
+    result = _honor_plus.get((key, c))
+    if result is None:
+        new_key = list(key)
+        if c:
+            new_key.remove(c)
+        result = _isolated_blocks(tuple(sorted(new_key + [c + 1])))
+        _honor_plus.put((key, c), result)
+    return result
+
+
+def shanten(tileset, counts, three_golden=True, seven_pairs=False):
+    """
+    counts 为含金的手牌计数数组，返回 (向听数, 有效牌 id 集合)。向听数 -1 表示已经胡牌，0 表示听牌。
+    手牌为 3k+1 张时，有效牌是摸到后能让向听数减少的牌；3k+2 张时，是打出最合适的一张之后的有效牌。
+    金按万能牌计算，三金和七对按规则开关计入。
+    """
+    total = sum(counts)
+    if total % 3 == 1:
+        return _shanten_draw(tileset, counts, three_golden, seven_pairs)
+    current = _shanten_value(tileset, counts, three_golden, seven_pairs)
+    useful = set()
+    if current >= 0:
+        rest = list(counts)
+        for tile_id, c in enumerate(counts):
+            if c == 0 or tile_id == tileset.joker:
+                continue
+            rest[tile_id] -= 1
+            value, tiles = _shanten_draw(tileset, rest, three_golden, seven_pairs)
+            rest[tile_id] += 1
+            if value == current:
+                useful |= tiles
+    return current, useful
+
+
+def _split(tileset, counts):
+    """拆成 (不含金的计数数组, 金的数量)"""
+    counts = list(counts)
+    joker_count = 0
+    if tileset.joker is not None:
+        joker_count = counts[tileset.joker]
+        counts[tileset.joker] = 0
+    return counts, joker_count
+
+
+def _special_deficiency(counts, joker_count, target, three_golden, seven_pairs):
+    """三金、七对还差几张，不适用时返回 INF"""
+    pairs = sum(c // 2 for c in counts) if seven_pairs else 0
+    singles = sum(c % 2 for c in counts) if seven_pairs else 0
+    return _special(pairs, singles, joker_count, target, three_golden, seven_pairs)
+
+
+def _special(pairs, singles, joker_count, target, three_golden, seven_pairs):
+    best = INF
+    if three_golden:
+        best = max(0, 3 - joker_count)
+    if seven_pairs and target % 2 == 0:
+        need = target // 2
+        used = 2 * min(pairs, need) + min(singles, need - min(pairs, need))
+        best = min(best, max(0, target - used - joker_count))
+    return best
+
+
+def _is_complete(tileset, counts, joker_count, three_golden, seven_pairs):
+    if three_golden and joker_count >= 3:
+        return True
+    if seven_pairs:
+        holes = sum(c % 2 for c in counts)
+        if joker_count >= holes and (joker_count - holes) % 2 == 0:
+            return True
+    return min_jokers(tileset, counts) <= joker_count
+
+
+def _shanten_value(tileset, counts, three_golden, seven_pairs):
+    """3k+2 张手牌的向听数"""
+    real, joker_count = _split(tileset, counts)
+    target = sum(counts)
+    k = min(target // 3, MAX_BLOCKS)
+    blocks = _isolated_blocks(tuple(sorted(real[i] for i in tileset.isolated if real[i])))
+    for table, ids, a, b in tileset.suits:
+        blocks = _combine(blocks, table.blocks(tuple(real[a:b]) if a is not None else tuple(real[i] for i in ids)))
+    deficiency = max(0, target - blocks[k * 2 + 1] - joker_count)
+    deficiency = min(deficiency, _special_deficiency(real, joker_count, target, three_golden, seven_pairs))
+    if deficiency == 0 and not _is_complete(tileset, real, joker_count, three_golden, seven_pairs):
+        deficiency = 1  # 金不能补在顺子最小的那张 (与 can_hu 保持一致)
+    return deficiency - 1
+
+
+def _shanten_draw(tileset, counts, three_golden, seven_pairs):
+    """3k+1 张手牌的向听数和有效牌。先合并出「除某一组以外」的块表，逐张尝试时只需重新查一组"""
+    real, joker_count = _split(tileset, counts)
+    target = sum(counts) + 1
+    k = min(target // 3, MAX_BLOCKS)
+    parts = []  # (拆解表, 组内的牌 id, 模式, 块表)
+    for table, ids, a, b in tileset.suits:
+        pattern = tuple(real[a:b]) if a is not None else tuple(real[i] for i in ids)
+        parts.append((table, ids, pattern, table.blocks(pattern)))
+    isolated = tileset.isolated
+    honor_key = tuple(sorted(real[i] for i in isolated if real[i]))
+    parts.append((None, isolated, honor_key, _isolated_blocks(honor_key)))
+    n = len(parts)
+    prefix = [_ZERO_BLOCKS] * (n + 1)
+    suffix = [_ZERO_BLOCKS] * (n + 1)
+    for g in range(n):
+        prefix[g + 1] = _combine(prefix[g], parts[g][3])
+        suffix[n - g - 1] = _combine(suffix[n - g], parts[n - g - 1][3])
+    usable = prefix[n][k * 2 + 1]
+    pairs = sum(c // 2 for c in real) if seven_pairs else 0
+    singles = sum(c % 2 for c in real) if seven_pairs else 0
+
+    def deficiency(used, c, jokers):
+        """c 为加入的那张牌原来的张数 (加金时为 None)"""
+        value = max(0, target - used - jokers)
+        if three_golden or seven_pairs:
+            p, s = pairs, singles
+            if c is not None:
+                p, s = (p + 1, s - 1) if c % 2 else (p, s + 1)
+            value = min(value, _special(p, s, jokers, target, three_golden, seven_pairs))
+        return value
+
+    current = max(0, target - usable - joker_count)
+    if three_golden or seven_pairs:
+        current = min(current, _special(pairs, singles, joker_count, target, three_golden, seven_pairs))
+    current = max(current, 1)  # 手上少一张，至少还差一张
+    # 逐张尝试，差的张数减少的就是有效牌
+    candidates = []
+    if tileset.joker is not None:
+        candidates.append((tileset.joker, deficiency(usable, None, joker_count + 1)))
+    for g, (table, ids, pattern, _) in enumerate(parts):
+        others = _combine(prefix[g], suffix[g + 1])
+        if table is None:
+            # 独立的牌只看原来的张数，同样张数的结果相同
+            by_count = {}
+            for tile_id in ids:
+                c = real[tile_id]
+                if c not in by_count:
+                    by_count[c] = deficiency(_usable(_isolated_plus(pattern, c), others, k), c, joker_count)
+                candidates.append((tile_id, by_count[c]))
+            continue
+        for tile_id, group_blocks in zip(ids, table.plus_blocks(pattern)):
+            candidates.append((tile_id, deficiency(_usable(group_blocks, others, k), real[tile_id], joker_count)))
+    useful = set()
+    for tile_id, value in candidates:
+        if value == 0:
+            # 差 0 张即胡牌，确认一次 (金不能补在顺子最小的那张)
+            if tile_id == tileset.joker:
+                complete = _is_complete(tileset, real, joker_count + 1, three_golden, seven_pairs)
+            else:
+                real[tile_id] += 1
+                complete = _is_complete(tileset, real, joker_count, three_golden, seven_pairs)
+                real[tile_id] -= 1
+            if not complete:
+                value = 1
+        if value < current:
+            useful.add(tile_id)
+    return current - 1, useful
+
+
+def table_sizes():
+    """已填入的模式数量，供调试和性能分析使用"""
+    return {str(links): len(table.entries) for links, table in _tables.items()}
@@ -0,0 +1,175 @@
+"""
+牌的整数编码。
+
+MahjongServer 根据 sort_rule 构建 TileSet：每种牌按 sort_rule 的顺序分配一个整数 id，
+玩家手牌以「id -> 张数」的计数数组保存。字符串只在与客户端通信时使用。
+"""
+from .MahjongTables import group_table
+
+# 默认的牌序，MahjongServer 会复制一份作为自己的 sort_rule
+DEFAULT_SORT_RULE = {
+    '1o': 2, '2o': 3, '3o': 4, '4o': 5, '5o': 6, '6o': 7, '7o': 8, '8o': 9, '9o': 10,
+    '1t': 12, '2t': 13, '3t': 14, '4t': 15, '5t': 16, '6t': 17, '7t': 18, '8t': 19, '9t': 20,
+    '1w': 22, '2w': 23, '3w': 24, '4w': 25, '5w': 26, '6w': 27, '7w': 28, '8w': 29, '9w': 30,
+    'e': 32, 's': 34, 'w': 36, 'n': 38, 'b': 42, 'f': 44, 'z': 46, 'joker': 0,
+    'spring': 50, 'summer': 53, 'autumn': 56, 'winter': 59,
+    'plum': 62, 'orchid': 65, 'bamboo': 68, 'chrysanthemum': 71
+}
+
+
+class TileSet:
+    def __init__(self, sort_rule):
+        """按 sort_rule 的值从小到大给每种牌编号，id 的顺序即手牌的排序顺序"""
+        self.sort_rule = dict(sort_rule)
+        self.names = sorted(self.sort_rule, key=lambda t: self.sort_rule[t])  # id -> 牌名
+        self.ids = {name: i for i, name in enumerate(self.names)}  # 牌名 -> id
+        self.size = len(self.names)
+        self.joker = self.ids.get('joker')  # 没有金的玩法中为 None
+        self._build_neighbours()
+        self._build_groups()
+
+    def _build_neighbours(self):
+        """
+        预先计算每张牌同花色的邻牌 (t-2, t-1, t+1, t+2)，以及字牌/花牌标记。
+        邻牌按 sort_rule 的值相差 1、2 且花色 (牌名最后一个字符) 相同来确定，不存在时为 None。
+        """
+        by_value = {}
+        for name, value in self.sort_rule.items():
+            by_value.setdefault((value, name[-1]), name)
+        self.neighbours = []
+        self.honor = []   # 风牌、箭牌 (以及首字母相同的花牌)，不能被吃
+        self.flower = []  # 金和其余花牌
+        for name in self.names:
+            value = self.sort_rule[name]
+            self.neighbours.append(tuple(
+                self.ids.get(by_value.get((value + d, name[-1]))) for d in (-2, -1, 1, 2)
+            ))
+            self.honor.append(name[0] in 'eswnbfz')
+            self.flower.append(name[0] in 'japoc')
+        # can_chow 用: 打出的牌能和哪些牌对组成顺子
+        self.chow_pairs = []
+        for i, name in enumerate(self.names):
+            m2, m1, p1, p2 = self.neighbours[i]
+            if self.honor[i] or 'joker' in name:
+                self.chow_pairs.append(())
+                continue
+            pairs = [(a, b) for a, b in ((m2, m1), (m1, p1), (p1, p2)) if a is not None and b is not None]
+            self.chow_pairs.append(tuple(pairs))
+        # _can_form_melds 用: 以这张牌为最小牌的顺子的另外两张 (c2, c3)，字牌、花牌、金为 None
+        self.meld_next = []
+        for i, name in enumerate(self.names):
+            _, _, p1, p2 = self.neighbours[i]
+            if self.sort_rule[name] and not self.honor[i] and not self.flower[i] and p1 is not None and p2 is not None:
+                self.meld_next.append((p1, p2))
+            else:
+                self.meld_next.append(None)
+
+    def _build_groups(self):
+        """
+        把能连成顺子的牌按花色分组 (suits)，其余的牌 (字牌、花牌) 各自独立 (isolated)，金不参与分组。
+        每组记录 (拆解表, 组内的牌 id, 切片起点, 切片终点)，组内 id 连续时可以直接切片取计数。
+        """
+        parent = list(range(self.size))
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        for i, meld_next in enumerate(self.meld_next):
+            if meld_next:
+                for j in meld_next:
+                    parent[find(j)] = find(i)
+        members = {}
+        for i in range(self.size):
+            if i != self.joker:
+                members.setdefault(find(i), []).append(i)
+        self.suits = []
+        self.isolated = []
+        for ids in members.values():
+            if len(ids) == 1:
+                self.isolated.append(ids[0])
+                continue
+            local = {tile_id: n for n, tile_id in enumerate(ids)}
+            links = [(local[m[0]], local[m[1]]) if m else None for m in (self.meld_next[i] for i in ids)]
+            contiguous = ids == list(range(ids[0], ids[-1] + 1))
+            self.suits.append((group_table(links), tuple(ids), ids[0] if contiguous else None, ids[-1] + 1 if contiguous else None))
+
+    def encode(self, tiles):
+        """把牌名列表转换为计数数组"""
+        counts = [0] * self.size
+        for tile in tiles:
+            counts[self.ids[tile]] += 1
+        return counts
+
+    def decode(self, counts):
+        """把计数数组还原为排好序的牌名列表"""
+        names = self.names
+        return [names[i] for i, c in enumerate(counts) for _ in range(c)]
+
+
+_tilesets = {}
+
+def get_tileset(sort_rule):
+    """同一套 sort_rule 在整个进程内只构建一次 TileSet"""
+    key = tuple(sorted(sort_rule.items()))
+    tileset = _tilesets.get(key)
+    if tileset is None:
+        tileset = _tilesets[key] = TileSet(sort_rule)
+    return tileset
+
+
+_base_tiles = {}
+
+def base_tiles(sort_rule, removed=()):
+    """一副牌 (每种 4 张，去掉 removed 中的牌)，按 sort_rule 的键顺序排列。同一套规则只生成一次，返回只读的元组"""
+    key = (tuple(sort_rule), tuple(sorted(removed)))
+    tiles = _base_tiles.get(key)
+    if tiles is None:
+        tiles = _base_tiles[key] = tuple(name for name in sort_rule if name not in removed for _ in range(4))
+    return tiles
+
+
+class Wall:
+    """
+    牌墙。洗好的牌保存在一个列表里，前后各有一个游标: 正常摸牌和发牌从前面取，杠后补牌从后面取。
+    摸牌只移动游标，不复制、不移动列表。len() 为剩余张数，下标和迭代都只针对剩余的牌。
+    """
+    __slots__ = ('tiles', 'front', 'back')
+
+    def __init__(self, tiles=None):
+        self.tiles = tiles if tiles is not None else []
+        self.front = 0
+        self.back = len(self.tiles)
+
+    def __len__(self):
+        return self.back - self.front
+
+    def __iter__(self):
+        return (self.tiles[i] for i in range(self.front, self.back))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.tiles[i] for i in range(self.front, self.back)[index]]
+        return self.tiles[range(self.front, self.back)[index]]
+
+    def draw(self):
+        """从前面摸一张，牌墙已空时返回 None"""
+        if self.front >= self.back:
+            return None
+        tile = self.tiles[self.front]
+        self.front += 1
+        return tile
+
+    def draw_back(self):
+        """从后面摸一张 (杠后补牌)，牌墙已空时返回 None"""
+        if self.front >= self.back:
+            return None
+        self.back -= 1
+        return self.tiles[self.back]
+
+    def deal(self, count):
+        """从前面取 count 张 (不足时取完为止)"""
+        end = min(self.front + count, self.back)
+        tiles = self.tiles[self.front:end]
+        self.front = end
+        return tiles
@@ -0,0 +1,126 @@
+"""
+全进程共用的哈希时间轮。
+
+房间不再为每个延迟单独启动一个睡眠的后台任务，而是向时间轮登记截止时间 (出牌超时、宣告窗口、开局倒计时等)，
+由一个后台任务每个 tick 检查一次到期的定时器。回调在时间轮的任务中执行，应当很快返回，
+房间的做法是把事件放进自己的收件箱。
+"""
+import logging
+import math
+import threading
+import time
+
+
+class Timer:
+    """call_later 返回的句柄，可以用 cancel() 取消"""
+    __slots__ = ('wheel', 'deadline', 'rounds', 'callback', 'args', 'cancelled', 'fired')
+
+    def __init__(self, wheel, deadline, rounds, callback, args):
+        self.wheel = wheel
+        self.deadline = deadline
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.fired = False
+
+    def cancel(self):
+        """取消定时器，已经触发或已经取消时什么也不做"""
+        self.wheel._cancel(self)
+
+    @property
+    def remaining(self):
+        """距离截止时间还有多少秒"""
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class TimerWheel:
+    def __init__(self, tick=0.05, slots=512):
+        """
+        :param tick: 时间轮的精度 (秒)，定时器最多晚 tick 秒触发。
+        :param slots: 槽数，超过 tick * slots 秒的定时器会多转几圈。
+        """
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.base = time.monotonic()
+        self.current = 0  # 下一个要处理的 tick
+        self.pending = 0
+        self.fired = 0
+        self.cancelled = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+        self._runtime = None
+
+    def ensure_running(self, runtime):
+        """第一次调用时用 runtime (MahjongRuntime.Runtime) 启动时间轮的后台任务，之后直接返回"""
+        if self._runtime is None:
+            self._runtime = runtime
+            with self._lock:
+                if not self.pending:  # 模块导入后可能过了很久，没有定时器时直接对齐到现在，免得空转补 tick
+                    self.base = time.monotonic() - self.current * self.tick
+            runtime.start_periodic(self.tick, lambda: self.advance(time.monotonic()))
+
+    def call_later(self, delay, callback, *args):
+        """delay 秒后调用 callback(*args)，返回 Timer 句柄"""
+        deadline = time.monotonic() + delay
+        with self._lock:
+            target = max(self.current, math.ceil((deadline - self.base) / self.tick))
+            offset = target - self.current
+            timer = Timer(self, deadline, offset // len(self.slots), callback, args)
+            self.slots[target % len(self.slots)].append(timer)
+            self.pending += 1
+        return timer
+
+    def _cancel(self, timer):
+        with self._lock:
+            if timer.cancelled or timer.fired:
+                return
+            timer.cancelled = True
+            self.pending -= 1
+            self.cancelled += 1
+
+    def advance(self, now):
+        """处理截止到 now 的所有 tick，触发到期的定时器"""
+        due = []
+        with self._lock:
+            size = len(self.slots)
+            while self.base + self.current * self.tick <= now:
+                index = self.current % size
+                keep = []
+                for timer in self.slots[index]:
+                    if timer.cancelled:
+                        continue
+                    if timer.rounds:
+                        timer.rounds -= 1
+                        keep.append(timer)
+                    else:
+                        timer.fired = True
+                        due.append(timer)
+                self.slots[index] = keep
+                self.current += 1
+            self.pending -= len(due)
+            self.fired += len(due)
+        for timer in due:
+            lag = max(0.0, now - timer.deadline)
+            self.lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logging.exception(f"定时器回调 {getattr(timer.callback, '__name__', timer.callback)} 出错")
+
+    def stats(self):
+        """等待中的定时器数量，以及触发的延迟 (实际触发时间 - 截止时间，毫秒)"""
+        return {
+            'pending': self.pending,
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'tick_ms': self.tick * 1e3,
+            'avg_lag_ms': self.lag / self.fired * 1e3 if self.fired else 0.0,
+            'max_lag_ms': self.max_lag * 1e3,
+        }
+
+
+# 全进程共用的时间轮
+timer_wheel = TimerWheel()
@@ -0,0 +1,36 @@
+"""
+容量测试: 启动 N 个机器人连接到服务器，自动登录、建房、准备并打完整的对局，
+报告动作往返延迟的分位数、每分钟局数和错误率。每次发布前在本地运行一次。
+
+    python server.py --port 5000 &
+    python loadtest.py --url http://127.0.0.1:5000 --bots 64 --duration 120
+    python loadtest.py --bots 200 --think 0.5 --json
+
+每局结束后房间会先展示 3 秒结果、再倒计时 3 秒开局，局数/分钟包含这段固定的等待。
+"""
+import argparse
+import json
+
+from libs import MahjongLoad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="麻将服务器容量测试")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="服务器地址")
+    parser.add_argument('--bots', type=int, default=16, help="机器人数量，向上取整为 4 的倍数 (每 4 个一桌)")
+    parser.add_argument('--duration', type=float, default=60, help="测试时间 (秒)")
+    parser.add_argument('--think', type=float, default=0.0, help="机器人每次行动前的等待时间 (秒)")
+    parser.add_argument('--ramp', type=float, default=0.02, help="相邻两个机器人建立连接的间隔 (秒)")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    progress = None if args.json else lambda summary: print(MahjongLoad.format_report(summary) + '\n')
+    summary = MahjongLoad.run(args.url, bots=args.bots, duration=args.duration, think=args.think, ramp=args.ramp, progress=progress)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(MahjongLoad.format_report(summary))
+
+
+if __name__ == '__main__':
+    main()
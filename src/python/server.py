@@ -1,25 +1,151 @@
+import argparse
+import inspect
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+
+import asyncio
 import socketio
-import eventlet
-import logging
 from datetime import datetime
 
 from libs import MahjongRoom as mr
+from libs.MahjongTimer import timer_wheel
+from libs import MahjongPayload
+from libs import MahjongCache
+from libs.MahjongLobby import Lobby
+from libs.MahjongSessions import SessionRegistry
+from libs.MahjongBus import UnixSocketBus, serve_hub
+from libs.MahjongRuntime import Runtime
+from libs.MahjongExecutor import EngineExecutor, LoopMonitor
+from libs import MahjongMetrics
+from libs.MahjongMetrics import metrics
+from libs import MahjongLog
+from libs.MahjongLog import EventLogger
+from libs.MahjongLimits import RateLimiter, parse_limits
 
-# 配置日志记录
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# 日志: 各模块用 EventLogger 记录结构化事件，启动时由 MahjongLog.setup 配置级别，交给后台线程写出
+log = EventLogger('server')
 
 # --- 服务器和全局数据存储初始化 ---
 
 # 创建Socket.IO服务器
-sio = socketio.Server(cors_allowed_origins="*")
-app = socketio.WSGIApp(sio)
+# 事件处理函数先登记在 handlers 中，create_server 时注册到 eventlet 或 asyncio 的 Socket.IO 服务器上。
+# 处理函数都是同步的，通过 runtime 发送消息，两种模式共用同一套逻辑
+handlers = {}
+runtime = Runtime()
+
+handler_seconds = metrics.histogram('mahjong_handler_seconds', 'Socket.IO 事件处理函数的用时', ('event',))
+handler_errors = metrics.counter('mahjong_handler_errors_total', 'Socket.IO 事件处理函数抛出的异常数', ('event',))
+shed_events = metrics.counter('mahjong_shed_total', '被丢弃的客户端事件数 (rate: 超过限流，queue: 房间收件箱已满)', ('event', 'reason'))
+
+# 每个 sid 按事件类型限流 (每秒补充的令牌数, 桶容量)，'*' 为每个 sid 所有事件合计的限制，可以用 --rate-limits 修改
+DEFAULT_LIMITS = 'game_action=10/20,chat_message=2/5,get_room_stats=1/2,*=30/60'
+limiter = RateLimiter(parse_limits(DEFAULT_LIMITS))
+
+# get_room_stats 只回应这些地址的连接 (在服务器本机上查看)，可以用 --stats-allow 修改。远程监控请抓取 /metrics
+stats_allow = {'127.0.0.1', '::1'}
+
+def shed(sid, name, reason):
+    """丢弃客户端事件。限流时只在连续丢弃的第一次通知客户端，避免丢弃本身又产生大量消息"""
+    shed_events.inc(1, name, reason)
+    if reason == 'queue' or limiter.notify:
+        runtime.emit('game_action_result', {'success': False, 'message': '操作过于频繁，请稍后再试'}, room=sid)
+
+def event(handler):
+    """
+    登记事件处理函数，注册到服务器上的是统计次数和用时的包装 (模块内直接调用的仍是原函数)。
+    Socket.IO 会先带上额外的参数 (connect 的 auth、disconnect 的 reason) 调用，出现 TypeError 才去掉重试，
+    包装只传入处理函数接受的参数个数，避免把这次重试计为异常。
+    超过限流 (limiter) 的事件不调用处理函数，直接丢弃。
+    """
+    name = handler.__name__
+    params = inspect.signature(handler).parameters.values()
+    accepts = None if any(p.kind == p.VAR_POSITIONAL for p in params) else len(params)
+
+    def timed(*args):
+        if accepts is not None:
+            args = args[:accepts]
+        if not limiter.allow(args[0], name):
+            shed(args[0], name, 'rate')
+            return
+        start = time.perf_counter()
+        try:
+            return handler(*args)
+        except Exception:
+            handler_errors.inc(1, name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, name)
+    handlers[name] = timed
+    return handler
+
+class FramePacket(socketio.packet.Packet):
+    """用 MahjongPayload 编码的 Socket.IO 数据包，事件包 [事件名, 数据...] 编码后按事件名统计帧数和字节数"""
+    json = MahjongPayload
+
+    def encode(self):
+        encoded = super().encode()
+        if self.packet_type == socketio.packet.EVENT:
+            MahjongPayload.count_frame(self.data[0], encoded)
+        return encoded
+
+
+def create_server(mode='eventlet'):
+    """
+    创建 Socket.IO 服务器并注册事件处理函数，返回 (sio, app)。
+    :param mode: 'eventlet' 返回 WSGI 应用，'asyncio' 返回 ASGI 应用。
+    Socket.IO 以外的请求交给指标应用，GET /metrics 返回 Prometheus 文本格式的运行指标。
+    """
+    # 使用 MahjongPayload 编码消息，多个接收者共用的数据只编码一次
+    if mode == 'asyncio':
+        sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*", serializer=FramePacket, json=MahjongPayload)
+        app = socketio.ASGIApp(sio, MahjongMetrics.asgi_app())
+    else:
+        sio = socketio.Server(cors_allowed_origins="*", serializer=FramePacket, json=MahjongPayload)
+        app = socketio.WSGIApp(sio, MahjongMetrics.wsgi_app())
+    for name, handler in handlers.items():
+        sio.on(name, handler)
+    runtime.attach(sio)
+    return sio, app
 
 # 全局数据存储
-# users 存储所有连接到服务器的用户信息
+# users 登记所有连接到服务器的用户，可按 sid 读取 {'ip': str, 'name': str, 'room_id': str, 'status': str}，
+# 名字、房间和状态通过 SessionRegistry 的方法修改，所在房间用 users.room_of(sid) 查询
 # rooms 存储所有 MahjongRoom 对象的实例
-users = {}  # {sid: {'ip': str, 'name': str, 'room_id': str, 'status': str}}
+users = SessionRegistry()
 rooms = {}  # {room_id: MahjongRoom_instance}
-namelist = []
+# lobby 只向在大厅中的用户 (已登录、不在房间中) 发送房间列表的增量
+lobby = Lobby(runtime, rooms)
+# engine 把出牌提示等耗时的计算交给进程池，loop_monitor 测量事件循环被阻塞的时间
+engine = EngineExecutor()
+loop_monitor = LoopMonitor()
+
+# 多进程部署 (--workers N): 每个房间只属于一个 worker，房间ID的哈希决定它属于哪个 worker。
+# 加入其他 worker 的房间时，客户端会被重定向到那个 worker 重新连接。
+# 大厅房间列表、用户名和跨 worker 的房间消息通过消息总线 (bus) 同步。
+cluster = {'worker': 0, 'workers': 1, 'port': 5000, 'public_url': None}
+bus = None  # 消息总线的端点，单进程时为 None
+remote_names = {}  # {name: worker}，其他 worker 上已登录的用户名
+tickets = {}  # {ticket: room_id}，其他 worker 重定向过来、密码已经验证过的用户凭此加入房间
+
+# 抓取 /metrics 时计算的当前值
+def rooms_by_status():
+    counts = {'waiting': 0, 'playing': 0, 'finished': 0}
+    for room in list(rooms.values()):
+        counts[room.status] = counts.get(room.status, 0) + 1
+    return counts
+
+metrics.gauge('mahjong_rooms', '本 worker 的房间数', rooms_by_status, ('status',))
+metrics.gauge('mahjong_users', '本 worker 的连接数 (offline 为已连接、未登录)', lambda: {s: users.counts[s] for s in users.counts}, ('status',))
+metrics.gauge('mahjong_mailbox_depth', '所有房间收件箱中等待处理的事件数', lambda: sum(room.mailbox.qsize() for room in list(rooms.values()) if room.mailbox is not None))
+metrics.gauge('mahjong_timers_pending', '时间轮上等待触发的定时器数', lambda: timer_wheel.stats()['pending'])
+metrics.gauge('mahjong_engine_pending', '引擎进程池中尚未完成的调用数', lambda: len(engine.pending))
+metrics.gauge('mahjong_cache_entries', '各进程级缓存中的条目数', lambda: {name: len(cache) for name, cache in MahjongCache.caches.items()}, ('cache',))
+metrics.gauge('mahjong_loop_lag_max_seconds', '事件循环的最大延迟', lambda: loop_monitor.max_lag)
 
 
 # --- 辅助函数 ---
@@ -27,21 +153,75 @@ namelist = []
 def authenticate(name, password):
     pass  # 这里可以实现认证逻辑:
 
-def get_room_list():
-    """生成并返回一个对客户端友好的房间列表。"""
-    room_list = []
-    for room in rooms.values():
-        room_list.append({
-            'id': room.id,
-            'name': room.name,
-            'game': room.game,
-            'owner': room.owner,
-            'members': room.get_member_count(),
-            'max_members': room.rules['max players'],
-            'has_password': bool(room.password),
-            'status': room.status
-        })
-    return room_list
+def shard_of(room_id):
+    """房间所属的 worker"""
+    return zlib.crc32(room_id.encode('utf-8')) % cluster['workers']
+
+def new_room_id():
+    """生成一个属于本 worker 的房间ID"""
+    while True:
+        room_id = str(uuid.uuid4())
+        if shard_of(room_id) == cluster['worker']:
+            return room_id
+
+def worker_port(worker):
+    return cluster['port'] + worker
+
+def publish(topic, data):
+    if bus is not None:
+        bus.publish(topic, data)
+
+def claim_name(sid, name):
+    """占用用户名，所有 worker 中唯一 (多个 worker 同时占用同一名字时以先到达总线的为准)"""
+    if name in remote_names or not users.claim_name(sid, name):
+        return False
+    publish('name', {'op': 'claim', 'name': name})
+    return True
+
+def release_name(sid):
+    name = users[sid]['name']
+    if name:
+        users.release_name(sid)
+        publish('name', {'op': 'release', 'name': name})
+
+def emit_to_room(room_id, event, data):
+    """向房间发送消息，房间在其他 worker 上时通过总线转发"""
+    if room_id in rooms:
+        runtime.emit(event, data, room=room_id)
+    else:
+        publish('room_emit', {'room': room_id, 'event': event, 'data': data})
+
+def on_bus_message(topic, data, sender):
+    """处理其他 worker 通过总线发来的消息"""
+    if topic == 'lobby':
+        lobby.apply_remote(data, sender)
+    elif topic == 'hello':  # 新的 worker 加入，把本 worker 的房间和用户名发给它
+        publish('sync', {'rooms': lobby.local_changes(), 'names': list(users.names)})
+    elif topic == 'sync':
+        lobby.apply_remote(data['rooms'], sender)
+        remote_names.update((name, sender) for name in data['names'])
+    elif topic == 'name':
+        if data['op'] == 'claim':
+            remote_names[data['name']] = sender
+        elif remote_names.get(data['name']) == sender:
+            del remote_names[data['name']]
+    elif topic == 'ticket':  # 重定向前收到的密码在房间所在的 worker 上验证
+        room = rooms.get(data['room_id'])
+        if room is not None and (not room.password or room.password == data['password']):
+            tickets[data['ticket']] = data['room_id']
+            timer_wheel.ensure_running(runtime)
+            timer_wheel.call_later(60, tickets.pop, data['ticket'], None)
+    elif topic == 'room_emit':
+        if data['room'] in rooms:
+            runtime.emit(data['event'], data['data'], room=data['room'])
+    elif topic == 'worker_exit':
+        lobby.drop_worker(sender)
+        for name in [name for name, worker in remote_names.items() if worker == sender]:
+            del remote_names[name]
+
+def get_room_list(**filters):
+    """返回对客户端友好的房间列表 (可过滤和分页，见 Lobby.room_list)。"""
+    return lobby.room_list(**filters)
 
 def handle_leave_room(sid, room_id):
     """处理用户离开房间的通用逻辑，无论是主动离开还是断线。"""
@@ -51,214 +231,267 @@ def handle_leave_room(sid, room_id):
     room = rooms[room_id]
     user_name = users[sid]['name']
     
-    # 从房间实例中移除成员
+    # 从房间实例中移除成员 (同时更新用户的状态)
     room.remove_member(sid)
-    
-    # 更新用户的状态
-    users[sid]['room_id'] = None
-    users[sid]['status'] = 'online'
 
     # 如果离开的是房主，则解散房间
     if room.owner == user_name:
-        membersids = list(room.members.keys())
-        for member_sid in membersids:
-            sio.emit('room_deleted', {'success': True, 'message': '房主离开，房间已解散'}, room=member_sid)
         del rooms[room_id]
-        logging.info(f"🏠 房间 {room.name} 因房主离开而已解散。")
+        room.close()
+        for member_sid in users.drop_room(room_id):
+            lobby.enter(member_sid)
+            runtime.emit('room_deleted', dict(get_room_list(), success=True, message='房主离开，房间已解散'), room=member_sid)
+        log.info('room_closed', room=room.name, reason='owner_left')
     # 如果房间变空了，也解散它
     elif room.get_member_count() == 0:
         del rooms[room_id]
-        logging.info(f"🏠 房间 {room.name} 因无人而自动解散。")
+        room.close()
+        log.info('room_closed', room=room.name, reason='empty')
     else: # 在房间没有解散的情况下通知有玩家离开房间。
-        sio.emit('player_left', {'sid': sid}, room=room_id)
-        sio.emit('chat_message', {'type': 'log', 'level': 'info', 'message': f'玩家 {user_name} 离开了房间。'}, room=room_id) 
-        
-    # 向所有客户端广播最新的房间列表
-    sio.emit('room_list_update', 
-    {
-        'success': True,
-        'message': f'房间 {room.name} 解散',
-        'room_list': get_room_list()
-    })
+        runtime.emit('player_left', {'sid': sid}, room=room_id)
+        runtime.emit('chat_message', {'type': 'log', 'level': 'info', 'message': f'玩家 {user_name} 离开了房间。'}, room=room_id) 
 
 
 # --- Socket.IO 服务器事件处理器 ---
 
-@sio.event
+@event
 def connect(sid, environ):
     """当一个新客户端连接时触发。"""
     client_ip = environ.get('REMOTE_ADDR', 'unknown')
-    logging.info(f"🔗 客户端连接: {sid} from {client_ip}")
-    users[sid] = {'ip': client_ip, 'name': '', 'room_id': None, 'status': 'offline'}
-    sio.emit('connect_res', {'success': True, 'message': '连接成功', 'clientsid': sid}, room=sid)
+    log.info('connect', sid=sid, ip=client_ip)
+    users.connect(sid, client_ip)
+    runtime.emit('connect_res', {'success': True, 'message': '连接成功', 'clientsid': sid}, room=sid)
 
-@sio.event
+@event
 def disconnect(sid):
     """当一个客户端断开连接时触发。"""
-    logging.info(f"🔌 客户端断开: {sid}")
+    log.info('disconnect', sid=sid)
+    limiter.forget(sid)
     if sid in users:
         # 如果用户在房间里，则处理离开逻辑
-        if users[sid].get('room_id'):
-            handle_leave_room(sid, users[sid]['room_id'])
-    # Safely remove user
-        if users[sid]['name'] in namelist:
-            namelist.remove(users[sid]['name'])
-        del users[sid]
-@sio.event
+        room_id = users.room_of(sid)
+        if room_id:
+            handle_leave_room(sid, room_id)
+        release_name(sid)
+        users.disconnect(sid)
+@event
 def join_server(sid, data):
     """处理用户登录到服务器大厅的请求。"""
     name = data.get('name', '').strip()
     if not name:
-        sio.emit('join_server_result', {'success': False, 'message': '用户名不能为空'}, room=sid)
+        runtime.emit('join_server_result', {'success': False, 'message': '用户名不能为空'}, room=sid)
         return
-    if name in namelist:
-        sio.emit('join_server_result', {'success': False, 'message': '用户名已被占用'}, room=sid)
+    if not claim_name(sid, name):
+        runtime.emit('join_server_result', {'success': False, 'message': '用户名已被占用'}, room=sid)
         return
     
-    users[sid]['name'] = name
-    users[sid]['status'] = 'online'
-    namelist.append(name)
-    sio.emit('join_server_result', {'success': True, 'message': '登陆成功', 'username': name, 'room_list': get_room_list()}, room=sid)
-    logging.info(f"✅ 用户 {name} ({sid}) 成功加入服务器")
-
-@sio.event
-def get_rooms(sid):
-    """向客户端发送当前的房间列表。"""
-    logging.info(f'{users[sid]['name']} 尝试获取房间列表')
-    data = {
-        'success': True,
-        'message': '获取成功',
-        'room_list': get_room_list()
-    }
-    if sid in users:
-        sio.emit('room_list_update', data, room=sid)
-    else: return
-@sio.event
+    lobby.enter(sid)
+    runtime.emit('join_server_result', dict(get_room_list(), success=True, message='登陆成功', username=name), room=sid)
+    log.info('login', sid=sid, name=name)
+
+@event
+def get_rooms(sid, data=None):
+    """
+    向客户端发送当前的房间列表 (带版本号，之后的变化通过 room_list_delta 发送)。
+    data 可以包含过滤和分页条件: status, free, password, offset, limit。
+    带条件请求的客户端之后收到的是 room_list_stale，需要用同样的条件重新请求 (见 MahjongLobby)。
+    """
+    if sid not in users:
+        return
+    log.debug('get_rooms', name=users[sid]['name'])
+    data = data or {}
+    try:
+        filters = {key: data[key] for key in ('status', 'free', 'password') if data.get(key) is not None}
+        if data.get('offset') or data.get('limit') is not None:
+            filters['offset'] = max(0, int(data.get('offset') or 0))
+            filters['limit'] = max(0, int(data['limit'])) if data.get('limit') is not None else None
+    except (TypeError, ValueError):
+        runtime.emit('room_list_update', {'success': False, 'message': '分页参数无效'}, room=sid)
+        return
+    if users[sid]['status'] == 'online':  # 只有大厅里的用户接收列表的变化
+        lobby.set_view(sid, bool(filters))
+    runtime.emit('room_list_update', dict(get_room_list(**filters), success=True, message='获取成功'), room=sid)
+@event
 def get_room_info(sid,room_id):
-    if users[sid]['room_id']!=room_id:
-        logging.info(f'{users[sid]['name']} 尝试获取不属于自己的房间信息')
-        sio.emit('room_info_update', {'success': False, 'message': '你不在该房间内'}, room=sid)
+    if users.room_of(sid) != room_id:
+        log.info('room_info_denied', name=users[sid]['name'], room=room_id)
+        runtime.emit('room_info_update', {'success': False, 'message': '你不在该房间内'}, room=sid)
         return
     
     if room_id not in rooms:
         return
     room = rooms[room_id]
-    data = {
-        'success': True,
-        'message': '获取成功',
-        'members': room.members,
-    }
-    sio.emit('room_info_update', data, room=room_id)
-    logging.info(f'当前房间成员 {room.members}')  
+    runtime.emit('room_info_update', room.get_room_info_payload(), room=room_id)
 
 
 
-@sio.event
+@event
 def create_room(sid, data):
     """处理用户创建新房间的请求。"""
     room_name = data.get('name', '').strip()
-    logging.info(f"{users[sid]['name']} 尝试创建房间 {room_name}")
     if not room_name:
-        sio.emit('create_room_result', {'success': False, 'message': '房间名不能为空'}, room=sid)
+        runtime.emit('create_room_result', {'success': False, 'message': '房间名不能为空'}, room=sid)
         return
     
     # 实例化来自 MahjongRoom 库的 MahjongRoom 类
-    # 将 sio 服务器实例传递给了它，以便它能自行通信
+    # 将调度层 runtime 传递给了它，以便它能自行通信
     room = mr.MahjongRoom(
         name=room_name,
+        id=new_room_id(),
         password=data.get('password', ''),
-        sio_server=sio,
+        sio_server=runtime,
         owner_sid=sid,
-        owner_name=users[sid]['name']
+        owner_name=users[sid]['name'],
+        lobby=lobby,
+        sessions=users,
+        engine=engine
     )
     rooms[room.id] = room
     
-    sio.emit('create_room_result', {'success': True, 'message': '房间创建成功', 'room_id': room.id}, room=sid)
-    
-    sio.emit('room_list_update', {
-        'success': True,
-        'message': f'{users[sid]["name"]} 创建了新房间',
-        'room_list': get_room_list()
-    }) # 向所有客户端广播房间列表更新
-    logging.info(f"🏠 用户 {users[sid]['name']} 创建了房间: {room_name} (ID: {room.id})")
+    runtime.emit('create_room_result', {'success': True, 'message': '房间创建成功', 'room_id': room.id}, room=sid)
+    log.info('room_created', name=users[sid]['name'], room=room_name, id=room.id)
     join_room(sid, {'room_id': room.id, 'password': room.password})  # 自动加入新创建的房间
 
-@sio.event
+@event
 def join_room(sid, data):
     """处理用户加入已存在房间的请求。"""
     room_id = data.get('room_id')
     password = data.get('password', '')
     
     if room_id not in rooms:
-        sio.emit('join_room_result', {'success': False, 'message': '房间不存在'}, room=sid)
+        if room_id in lobby.remote:
+            redirect_to_worker(sid, room_id, password)
+        else:
+            runtime.emit('join_room_result', {'success': False, 'message': '房间不存在'}, room=sid)
         return
     
     room = rooms[room_id]
     if room.is_full():
-        sio.emit('join_room_result', {'success': False, 'message': '房间已满'}, room=sid)
+        runtime.emit('join_room_result', {'success': False, 'message': '房间已满'}, room=sid)
         return
-    if room.password and room.password != password:
-        sio.emit('join_room_result', {'success': False, 'message': '密码错误'}, room=sid)
+    ticket = data.get('ticket')
+    if ticket and tickets.get(ticket) == room_id:
+        del tickets[ticket]  # 密码已经验证过
+    elif room.password and room.password != password:
+        runtime.emit('join_room_result', {'success': False, 'message': '密码错误'}, room=sid)
         return
 
-    # 调用房间实例的方法来添加成员
+    # 调用房间实例的方法来添加成员 (同时更新用户状态)
+    lobby.leave(sid)
     room.add_member(sid, users[sid]['name'], users[sid]['ip'])
     
-    # 更新用户状态
-    users[sid]['room_id'] = room_id
-    users[sid]['status'] = 'in_room'
-    
-    sio.emit('join_room_result', {'success': True, 'message': '成功加入房间', 'id': room_id}, room=sid)
-    sio.emit('room_list_update', {
-        'success': True,
-        'message': f'{room.name} 有新成员加入',
-        'room_list': get_room_list()
-    })
-    logging.info(f"🚪 用户 {users[sid]['name']} 加入了房间: {room.name}: {room_id}")
-
-@sio.event
+    runtime.emit('join_room_result', {'success': True, 'message': '成功加入房间', 'id': room_id}, room=sid)
+    log.info('join_room', name=users[sid]['name'], room=room.name, id=room_id)
+
+def redirect_to_worker(sid, room_id, password):
+    """房间在其他 worker 上: 把密码转交给那个 worker 验证，然后让客户端连接到那个 worker，凭 ticket 加入房间"""
+    entry = lobby.entries[room_id]
+    if entry['members'] >= entry['max_members']:
+        runtime.emit('join_room_result', {'success': False, 'message': '房间已满'}, room=sid)
+        return
+    worker = lobby.remote[room_id]
+    ticket = None
+    if entry['has_password']:
+        ticket = uuid.uuid4().hex
+        publish('ticket', {'ticket': ticket, 'room_id': room_id, 'password': password})
+    port = worker_port(worker)
+    release_name(sid)  # 客户端会用同样的名字登录到另一个 worker
+    runtime.emit('join_room_result', {
+        'success': False,
+        'message': '房间在其他服务器上，正在重新连接...',
+        'redirect': {
+            'worker': worker,
+            'port': port,
+            'url': cluster['public_url'].format(port=port) if cluster['public_url'] else None,
+            'room_id': room_id,
+            'ticket': ticket,
+        },
+    }, room=sid)
+
+@event
 def leave_room(sid, data):
     """处理用户主动离开房间的请求。"""
-    if sid in users and users[sid].get('room_id'):
-        handle_leave_room(sid, users[sid]['room_id'])
-        sio.emit('leave_room_result', {'success': True, 'message': '已离开房间'}, room=sid)
+    room_id = users.room_of(sid)
+    if room_id:
+        handle_leave_room(sid, room_id)
+        lobby.enter(sid)
+        runtime.emit('leave_room_result', {'success': True, 'message': '已离开房间'}, room=sid)
+        runtime.emit('room_list_update', dict(get_room_list(), success=True, message='获取成功'), room=sid)
 
-@sio.event
+@event
 def player_ready(sid, data):
     """处理玩家准备/取消准备的动作。"""
-    room_id = users[sid].get('room_id')
+    room_id = users.room_of(sid)
     if not room_id or room_id not in rooms:
         return
-    logging.info(f"{users[sid]['name']} 在房间 {room_id} 设置准备状态为 {data.get('ready', False)}")
+    log.debug('ready', name=users[sid]['name'], room=room_id, ready=data.get('ready', False))
     room = rooms[room_id]
-    room.set_player_ready(sid, data.get('ready', False))
     room.members[sid]['decorator'] = data.get('decorator', None)
+    room.set_player_ready(sid, data.get('ready', False))
     get_room_info(sid,room_id)
     
 
-@sio.event
+@event
 def game_action(sid, data):
     """游戏操作的统一入口，将所有游戏内动作转发给对应的房间实例处理。"""
-    print('Received Game Action signal from sid: ', sid, 'Data: ', data)  # --- IGNORE ---
     if sid not in users:
         return
     
-    room_id = users[sid].get('room_id')
+    room_id = users.room_of(sid)
     if not room_id or room_id not in rooms:
         return
         
     room = rooms[room_id]
     if room.status != 'playing':
-        sio.emit('game_action_result', {'success': False, 'message': '游戏未开始'}, room=sid)
+        runtime.emit('game_action_result', {'success': False, 'message': '游戏未开始'}, room=sid)
         return
         
-    # 将动作全权委托给房间实例处理
-    room.handle_player_action(sid, data)
+    # 将动作放进房间的收件箱，由房间按顺序处理；收件箱积压过多时丢弃
+    if not room.offer(room.handle_player_action, sid, data):
+        shed(sid, 'game_action', 'queue')
+
+@event
+def sync_game_state(sid, data=None):
+    """客户端掉队时 (收到的增量与本地版本对不上) 请求完整的游戏状态快照。"""
+    room_id = users.room_of(sid)
+    if room_id and room_id in rooms:
+        room = rooms[room_id]
+        if not room.offer(room.send_state_snapshot, sid):
+            shed(sid, 'sync_game_state', 'queue')
+
+@event
+def get_hint(sid, data=None):
+    """出牌提示，结果通过 hint_result 返回"""
+    room_id = users.room_of(sid)
+    if room_id and room_id in rooms:
+        room = rooms[room_id]
+        if not room.offer(room.request_hint, sid):
+            shed(sid, 'get_hint', 'queue')
+
+@event
+def get_room_stats(sid):
+    """
+    运维统计，只回应 stats_allow 中的地址。room_stats_result 包含:
+    - rooms: 每个房间的收件箱深度、处理延迟和丢弃数，每个动作的消息数和帧数，以及名字、状态和定时器
+    - timers: 时间轮的定时器数量和触发延迟
+    - lobby / users: 大厅增量的版本和统计，各状态的在线人数
+    - engine / loop: 引擎进程池的调用统计，事件循环的延迟
+    - limits: 限流的配置和放行/丢弃计数
+    - caches: 胡牌、向听数缓存和拆解表备忘表的大小、上限和命中统计
+    - worker: 当前 worker 的编号
+    """
+    session = users.get(sid)
+    if session is None or session['ip'] not in stats_allow:
+        runtime.emit('room_stats_result', {'success': False, 'message': '没有权限'}, room=sid)
+        return
+    stats = {room_id: dict(room.get_mailbox_stats(), **room.get_broadcast_stats(), name=room.name, status=room.status, timers=sorted(room.timers)) for room_id, room in rooms.items()}
+    runtime.emit('room_stats_result', {'success': True, 'rooms': stats, 'timers': timer_wheel.stats(), 'lobby': dict(lobby.stats, version=lobby.version), 'users': users.stats(),
+                                       'engine': engine.stats(), 'loop': loop_monitor.stats(), 'limits': limiter.stats(), 'caches': MahjongCache.stats(), 'worker': cluster['worker']}, room=sid)
 
-@sio.event
+@event
 def chat_message(sid, data):
     """处理房间内的聊天消息。"""
-    room_id = users[sid].get('room_id')
+    room_id = users.room_of(sid)
     message = data.get('message', '').strip()
     if not room_id or not message:
         return
@@ -268,14 +501,94 @@ def chat_message(sid, data):
         'name': users[sid]['name'],
         'message': message
     }
-    sio.emit('chat_message', chat_data, room=room_id)
+    emit_to_room(room_id, 'chat_message', chat_data)
 #   1754922093286: { type: 'log', level: 'info', message: '玩家 1 摸了一张牌。' },
 #   1754922094551: { type: 'chat', name: '玩家 1', messages: 'Man!' },
 
 
 # --- 启动服务器 ---
 
+def run_supervisor(args):
+    """多进程模式: 启动消息总线的转发和 args.workers 个 worker 进程，worker i 监听 port + i"""
+    path = os.path.join(tempfile.gettempdir(), f'mahjong-bus-{os.getpid()}.sock')
+    hub = serve_hub(path)
+    command = [sys.executable, os.path.abspath(__file__), '--workers', str(args.workers), '--port', str(args.port), '--bus', path, '--mode', args.mode, '--engine-workers', str(args.engine_workers)]
+    if args.public_url:
+        command += ['--public-url', args.public_url]
+    command += ['--rate-limits', args.rate_limits, '--room-queue', str(args.room_queue), '--stats-allow', args.stats_allow]
+    command += ['--log-level', args.log_level, '--log-levels', args.log_levels, '--log-format', args.log_format]
+    workers = [subprocess.Popen(command + ['--worker', str(i)]) for i in range(args.workers)]
+    print(f"🚀 已启动 {args.workers} 个 worker，端口 {args.port}-{args.port + args.workers - 1}，客户端连接 {args.port}")
+    try:
+        for worker in workers:
+            worker.wait()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    finally:
+        hub.shutdown()
+        os.unlink(path)
+
+def run_worker(args):
+    """运行一个 worker (单进程时是唯一的 worker)"""
+    cluster.update(worker=args.worker, workers=args.workers, port=args.port, public_url=args.public_url)
+    engine.workers = args.engine_workers
+    limiter.limits = parse_limits(args.rate_limits)
+    mr.MahjongRoom.max_inbound = args.room_queue
+    stats_allow.clear()
+    stats_allow.update(filter(None, (ip.strip() for ip in args.stats_allow.split(','))))
+    port = worker_port(args.worker)
+    sio, app = create_server(args.mode)
+    print(f"🚀 Socket.IO 服务器启动中... (worker {args.worker}/{args.workers}, {args.mode})")
+    print(f"📡 监听地址: http://127.0.0.1:{port}")
+    if args.mode == 'asyncio':
+        asyncio.run(serve_asyncio(app, port, args.bus))
+    else:
+        import eventlet
+        if args.bus:
+            from eventlet.green import socket as green_socket
+            from eventlet.semaphore import Semaphore
+            connect_bus(UnixSocketBus(args.bus, green_socket, Semaphore), on_bus_message, runtime.start_background_task)
+        start_engine()
+        eventlet.wsgi.server(eventlet.listen(('0.0.0.0', port)), app)
+
+async def serve_asyncio(app, port, bus_path):
+    import uvicorn
+    start_engine()
+    if bus_path:  # 总线在读取线程中收到的消息转交到事件循环中处理
+        connect_bus(UnixSocketBus(bus_path), runtime.threadsafe(on_bus_message))
+    await uvicorn.Server(uvicorn.Config(app, host='0.0.0.0', port=port, log_level='warning')).serve()
+
+def start_engine():
+    """启动引擎进程池和事件循环延迟的测量 (asyncio 下必须在事件循环中调用)"""
+    engine.start(runtime)
+    loop_monitor.start(runtime)
+
+def connect_bus(bus_factory, handler, spawn=None):
+    global bus
+    bus = bus_factory.connect(cluster['worker'], handler, spawn=spawn)
+    lobby.bus = bus
+    publish('hello', None)
+
 if __name__ == '__main__':
-    print("🚀 Socket.IO 服务器启动中...")
-    print("📡 监听地址: http://127.0.0.1:5000")
-    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', 5000)), app)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="麻将 Socket.IO 服务器")
+    parser.add_argument('--port', type=int, default=5000, help="监听端口，多进程时 worker i 监听 port + i")
+    parser.add_argument('--workers', type=int, default=1, help="worker 进程数，房间按ID分配到各个 worker")
+    parser.add_argument('--mode', choices=['eventlet', 'asyncio'], default='eventlet', help="eventlet (WSGI) 或 asyncio (ASGI，需要 uvicorn)")
+    parser.add_argument('--engine-workers', type=int, default=1, help="每个 worker 用于出牌提示等计算的进程数，0 表示在事件循环中直接计算")
+    parser.add_argument('--public-url', default=None, help="客户端重定向到其他 worker 时使用的地址模板，如 http://example.com:{port}，默认只替换端口")
+    parser.add_argument('--rate-limits', default=DEFAULT_LIMITS, help="每个连接的限流: 事件=每秒令牌数/桶容量，逗号分隔，* 为所有事件合计，空字符串表示不限流")
+    parser.add_argument('--room-queue', type=int, default=mr.MahjongRoom.max_inbound, help="每个房间收件箱中最多排队的客户端事件数")
+    parser.add_argument('--stats-allow', default=','.join(sorted(stats_allow)), help="可以调用 get_room_stats 的客户端地址，逗号分隔")
+    parser.add_argument('--log-level', default='INFO', help="默认日志级别")
+    parser.add_argument('--log-levels', default='', help="各子系统 (engine, room, server) 的日志级别，如 engine=WARNING,room=DEBUG")
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text', help="日志格式，json 为每行一个 JSON 对象")
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--bus', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    MahjongLog.setup(args.log_level, MahjongLog.parse_levels(args.log_levels), args.log_format)
+    if args.workers > 1 and args.worker is None:
+        run_supervisor(args)
+    else:
+        args.worker = args.worker or 0
+        run_worker(args)
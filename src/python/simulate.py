@@ -0,0 +1,41 @@
+"""
+无界面的批量对局模拟，用于测量引擎吞吐量。
+
+    python simulate.py --games 2000 --workers 8 --policy greedy
+    python simulate.py --games 500 --policy random,greedy,greedy,greedy --json
+"""
+import argparse
+import json
+
+from libs import MahjongSim
+
+
+def main():
+    parser = argparse.ArgumentParser(description="麻将引擎无网络对局模拟")
+    parser.add_argument('--games', type=int, default=1000, help="对局数")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认为 CPU 核数，1 表示单进程")
+    parser.add_argument('--policy', default='greedy',
+                        help=f"策略，可选 {', '.join(MahjongSim.POLICIES)}；用逗号分隔可为每个座位指定不同策略")
+    parser.add_argument('--seed', type=int, default=0, help="起始随机种子，第 i 局使用 seed + i")
+    parser.add_argument('--batch', type=int, default=None, help="每个任务连续打的局数")
+    parser.add_argument('--seven-pairs', action='store_true', help="允许七对")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    policies = args.policy.split(',')
+    if len(policies) == 1:
+        policies *= 4
+    if len(policies) != 4 or any(p not in MahjongSim.POLICIES for p in policies):
+        parser.error(f"--policy 需要 1 个或 4 个策略名，可选: {', '.join(MahjongSim.POLICIES)}")
+    gamerule = {'allow seven pairs': True} if args.seven_pairs else None
+
+    summary = MahjongSim.simulate(args.games, workers=args.workers, policies=policies,
+                                  seed=args.seed, gamerule=gamerule, batch=args.batch)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(MahjongSim.format_report(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试按 src/python 下运行服务器时的方式导入 libs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
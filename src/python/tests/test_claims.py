@@ -0,0 +1,52 @@
+"""
+宣告阶段的提前结算: pass_claim / claims_decided / process_submitted_claims。
+
+庄家打出 5t 后，下家可以吃 (优先级 7)，对家可以碰 (优先级 6)，末家什么也做不了。
+"""
+from libs import Mahjong
+
+
+def _claim_window():
+    game = Mahjong.MahjongServer(seed=0)
+    game.start()
+    game.players[0].hands = ['5t', 'e', 'e']
+    game.players[1].hands = ['4t', '6t', '9o']
+    game.players[2].hands = ['5t', '5t', '1w']
+    game.players[3].hands = ['1o', '1o', '2w']
+    result = game.perform_discard(0, game.players[0].hands.index('5t'))
+    assert result['claims_pending']
+    assert game.pending_claims == {'pong': {2: 6}, 'chow': {1: 7}}
+    return game
+
+
+def test_all_eligible_players_pass_resolves_immediately():
+    game = _claim_window()
+    assert game.pass_claim(2) is False  # 下家的吃还没表态
+    assert game.pass_claim(1) is True
+    assert game.process_submitted_claims() is None
+    assert game.players[0].discarded == ['5t'] and game.pending_claims == {}
+
+
+def test_pass_after_higher_priority_claim():
+    game = _claim_window()
+    assert game.submit_claim(2, {'action': 'pong'}) is True  # 吃的优先级更低，不能再改变结果
+    assert game.pass_claim(1) is True
+    assert game.process_submitted_claims() == {'id': 2, 'action': 'pong'}
+    assert game.players[0].discarded == []
+
+
+def test_pass_from_higher_priority_player_decides_lower_claim():
+    game = _claim_window()
+    assert game.submit_claim(1, {'action': 'chow', 'tiles': ['4t', '6t']}) is False  # 对家还可以碰
+    assert game.pass_claim(2) is True
+    assert game.process_submitted_claims() == {'id': 1, 'action': 'chow'}
+
+
+def test_pass_without_actions_is_rejected():
+    game = _claim_window()
+    assert game.pass_claim(3) is None  # 末家没有可以执行的动作
+    assert game.pass_claim(0) is None  # 出牌的玩家
+    assert game.passed_claims == set()
+    assert game.pass_claim(2) is False
+    assert game.pass_claim(2) is None  # 重复表态
+    assert game.passed_claims == {2}
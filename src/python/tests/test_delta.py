@@ -0,0 +1,113 @@
+"""
+状态增量 (MahjongDelta): diff/apply 往返、StateStream 的版本衔接和快照。
+"""
+import json
+import random
+
+from libs import Mahjong
+from libs.MahjongDelta import StateStream, apply, diff
+
+
+def _random_value(rng, depth=0):
+    kind = rng.random()
+    if depth > 2 or kind < 0.4:
+        return rng.choice([0, 1, 2, 'a', 'b', True, None, ''])
+    if kind < 0.7:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {rng.choice('abcdef'): _random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+def _mutate(rng, value, depth=0):
+    """返回 value 的修改版本 (不修改 value 本身)"""
+    if isinstance(value, dict):
+        new = {k: (_mutate(rng, v, depth + 1) if rng.random() < 0.5 else v) for k, v in value.items()}
+        if rng.random() < 0.3 and new:
+            new.pop(rng.choice(list(new)))
+        if rng.random() < 0.3:
+            new[rng.choice('abcdefgh')] = _random_value(rng, depth + 1)
+        return new
+    if isinstance(value, list):
+        new = [(_mutate(rng, v, depth + 1) if rng.random() < 0.3 else v) for v in value]
+        if rng.random() < 0.4:
+            new.extend(_random_value(rng, depth + 1) for _ in range(rng.randint(1, 3)))
+        elif rng.random() < 0.2 and new:
+            new.pop()
+        return new
+    return _random_value(rng, depth) if rng.random() < 0.5 else value
+
+
+def test_apply_diff_round_trip():
+    rng = random.Random(14)
+    for _ in range(2000):
+        old = {'players': [_random_value(rng) for _ in range(4)], 'meta': _random_value(rng)}
+        new = _mutate(rng, old)
+        delta = diff(old, new)
+        if old == new:
+            assert delta is None
+            continue
+        # 增量经过 JSON 编码后应用在旧状态的拷贝上
+        restored = apply(json.loads(json.dumps(old)), json.loads(json.dumps(delta)))
+        assert restored == new, (old, new, delta)
+
+
+def test_list_append_is_sent_as_tail_only():
+    assert diff({'d': ['1o', '2o']}, {'d': ['1o', '2o', '3o']}) == {'d': ['+', ['3o']]}
+    assert diff({'d': ['1o']}, {}) == {'d': ['-']}
+
+
+def _play(game, steps):
+    """摸牌、打出刚摸的牌、没有人宣告，推进 steps 次"""
+    for _ in range(steps):
+        game.new_tile()
+        result = game.perform_discard(game.playerindex, None)
+        if result['claims_pending']:
+            game.process_submitted_claims()
+        game.turntonext()
+
+
+def test_stream_messages_survive_later_game_changes():
+    """消息在稍后才编码 (asyncio 模式)，期间游戏继续进行，编码出的内容仍是生成消息时的状态"""
+    game = Mahjong.MahjongServer(seed=3)
+    game.start()
+    public, private = StateStream(), StateStream()
+    messages, expected = [], []
+    for version in range(1, 30):
+        _play(game, 1)
+        for stream, state in ((public, game.getgamestate()), (private, game.getgamestate(playerid=0))):
+            expected.append(json.dumps(state))
+            messages.append(stream.update(state, version))
+    states = [None, None]
+    for i, message in enumerate(messages):  # 全部在最后才编码
+        part = i % 2
+        message = json.loads(json.dumps(message))
+        if message is not None:
+            states[part] = message['state'] if 'state' in message else apply(states[part], message['delta'])
+        assert json.dumps(states[part]) == expected[i]
+
+
+def test_version_gap_requires_snapshot():
+    game = Mahjong.MahjongServer(seed=5)
+    game.start()
+    stream = StateStream()
+    first = stream.update(game.getgamestate(), 1)
+    assert 'state' in first  # 第一条消息总是快照
+    client = {'version': first['version'], 'state': json.loads(json.dumps(first['state']))}
+    _play(game, 2)
+    stream.update(game.getgamestate(), 2)  # 客户端没有收到这一条
+    _play(game, 2)
+    message = stream.update(game.getgamestate(), 3)
+    assert 'delta' in message and message['base'] != client['version']  # 对不上，不能应用增量
+    snapshot = json.loads(json.dumps(stream.current()))  # sync_game_state 的回应
+    assert snapshot['version'] == 3 and snapshot['state'] == json.loads(json.dumps(game.getgamestate()))
+    client = {'version': snapshot['version'], 'state': snapshot['state']}
+    _play(game, 1)
+    message = stream.update(game.getgamestate(), 4)
+    assert message['base'] == client['version']
+    assert apply(client['state'], message['delta']) == json.loads(json.dumps(game.getgamestate()))
+
+
+def test_unchanged_state_sends_nothing():
+    stream = StateStream()
+    stream.update({'a': [1]}, 1)
+    assert stream.update({'a': [1]}, 2) is None
+    assert stream.version == 1
@@ -0,0 +1,65 @@
+"""
+引擎执行层 (MahjongExecutor.EngineExecutor) 的快速路径: 同名调用的衰减平均用时决定直接计算还是交给进程池。
+
+进程池换成立即完成的假进程池，工作进程中的用时由测试指定。
+"""
+import concurrent.futures
+import time
+
+from libs.MahjongExecutor import EngineExecutor
+
+
+class FakePool:
+    def __init__(self, elapsed):
+        self.elapsed = elapsed  # 假装工作进程中的用时 (秒)
+        self.calls = 0
+
+    def submit(self, timed, fn, args):
+        self.calls += 1
+        future = concurrent.futures.Future()
+        future.set_result((fn(*args), self.elapsed))
+        return future
+
+
+def _call(executor, fn):
+    results = []
+    executor.submit('hint', fn, (), lambda result, error: results.append((result, error)))
+    executor.poll()
+    assert results and results[0][1] is None
+    return results[0][0]
+
+
+def test_cheap_calls_move_inline_and_back_when_they_slow_down():
+    executor = EngineExecutor(workers=1, inline_ms=0.5)
+    executor.pool = FakePool(0.0001)
+    for _ in range(8):
+        assert _call(executor, lambda: 'pooled') == 'pooled'
+    assert executor.pool.calls == 8 and executor._is_cheap('hint')
+
+    # 直接计算的用时继续计入，变慢后回到进程池
+    def slow():
+        time.sleep(0.003)
+        return 'slow'
+
+    for inline in range(1, 10):
+        _call(executor, slow)
+        if not executor._is_cheap('hint'):
+            break
+    assert inline <= 3 and executor.pool.calls == 8
+    _call(executor, slow)
+    assert executor.pool.calls == 9
+    assert executor.stats()['inline'] == inline
+
+
+def test_pooled_average_tracks_recent_cost():
+    executor = EngineExecutor(workers=1, inline_ms=0.5, decay=0.5)
+    executor.pool = FakePool(0.01)
+    for _ in range(8):
+        _call(executor, lambda: None)
+    assert not executor._is_cheap('hint')
+    # 平均值只受最近的调用影响，之前很慢的调用不会让快速路径永远关闭
+    executor.pool.elapsed = 0.0001
+    for _ in range(8):
+        _call(executor, lambda: None)
+    assert executor._is_cheap('hint')
+    assert executor.stats()['avg_cost_ms']['hint'] < 0.5
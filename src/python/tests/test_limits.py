@@ -0,0 +1,75 @@
+"""
+按 sid 和事件类型的令牌桶限流 (MahjongLimits)。时间用假的时钟推进。
+"""
+import pytest
+
+from libs import MahjongLimits
+from libs.MahjongLimits import RateLimiter, parse_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(MahjongLimits, 'time', clock)
+    return clock
+
+
+def test_burst_then_refill(clock):
+    limiter = RateLimiter({'game_action': (2, 3)})
+    assert [limiter.allow('a', 'game_action') for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5  # 补充一个令牌
+    assert limiter.allow('a', 'game_action')
+    assert not limiter.allow('a', 'game_action')
+    assert limiter.allow('b', 'game_action')  # 每个 sid 各自计算
+
+
+def test_shared_bucket_rejection_keeps_event_token(clock):
+    limiter = RateLimiter({'chat_message': (0.1, 2), '*': (1, 2)})
+    assert limiter.allow('a', 'get_rooms')
+    assert limiter.allow('a', 'get_rooms')  # '*' 用完，chat_message 的桶还是满的
+    assert not limiter.allow('a', 'chat_message')
+    assert not limiter.allow('a', 'chat_message')
+    clock.now += 2.0  # '*' 补满，chat_message 只补充了 0.2 个令牌
+    # 被 '*' 拒绝的两次没有消耗 chat_message 的令牌，桶里还有两个
+    assert limiter.allow('a', 'chat_message')
+    assert limiter.allow('a', 'chat_message')
+    assert not limiter.allow('a', 'chat_message')
+    assert limiter.stats()['shed'] == {'chat_message': 3}
+
+
+def test_notify_only_first_shed_of_a_run(clock):
+    limiter = RateLimiter({'game_action': (1, 1)})
+    assert limiter.allow('a', 'game_action')
+    notified = []
+    for _ in range(3):
+        assert not limiter.allow('a', 'game_action')
+        notified.append(limiter.notify)
+    assert notified == [True, False, False]
+    clock.now += 1.0
+    assert limiter.allow('a', 'game_action')
+    assert not limiter.allow('a', 'game_action')
+    assert limiter.notify  # 放行过一次之后重新通知
+
+
+def test_exempt_and_forget(clock):
+    limiter = RateLimiter({'*': (1, 1)})
+    assert limiter.allow('a', 'join_server')
+    assert not limiter.allow('a', 'join_server')
+    assert limiter.allow('a', 'disconnect')
+    limiter.forget('a')
+    assert limiter.stats()['tracked_sids'] == 0
+    assert limiter.allow('a', 'join_server')
+
+
+def test_parse_limits():
+    assert parse_limits('game_action=10/20, chat_message=2,*=30/60') == {
+        'game_action': (10.0, 20.0), 'chat_message': (2.0, 2.0), '*': (30.0, 60.0)}
+    assert parse_limits('') == {}
@@ -0,0 +1,137 @@
+"""
+大厅房间列表 (MahjongLobby.Lobby): mark/flush 合并变化、增量的版本衔接、过滤视图的 room_list_stale。
+
+时间轮换成测试自己的实例，用 advance 手动推进，不启动后台任务。
+"""
+import time
+
+import pytest
+
+from libs import MahjongLobby
+from libs.MahjongLobby import LOBBY, LOBBY_FILTERED, Lobby
+from libs.MahjongTimer import TimerWheel
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.sent = []  # [(event, data, room)]
+        self.rooms = {}  # {sid: {Socket.IO 房间}}
+
+    def emit(self, event, data=None, room=None):
+        self.sent.append((event, data, room))
+
+    def enter_room(self, sid, room):
+        self.rooms.setdefault(sid, set()).add(room)
+
+    def leave_room(self, sid, room):
+        self.rooms.setdefault(sid, set()).discard(room)
+
+    def start_periodic(self, interval, func):
+        pass
+
+
+class FakeRoom:
+    def __init__(self, room_id, created_time):
+        self.id = room_id
+        self.name = room_id
+        self.game = 'mahjong'
+        self.owner = 'owner'
+        self.password = None
+        self.status = 'waiting'
+        self.rules = {'max players': 4}
+        self.created_time = created_time
+        self.members = 1
+
+    def get_member_count(self):
+        return self.members
+
+
+@pytest.fixture
+def wheel(monkeypatch):
+    wheel = TimerWheel(tick=0.01, slots=16)
+    monkeypatch.setattr(MahjongLobby, 'timer_wheel', wheel)
+    return wheel
+
+
+def _fire(wheel):
+    """推进 100 个 tick (远超 delay)。时间轮已经走在真实时间前面时，新的定时器落在下一个 tick"""
+    wheel.advance(max(time.monotonic(), wheel.base + wheel.current * wheel.tick) + 100 * wheel.tick)
+
+
+def _deltas(runtime):
+    sent = [(data, room) for event, data, room in runtime.sent if event == 'room_list_delta']
+    assert all(room == LOBBY for _, room in sent)
+    return [data for data, _ in sent]
+
+
+def test_marks_are_merged_into_one_delta_per_flush(wheel):
+    runtime = FakeRuntime()
+    rooms = {'a': FakeRoom('a', '1'), 'b': FakeRoom('b', '2')}
+    lobby = Lobby(runtime, rooms, delay=0.05)
+    lobby.mark('a')
+    lobby.mark('b')
+    lobby.mark('a')
+    assert runtime.sent == [] and wheel.pending == 1
+    _fire(wheel)
+    assert _deltas(runtime) == [{'version': 1, 'base': 0, 'changes': [
+        {'op': 'add', 'id': 'a', 'room': MahjongLobby.room_entry(rooms['a'])},
+        {'op': 'add', 'id': 'b', 'room': MahjongLobby.room_entry(rooms['b'])},
+    ]}]
+    assert ('room_list_stale', {'version': 1}, LOBBY_FILTERED) in runtime.sent
+
+    rooms['a'].members = 2
+    lobby.mark('a')
+    lobby.mark('b')  # 没有变化的房间不发送
+    _fire(wheel)
+    del rooms['b']
+    lobby.mark('b')
+    _fire(wheel)
+    deltas = _deltas(runtime)
+    assert [(d['base'], d['version']) for d in deltas] == [(0, 1), (1, 2), (2, 3)]
+    assert deltas[1]['changes'] == [{'op': 'update', 'id': 'a', 'room': MahjongLobby.room_entry(rooms['a'])}]
+    assert deltas[2]['changes'] == [{'op': 'remove', 'id': 'b'}]
+    assert lobby.stats == {'changes': 4, 'deltas': 3}
+
+
+def test_unchanged_flush_keeps_version(wheel):
+    runtime = FakeRuntime()
+    rooms = {'a': FakeRoom('a', '1')}
+    lobby = Lobby(runtime, rooms, delay=0.05)
+    lobby.mark('a')
+    _fire(wheel)
+    lobby.mark('a')
+    _fire(wheel)
+    assert lobby.version == 1 and len(_deltas(runtime)) == 1
+
+
+def test_room_list_flushes_pending_changes_first(wheel):
+    runtime = FakeRuntime()
+    rooms = {'a': FakeRoom('a', '1')}
+    lobby = Lobby(runtime, rooms, delay=0.05)
+    lobby.mark('a')
+    snapshot = lobby.room_list()
+    # 快照的版本已经包含了刚才的变化，之后的增量从这个版本衔接
+    assert snapshot['version'] == 1 and snapshot['total'] == 1
+    assert _deltas(runtime)[-1]['version'] == 1
+    _fire(wheel)
+    assert wheel.pending == 0 and len(_deltas(runtime)) == 1
+
+    rooms['b'] = FakeRoom('b', '2')
+    rooms['b'].status = 'playing'
+    lobby.mark('b')
+    filtered = lobby.room_list(status='waiting')
+    assert filtered['version'] == 2 and [e['id'] for e in filtered['room_list']] == ['a']
+    assert _deltas(runtime)[-1]['base'] == 1
+
+
+def test_set_view_switches_between_delta_and_stale(wheel):
+    runtime = FakeRuntime()
+    lobby = Lobby(runtime, {}, delay=0.05)
+    lobby.enter('s1')
+    assert runtime.rooms['s1'] == {LOBBY}
+    lobby.set_view('s1', True)
+    assert runtime.rooms['s1'] == {LOBBY_FILTERED}
+    lobby.set_view('s1', False)
+    assert runtime.rooms['s1'] == {LOBBY}
+    lobby.leave('s1')
+    assert runtime.rooms['s1'] == set()
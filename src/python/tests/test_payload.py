@@ -0,0 +1,30 @@
+"""
+MahjongPayload: CachedPayload 只编码一次，帧数和字节数只在发送处用 count_frame 统计。
+"""
+import json
+
+from libs import MahjongPayload
+from libs.MahjongPayload import CachedPayload
+
+
+def test_cached_payload_is_spliced_into_output():
+    payload = CachedPayload({'rooms': ['中', 1]})
+    text = MahjongPayload.dumps(['room_list_update', {'room_list': payload, 'version': 3}], separators=(',', ':'))
+    assert json.loads(text) == ['room_list_update', {'room_list': {'rooms': ['中', 1]}, 'version': 3}]
+    assert payload._text is not None
+
+
+def test_dumps_does_not_count_frames():
+    before = dict(MahjongPayload.emit_frames.values)
+    # 确认包的数据和普通的字符串列表都不是事件帧
+    MahjongPayload.dumps(['ok'])
+    MahjongPayload.dumps(['game_action_result', {'success': True}])
+    assert MahjongPayload.emit_frames.values == before
+
+
+def test_count_frame_records_frames_and_bytes():
+    frames = MahjongPayload.emit_frames.values.get(('test_event',), 0)
+    size = MahjongPayload.emit_bytes.values.get(('test_event',), 0)
+    MahjongPayload.count_frame('test_event', '2["test_event","中"]')
+    assert MahjongPayload.emit_frames.values[('test_event',)] == frames + 1
+    assert MahjongPayload.emit_bytes.values[('test_event',)] == size + len('2["test_event","中"]'.encode('utf-8'))
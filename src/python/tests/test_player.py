@@ -0,0 +1,33 @@
+"""
+MahjongPlayer 的手牌计数数组: 出牌、整理新牌。
+"""
+import pytest
+
+from libs import Mahjong
+
+
+def test_discard_by_index_new_tile_and_fallback():
+    player = Mahjong.MahjongPlayer(0, 'test')
+    player.hands = ['3o', '1o', 'e', '2o']
+    assert player.hands == ['1o', '2o', '3o', 'e']  # 始终按牌序排列
+    assert player.discard(1) == '2o'
+    player.drawtile('5t')
+    assert player.discard(None) == '5t' and player.new == ''
+    assert player.discard(99) == 'e'  # 索引无效且没有新牌时打出最后一张
+    assert player.hands == ['1o', '3o'] and player.hand_count == 2
+    assert player.discarded == ['2o', '5t', 'e']
+
+
+def test_discard_from_empty_hand_raises():
+    player = Mahjong.MahjongPlayer(0, 'test')
+    with pytest.raises(ValueError):
+        player.discard(None)
+    assert player.discarded == [] and player.hand_count == 0
+
+
+def test_integrate_new_tile_keeps_order():
+    player = Mahjong.MahjongPlayer(0, 'test')
+    player.hands = ['9w', '1o']
+    player.drawtile('5t')
+    player.integrate_new_tile()
+    assert player.hands == ['1o', '5t', '9w'] and player.new == ''
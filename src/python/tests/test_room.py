@@ -0,0 +1,60 @@
+"""
+房间的收件箱 (MahjongRoom.post / offer / close): 关闭之后的事件被丢弃，不会重新创建收件箱和后台任务。
+"""
+from libs import MahjongRoom as mr
+
+
+class FakeMailbox:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+    def qsize(self):
+        return len([item for item in self.items if item is not None])
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.mailboxes = []
+
+    def create_mailbox(self, handler):
+        self.mailboxes.append(FakeMailbox())
+        return self.mailboxes[-1]
+
+    def emit(self, event, data=None, room=None):
+        pass
+
+    def enter_room(self, sid, room):
+        pass
+
+    def leave_room(self, sid, room):
+        pass
+
+
+def test_post_and_offer_after_close_drop_work():
+    runtime = FakeRuntime()
+    room = mr.MahjongRoom('r', None, runtime, 'owner', 'owner')
+    assert room.post(print, 'a') is True
+    assert room.offer(print, 'b') is True
+    mailbox = runtime.mailboxes[0]
+    room.close()
+    assert mailbox.items[-1] is None and room.mailbox is None
+
+    assert room.post(print, 'c') is False
+    assert room.offer(print, 'd') is False
+    assert len(runtime.mailboxes) == 1 and room.mailbox is None
+    assert mailbox.qsize() == 2
+    stats = room.get_mailbox_stats()
+    assert stats['dropped'] == 2 and stats['shed'] == 0
+
+
+def test_offer_sheds_when_queue_is_full():
+    runtime = FakeRuntime()
+    room = mr.MahjongRoom('r', None, runtime, 'owner', 'owner')
+    room.max_inbound = 2
+    assert room.offer(print, 1) and room.offer(print, 2)
+    assert room.offer(print, 3) is False
+    assert room.post(print, 4) is True  # 内部事件不受 max_inbound 限制
+    assert room.get_mailbox_stats()['shed'] == 1
@@ -0,0 +1,68 @@
+"""
+会话登记表 (MahjongSessions.SessionRegistry): 登录、进出房间和断开之后，名字、房间和状态计数的索引与会话字典一致。
+"""
+from collections import Counter
+
+from libs.MahjongSessions import SessionRegistry
+
+
+def _check(registry):
+    """由会话字典重新计算各个索引，与登记表维护的索引比较"""
+    sessions = registry.sessions
+    assert registry.names == {s['name']: sid for sid, s in sessions.items() if s['name']}
+    rooms = {}
+    for sid, s in sessions.items():
+        if s['room_id'] is not None:
+            rooms.setdefault(s['room_id'], set()).add(sid)
+    assert {room_id: set(sids) for room_id, sids in registry.rooms.items()} == rooms
+    assert all(sessions[sid]['status'] == 'in_room' for sids in rooms.values() for sid in sids)
+    counts = Counter(s['status'] for s in sessions.values())
+    assert registry.counts == {status: counts[status] for status in ('offline', 'online', 'in_room')}
+
+
+def test_indexes_stay_consistent_after_disconnect():
+    registry = SessionRegistry()
+    for sid in ('a', 'b', 'c', 'd'):
+        registry.connect(sid, '127.0.0.1')
+    assert registry.claim_name('a', 'alice') and registry.claim_name('b', 'bob') and registry.claim_name('c', 'carol')
+    assert not registry.claim_name('d', 'alice')  # 名字已被占用
+    registry.join_room('a', 'r1')
+    registry.join_room('b', 'r1')
+    registry.join_room('c', 'r2')
+    _check(registry)
+    assert registry.sids_in('r1') == ['a', 'b']
+
+    assert registry.disconnect('a')['name'] == 'alice'
+    _check(registry)
+    assert registry.sids_in('r1') == ['b'] and registry.room_of('a') is None
+    # 断开后名字释放，其他连接可以使用
+    assert registry.claim_name('d', 'alice')
+    _check(registry)
+
+    registry.disconnect('b')
+    _check(registry)
+    assert 'r1' not in registry.rooms  # 最后一个成员断开后房间的索引也删除
+
+    registry.join_room('c', 'r3')  # 换房间时离开原来的房间
+    _check(registry)
+    assert 'r2' not in registry.rooms and registry.sids_in('r3') == ['c']
+    assert registry.drop_room('r3') == ['c']
+    registry.disconnect('c')
+    registry.disconnect('c')  # 重复断开什么也不做
+    _check(registry)
+    assert registry.stats() == {'offline': 0, 'online': 1, 'in_room': 0, 'total': 1, 'rooms': 0}
+
+
+def test_rename_and_logout_release_old_name():
+    registry = SessionRegistry()
+    registry.connect('a', '127.0.0.1')
+    registry.connect('b', '127.0.0.1')
+    registry.claim_name('a', 'alice')
+    registry.claim_name('a', 'alicia')
+    assert registry.claim_name('b', 'alice')
+    registry.release_name('a')
+    _check(registry)
+    assert registry.names == {'alice': 'b'} and registry['a']['status'] == 'offline'
+    registry.disconnect('a')
+    _check(registry)
+    assert registry.names == {'alice': 'b'}
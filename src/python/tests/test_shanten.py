@@ -0,0 +1,118 @@
+"""
+向听数和有效牌 (MahjongPlayer.shanten / discard_hint) 的不变式，使用与 test_tables 相同的固定种子手牌。
+"""
+import random
+
+import pytest
+
+from libs import Mahjong
+from libs import MahjongCache
+from libs.MahjongCache import hu_cache, shanten_cache
+from test_tables import RULES, random_hand
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    hu_cache.clear()
+    shanten_cache.clear()
+    yield
+    hu_cache.clear()
+    shanten_cache.clear()
+
+
+def _gamerule(flags):
+    gamerule = dict(Mahjong.MahjongServer().gamerule)
+    gamerule.update(flags)
+    return gamerule
+
+
+def _hands(seed, count, sizes=(4, 7, 10, 13, 16)):
+    rng = random.Random(seed)
+    return [random_hand(rng, rng.choice(sizes)) for _ in range(count)]
+
+
+@pytest.mark.parametrize('flags', RULES)
+def test_tenpai_exactly_when_hand_has_waits(flags):
+    gamerule = _gamerule(flags)
+    player = Mahjong.MahjongPlayer(0, 'test')
+    names = player.tileset.names
+    removed = set(gamerule['items to remove']) - {'joker'}  # 去掉的花牌摸不到，不算有效牌
+    tenpai = 0
+    for hand in _hands(5, 600):
+        player.hands = hand
+        value, useful = player.shanten(gamerule)
+        waits = {names[i] for i in player.waiting_tiles(gamerule) if player.counts[i] < 4 and names[i] not in removed}
+        assert (value == 0) == bool(waits), hand
+        if value == 0:
+            tenpai += 1
+            assert set(useful) == waits, hand  # 听牌时有效牌就是能胡的牌
+    assert tenpai > 50
+
+
+@pytest.mark.parametrize('flags', RULES)
+def test_complete_exactly_when_can_hu(flags):
+    gamerule = _gamerule(flags)
+    player = Mahjong.MahjongPlayer(0, 'test')
+    complete = 0
+    for hand in _hands(6, 1500, sizes=(5, 8, 11, 14, 17)):
+        player.hands = hand
+        value, _ = player.shanten(gamerule)
+        assert (value == -1) == player.can_hu(None, None, gamerule), hand
+        complete += value == -1
+    assert complete > 50
+
+
+@pytest.mark.parametrize('flags', RULES)
+def test_drawing_useful_tile_lowers_shanten(flags):
+    gamerule = _gamerule(flags)
+    player = Mahjong.MahjongPlayer(0, 'test')
+    rng = random.Random(8)
+    for hand in _hands(7, 150):
+        player.hands = hand
+        value, useful = player.shanten(gamerule)
+        others = [t for t in player.tileset.names if t not in useful and t not in gamerule['items to remove'] and hand.count(t) < 4]
+        for tile in useful + rng.sample(others, min(3, len(others))):
+            after, _ = player.shanten(gamerule, tile=tile)
+            if tile in useful:
+                assert after == value - 1, (hand, tile)
+            else:
+                assert after == value, (hand, tile)
+
+
+def test_discard_hint_best_option_reaches_hand_shanten():
+    gamerule = _gamerule(RULES[0])
+    player = Mahjong.MahjongPlayer(0, 'test')
+    for hand in _hands(9, 150, sizes=(5, 8, 11, 14, 17)):
+        player.hands = hand
+        value, _ = player.shanten(gamerule)
+        options = Mahjong.discard_hint(player.tileset.sort_rule, hand, '', gamerule)
+        assert [o['shanten'] for o in options] == sorted(o['shanten'] for o in options)
+        if value >= 0 and any(t != 'joker' for t in hand):
+            assert options[0]['shanten'] == value, hand
+
+
+def test_bounded_table_memos_give_same_results():
+    gamerule = _gamerule(RULES[1])
+    player = Mahjong.MahjongPlayer(0, 'test')
+    hands = _hands(11, 100)
+    expected = []
+    for hand in hands:
+        player.hands = hand
+        expected.append((player.shanten(gamerule), player.can_hu(None, None, gamerule)))
+    tables = {name: cache for name, cache in MahjongCache.caches.items() if name.startswith('tables.')}
+    assert tables
+    sizes = {name: cache.maxsize for name, cache in tables.items()}
+    try:
+        for cache in tables.values():
+            cache.configure(maxsize=8)
+        MahjongCache.clear_all()
+        for hand, result in zip(hands, expected):
+            player.hands = hand
+            assert (player.shanten(gamerule), player.can_hu(None, None, gamerule)) == result, hand
+        assert all(len(cache) <= 8 for cache in tables.values())
+        assert sum(cache.evictions for cache in tables.values()) > 0
+        assert set(tables) <= set(MahjongCache.stats())
+    finally:
+        for name, cache in tables.items():
+            cache.configure(maxsize=sizes[name])
+        MahjongCache.clear_all()
@@ -0,0 +1,212 @@
+"""
+胡牌判定的查表实现 (MahjongTables / MahjongTiles / 缓存) 与逐张递归拆解的参考实现对照。
+
+参考实现是改写前 MahjongPlayer.can_hu 的递归检查器，只做了去掉日志的改动。
+随机手牌使用固定的种子，修改拆解表后结果不一致时这里会失败。
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from libs import Mahjong
+from libs.MahjongCache import LRUCache, hu_cache
+from libs.MahjongTiles import DEFAULT_SORT_RULE
+
+SUITED = [f'{n}{s}' for s in 'otw' for n in range(1, 10)]
+HONORS = ['e', 's', 'w', 'n', 'b', 'f', 'z']
+RULES = [
+    {'three golden win': True, 'allow seven pairs': False},
+    {'three golden win': False, 'allow seven pairs': True},
+]
+
+
+def _can_form_melds(counts, joker_count, sort_rules):
+    if not counts:
+        return True
+    tile = min(counts, key=lambda t: sort_rules.get(t, 99))
+    # 刻子，或者用金补刻子
+    if counts[tile] >= 3:
+        rest = counts.copy()
+        rest[tile] -= 3
+        if not rest[tile]:
+            del rest[tile]
+        if _can_form_melds(rest, joker_count, sort_rules):
+            return True
+    if counts[tile] in (1, 2) and joker_count >= 3 - counts[tile]:
+        rest = counts.copy()
+        del rest[tile]
+        if _can_form_melds(rest, joker_count - (3 - counts[tile]), sort_rules):
+            return True
+    # 以这张牌为最小牌的顺子，缺的牌用金补
+    value = sort_rules.get(tile)
+    if value and tile[0] not in 'eswnbfzjapoc':
+        suit = tile[-1]
+        c2 = next((t for t, v in sort_rules.items() if v == value + 1 and t[-1] == suit), None)
+        c3 = next((t for t, v in sort_rules.items() if v == value + 2 and t[-1] == suit), None)
+        if c2 and c3:
+            need = (c2 not in counts) + (c3 not in counts)
+            if joker_count >= need:
+                rest = counts.copy()
+                for t in (tile, c2, c3):
+                    if t in rest:
+                        rest[t] -= 1
+                rest = Counter({k: v for k, v in rest.items() if v > 0})
+                if _can_form_melds(rest, joker_count - need, sort_rules):
+                    return True
+    return False
+
+
+def reference_can_hu(hands, tile, gamerule, sort_rules=DEFAULT_SORT_RULE):
+    """改写前的 can_hu: 枚举将牌，其余的牌递归拆成顺子和刻子"""
+    counts = Counter(hands + ([tile] if tile else []))
+    joker_count = counts.pop('joker', 0)
+    if gamerule.get('three golden win', True) and joker_count >= 3:
+        return True
+    if gamerule.get('allow seven pairs', False):
+        holes = sum(c % 2 for c in counts.values())
+        if joker_count >= holes and (joker_count - holes) % 2 == 0:
+            return True
+    pairs = {t for t, c in counts.items() if c >= 2}
+    if joker_count > 0:
+        pairs |= {t for t, c in counts.items() if c == 1}
+    if joker_count >= 2:
+        pairs.add('joker_pair')
+    for pair in pairs:
+        rest = counts.copy()
+        jokers = joker_count
+        if pair == 'joker_pair':
+            jokers -= 2
+        elif rest[pair] == 1:
+            del rest[pair]
+            jokers -= 1
+        else:
+            rest[pair] -= 2
+            if not rest[pair]:
+                del rest[pair]
+        if _can_form_melds(rest, jokers, sort_rules):
+            return True
+    return False
+
+
+def random_hand(rng, size):
+    """多数为同一花色、常带金的手牌，胡牌和听牌的比例比完全随机高得多"""
+    suit = rng.choice('otw')
+    pool = [f'{n}{suit}' for n in range(1, 10)] * 4 + SUITED + HONORS
+    hand = ['joker'] * rng.choice((0, 0, 1, 1, 2, 3))
+    while len(hand) < size:
+        tile = rng.choice(pool)
+        if hand.count(tile) < 4:
+            hand.append(tile)
+    return hand
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    hu_cache.clear()
+    yield
+    hu_cache.clear()
+
+
+@pytest.mark.parametrize('gamerule', RULES)
+def test_can_hu_with_tile_matches_reference(gamerule):
+    rng = random.Random(20240501)
+    player = Mahjong.MahjongPlayer(0, 'test')
+    wins = 0
+    for _ in range(1500):
+        hand = random_hand(rng, rng.choice((4, 7, 10, 13, 16)))
+        player.hands = hand
+        for tile in rng.sample(SUITED + HONORS + ['joker'], 6):
+            expected = reference_can_hu(hand, tile, gamerule)
+            assert player.can_hu(tile, None, gamerule) == expected, (hand, tile)
+            wins += expected
+    assert wins > 100  # 生成的手牌确实覆盖了能胡的情况
+
+
+@pytest.mark.parametrize('gamerule', RULES)
+def test_can_hu_complete_hand_matches_reference(gamerule):
+    rng = random.Random(7)
+    player = Mahjong.MahjongPlayer(0, 'test')
+    wins = 0
+    for _ in range(3000):
+        hand = random_hand(rng, rng.choice((5, 8, 11, 14, 17)))
+        player.hands = hand
+        expected = reference_can_hu(hand, None, gamerule)
+        assert player.can_hu(None, None, gamerule) == expected, hand
+        wins += expected
+    assert wins > 50
+
+
+def test_waiting_tiles_match_reference():
+    rng = random.Random(11)
+    gamerule = RULES[0]
+    player = Mahjong.MahjongPlayer(0, 'test')
+    names = player.tileset.names
+    for _ in range(300):
+        hand = random_hand(rng, 16)
+        player.hands = hand
+        expected = {i for i, tile in enumerate(names) if reference_can_hu(hand, tile, gamerule)}
+        assert set(player.waiting_tiles(gamerule)) == expected, hand
+
+
+def test_results_do_not_depend_on_cache():
+    rng = random.Random(3)
+    gamerule = RULES[0]
+    player = Mahjong.MahjongPlayer(0, 'test')
+    hands = [random_hand(rng, 16) for _ in range(200)]
+    tiles = [rng.choice(SUITED) for _ in hands]
+    size = hu_cache.maxsize
+    hu_cache.configure(maxsize=0)
+    try:
+        uncached = []
+        for hand, tile in zip(hands, tiles):
+            player.hands = hand
+            uncached.append(player.can_hu(tile, None, gamerule))
+    finally:
+        hu_cache.configure(maxsize=size)
+    for _ in range(2):  # 第二遍全部命中缓存
+        for hand, tile, expected in zip(hands, tiles, uncached):
+            player.hands = hand
+            assert player.can_hu(tile, None, gamerule) == expected
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, policy='lru')
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # a 变成最近使用
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.evictions == 1
+
+
+def test_fifo_evicts_oldest_write():
+    cache = LRUCache(maxsize=2, policy='fifo')
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 命中不改变顺序
+    cache.put('c', 3)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2 and cache.get('c') == 3
+    assert cache.evictions == 1
+
+
+@pytest.mark.parametrize('policy', LRUCache.POLICIES)
+def test_cache_resize_and_disable(policy):
+    cache = LRUCache(maxsize=4, policy=policy)
+    for i in range(4):
+        cache.put(i, i)
+    cache.configure(maxsize=1)
+    assert len(cache) == 1 and cache.get(3) == 3
+    assert cache.evictions == 3
+    cache.configure(maxsize=0)
+    cache.put('x', 1)
+    assert len(cache) == 0 and cache.get('x') is None
+    stats = cache.stats()
+    assert stats['policy'] == policy and stats['hits'] == 1 and stats['misses'] == 1
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        LRUCache(policy='random')
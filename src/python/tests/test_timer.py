@@ -0,0 +1,70 @@
+"""
+哈希时间轮 (MahjongTimer.TimerWheel): call_later / cancel / advance，包括超过一圈的延迟。
+
+用 advance 传入的时间推进，不启动后台任务；截止时间按 call_later 时的 time.monotonic() 计算。
+"""
+import time
+
+from libs.MahjongTimer import TimerWheel
+
+
+def _at(wheel, seconds):
+    """从时间轮的起点算起 seconds 秒的时刻"""
+    return wheel.base + seconds
+
+
+def test_call_later_fires_after_delay():
+    wheel = TimerWheel(tick=0.01, slots=8)
+    fired = []
+    start = time.monotonic() - wheel.base
+    wheel.call_later(0.05, fired.append, 'a')
+    wheel.call_later(0.02, fired.append, 'b')
+    assert wheel.pending == 2
+    wheel.advance(_at(wheel, start))
+    assert fired == []
+    wheel.advance(_at(wheel, start + 0.035))
+    assert fired == ['b']
+    wheel.advance(_at(wheel, start + 0.07))
+    assert fired == ['b', 'a']
+    assert wheel.stats()['pending'] == 0 and wheel.stats()['fired'] == 2
+
+
+def test_delay_longer_than_one_rotation():
+    wheel = TimerWheel(tick=0.01, slots=8)  # 一圈 0.08 秒
+    fired = []
+    start = time.monotonic() - wheel.base
+    timer = wheel.call_later(0.25, fired.append, 'late')
+    assert timer.rounds == 3
+    # 经过同一个槽的前几圈都不触发
+    for lap in range(1, 4):
+        wheel.advance(_at(wheel, start + lap * 0.08 - 0.005))
+        assert fired == [] and wheel.pending == 1
+    wheel.advance(_at(wheel, start + 0.26))
+    assert fired == ['late'] and timer.fired and wheel.pending == 0
+
+
+def test_cancel_before_and_after_firing():
+    wheel = TimerWheel(tick=0.01, slots=8)
+    fired = []
+    start = time.monotonic() - wheel.base
+    cancelled = wheel.call_later(0.03, fired.append, 'cancelled')
+    kept = wheel.call_later(0.03, fired.append, 'kept')
+    cancelled.cancel()
+    assert wheel.pending == 1
+    wheel.advance(_at(wheel, start + 0.05))
+    assert fired == ['kept']
+    # 已经触发或已经取消的定时器再取消什么也不做，计数不变
+    kept.cancel()
+    cancelled.cancel()
+    assert not kept.cancelled and kept.fired
+    assert wheel.stats()['pending'] == 0 and wheel.stats()['cancelled'] == 1 and wheel.stats()['fired'] == 1
+
+
+def test_callback_error_does_not_stop_other_timers():
+    wheel = TimerWheel(tick=0.01, slots=8)
+    fired = []
+    start = time.monotonic() - wheel.base
+    wheel.call_later(0.01, lambda: 1 / 0)
+    wheel.call_later(0.01, fired.append, 'ok')
+    wheel.advance(_at(wheel, start + 0.03))
+    assert fired == ['ok'] and wheel.pending == 0
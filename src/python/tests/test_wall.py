@@ -0,0 +1,28 @@
+"""
+牌墙 (MahjongTiles.Wall): 前后两个游标摸牌，相遇后牌墙为空。
+"""
+from libs.MahjongTiles import Wall
+
+
+def test_front_and_back_draws_meet():
+    wall = Wall(list('abcdef'))
+    assert wall.deal(2) == ['a', 'b']
+    assert wall.draw_back() == 'f'
+    assert wall.draw() == 'c'
+    assert len(wall) == 2 and list(wall) == ['d', 'e'] and wall[-1] == 'e' and wall[:1] == ['d']
+    assert wall.draw_back() == 'e'
+    assert wall.draw() == 'd'
+    # 游标相遇后两头都摸不到牌，也不会越过对方
+    assert len(wall) == 0 and list(wall) == []
+    assert wall.draw() is None and wall.draw_back() is None
+    assert wall.deal(3) == []
+    assert wall.front == wall.back == 4
+    assert wall.tiles == list('abcdef')  # 摸牌只移动游标
+
+
+def test_deal_stops_at_back_cursor():
+    wall = Wall(list('abcde'))
+    wall.draw_back()
+    wall.draw_back()
+    assert wall.deal(5) == ['a', 'b', 'c']
+    assert len(wall) == 0 and wall.draw_back() is None
@@ -16,3 +16,10 @@ export const socket = io(URL, {
 })
 
 // 不监听连接成功事件
+
+// 房间把一次动作产生的多条消息合并成一帧 (batch) 发送，按顺序分发给各事件的监听函数
+socket.on('batch', (frame) => {
+  for (const [event, data] of frame.messages) {
+    for (const listener of socket.listeners(event)) listener(data)
+  }
+})
@@ -0,0 +1,29 @@
+// 游戏状态增量，格式与 src/python/libs/MahjongDelta.py 相同:
+//   ['=', 值] 整体替换 | ['+', [元素...]] 列表追加 | ['-'] 删除键 | {键: 增量} 逐项修改
+// 修改过的字典和列表都会换成新的对象，方便 Vue 检测到变化。
+
+export type StateMessage = {
+  version: number
+  base: number
+  state?: any
+  delta?: any
+}
+
+export function applyDelta(value: any, delta: any): any {
+  if (Array.isArray(delta)) {
+    if (delta[0] === '=') return delta[1]
+    if (delta[0] === '+') return value.concat(delta[1])
+    throw new Error('Unknown delta op: ' + delta[0])
+  }
+  const result = Array.isArray(value) ? [...value] : { ...value }
+  for (const key of Object.keys(delta)) {
+    const change = delta[key]
+    const index: any = Array.isArray(result) ? Number(key) : key
+    if (Array.isArray(change) && change[0] === '-') {
+      delete result[index]
+    } else {
+      result[index] = applyDelta(result[index], change)
+    }
+  }
+  return result
+}
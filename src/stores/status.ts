@@ -1,5 +1,6 @@
 import { defineStore } from 'pinia'
 import { computed, ref } from 'vue'
+import { applyDelta, type StateMessage } from './delta'
 
 type membersType = {
   [sid: string]: {
@@ -66,7 +67,14 @@ export const statusStore = defineStore('status', () => {
     discarded: [],
     actions: {},
   })
+  // 服务器按版本号发送状态增量，这里保存应用增量用的完整状态
+  const rawState: { [part: string]: { version: number; state: any } | null } = {
+    public: null,
+    private: null,
+  }
   const roomlist = ref<roomType[]>([]) // 对象的列表
+  let roomlistVersion: number | undefined = undefined // 房间列表的版本号，用于衔接 room_list_delta
+  const roomListFilters = ref<{ [key: string]: any }>({}) // 请求房间列表 (get_rooms) 时的过滤和分页条件
   const roomid = ref('') // 房间号
   const now = computed(() => {
     return connected.value
@@ -122,6 +130,7 @@ export const statusStore = defineStore('status', () => {
     myid.value = 0
     members.value = {}
     roomlist.value = [] // 清空房间列表
+    roomlistVersion = undefined
     isRoom.value = false
     isGaming.value = false
     reSetGameInfo()
@@ -138,8 +147,25 @@ export const statusStore = defineStore('status', () => {
     myid.value = 0
     reSetGameInfo()
   }
-  function updateRoomList(data: any) {
+  function updateRoomList(data: any, version?: number) {
     roomlist.value = data
+    roomlistVersion = version
+  }
+  // 应用大厅房间列表的增量，返回 false 表示版本对不上，需要重新请求房间列表 (get_rooms)
+  function applyRoomListDelta(data: any): boolean {
+    if (roomlistVersion === undefined || roomlistVersion !== data.base) return false
+    const rooms = new Map(roomlist.value.map((room) => [room.id, room]))
+    for (const change of data.changes) {
+      if (change.op === 'remove') rooms.delete(change.id)
+      else rooms.set(change.id, change.room)
+    }
+    roomlist.value = [...rooms.values()]
+    roomlistVersion = data.version
+    return true
+  }
+  // 收到 room_list_stale 时判断手上的列表是否已经是该版本
+  function isRoomListCurrent(version: number): boolean {
+    return roomlistVersion !== undefined && roomlistVersion >= version
   }
   function getMembers(sid = ''): object {
     const allMembers = { ...members.value } // 创建一个副本，防止原数据被 Delete
@@ -164,6 +190,8 @@ export const statusStore = defineStore('status', () => {
     console.log('setTyping', status)
   }
   function reSetGameInfo() {
+    rawState.public = null
+    rawState.private = null
     gameinfo.value = {
       init: false,
       id: 0,
@@ -179,8 +207,20 @@ export const statusStore = defineStore('status', () => {
   function reSetActions() {
     gameinfo.value.actions = {}
   }
-  function updateGameState(newState: any, isPublic: boolean) {
-    if (now.value !== 'gaming') return
+  // 返回 false 表示增量与本地版本对不上，需要向服务器请求快照 (sync_game_state)
+  function updateGameState(message: StateMessage, isPublic: boolean): boolean {
+    if (now.value !== 'gaming') return true
+    const part = isPublic ? 'public' : 'private'
+    const current = rawState[part]
+    let newState
+    if (message.state !== undefined) {
+      newState = message.state
+    } else if (current && current.version === message.base) {
+      newState = applyDelta(current.state, message.delta)
+    } else {
+      return false
+    }
+    rawState[part] = { version: message.version, state: newState }
     if (isPublic) {
       players.value = newState.players
       if (gameinfo.value.init === false) {
@@ -196,6 +236,7 @@ export const statusStore = defineStore('status', () => {
       gameinfo.value.discarded = newState.discarded
       gameinfo.value.actions = newState.actions
     }
+    return true
   }
 
   function getGameInfo() {
@@ -207,6 +248,7 @@ export const statusStore = defineStore('status', () => {
     username,
     mysid,
     roomlist,
+    roomListFilters,
     roomid,
     members,
     players,
@@ -217,6 +259,8 @@ export const statusStore = defineStore('status', () => {
     sucLogin,
     logout,
     updateRoomList,
+    applyRoomListDelta,
+    isRoomListCurrent,
     updateGameState,
     joinRoom,
     leaveRoom,
@@ -120,7 +120,7 @@ export const tilesmapStore = defineStore('tilemap', () => {
       return tiles.map((tile) => getTileFont(tile))
     } else return []
   }
-  function getActionsName(actions: ActionsType) {
+  function getActionsName(actions: ActionsType, claimWindow = false) {
     // {
     //   hu: true
     //   kong: true
@@ -143,12 +143,15 @@ export const tilesmapStore = defineStore('tilemap', () => {
           actionsname.push(`吃${getTileFont(choice[0])}${getTileFont(choice[1])}`) // choice is [tile,tile
         }
       }
+      if (claimWindow && actionsname.length) {
+        actionsname.push('过') // 别人出牌后的宣告窗口才能过，所有人表态后服务器立即结算，不必等待
+      }
     } else {
       return []
     }
     return actionsname
   }
-  function getActionData(actions: ActionsType) {
+  function getActionData(actions: ActionsType, claimWindow = false) {
     const actionsdata = []
     if (actions.hu) {
       actionsdata.push(true)
@@ -164,6 +167,9 @@ export const tilesmapStore = defineStore('tilemap', () => {
         actionsdata.push(choice)
       }
     }
+    if (claimWindow && actionsdata.length) {
+      actionsdata.push(true) // 过
+    }
     console.log('getActionData', actions, actionsdata)
     return actionsdata
   }